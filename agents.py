@@ -0,0 +1,201 @@
+import time
+from typing import Dict, List, Optional, Tuple, Union
+from autogen import ConversableAgent, UserProxyAgent, Agent
+from events import emit_event, a_emit_event
+from metrics import get_metrics, current_stage, instrument_tool, usage_tokens
+
+
+def _agent_events(sender: Agent, recipient: Agent, message: Union[Dict, str]) -> List[Tuple[str, str]]:
+    """(author, content) of the UI messages shown when sender sends message to recipient"""
+    content = message if isinstance(message,str) else message.get("content")
+
+    events = [(sender.name, f'*Sending message from `{sender.name}` to `{recipient.name}`:*\n\n{content}')]
+
+    if isinstance(message,Dict) and message.get("tool_calls",""):
+        events.append((sender.name, f"***** Suggested tool call: {message['tool_calls'][0]['function']['name']} *****"))
+    return events
+
+
+class InstrumentedAgentMixin:
+    """
+    Charges an agent's LLM time, tokens and tool time to the run metrics.
+
+    The stage is taken when the agent is created, since AG2 runs async LLM calls in an
+    executor thread that doesn't see the caller's context.
+    """
+
+    def __init__(self, *args, functions=None, **kwargs):
+        self._metrics = get_metrics()
+        self._metrics_stage = current_stage()
+        name = kwargs.get("name", args[0] if args else None)
+        if functions is not None:
+            kwargs["functions"] = [instrument_tool(f, name, self._metrics, self._metrics_stage)
+                                   for f in (functions if isinstance(functions, list) else [functions])]
+        super().__init__(*args, **kwargs)
+
+    def _charged_llm_call(self, llm_client, call):
+        """Run call(), an LLM request through llm_client, charging its time and tokens to the agent"""
+        if self._metrics is None:
+            return call()
+
+        prompt_before, completion_before = usage_tokens(llm_client.actual_usage_summary)
+        start = time.perf_counter()
+        try:
+            return call()
+        finally:
+            prompt_after, completion_after = usage_tokens(llm_client.actual_usage_summary)
+            self._metrics.record_llm(self._metrics_stage, self.name, time.perf_counter() - start,
+                                     prompt_after - prompt_before, completion_after - completion_before)
+
+    def _generate_oai_reply_from_client(self, llm_client, messages, cache):
+        parent = super(InstrumentedAgentMixin, self)
+        return self._charged_llm_call(
+            llm_client, lambda: parent._generate_oai_reply_from_client(llm_client, messages, cache)
+        )
+
+
+class ChainlitAssistantAgent(InstrumentedAgentMixin, ConversableAgent):
+    """
+    Wrapper for AutoGens Assistant Agent
+    """
+    def generate_oai_replies(self, messages: List[Dict], n: int) -> List[Union[str, Dict]]:
+        """
+        Sample n alternative LLM replies to messages in a single request (the `n` API parameter).
+
+        Replies are normalized like AG2's own LLM reply, first choice first. Endpoints that
+        ignore `n` return a single reply.
+        """
+        all_messages = []
+        for message in self._oai_system_message + messages:
+            tool_responses = message.get("tool_responses", [])
+            if tool_responses:
+                all_messages += tool_responses
+                if message.get("role") != "tool":
+                    all_messages.append({key: message[key] for key in message if key != "tool_responses"})
+            else:
+                all_messages.append(message)
+
+        response = self._charged_llm_call(
+            self.client, lambda: self.client.create(messages=all_messages, n=n, cache=self.client_cache, agent=self)
+        )
+
+        replies = []
+        for reply in self.client.extract_text_or_completion_object(response):
+            if reply is None:
+                continue
+            if not isinstance(reply, str) and hasattr(reply, "model_dump"):
+                reply = reply.model_dump()
+            if isinstance(reply, dict):
+                for tool_call in reply.get("tool_calls") or []:
+                    tool_call["function"]["name"] = self._normalize_name(tool_call["function"]["name"])
+                    for key in ("id", "type"):
+                        if tool_call.get(key) is None:
+                            tool_call.pop(key, None)
+            replies.append(reply)
+        return replies
+
+    def send(
+        self,
+        message: Union[Dict, str],
+        recipient: Agent,
+        request_reply: Optional[bool] = None,
+        silent: Optional[bool] = False,
+    ) -> bool:
+        
+        for author, content in _agent_events(self, recipient, message):
+            emit_event(author, content)
+
+        super(ChainlitAssistantAgent, self).send(
+            message=message,
+            recipient=recipient,
+            request_reply=request_reply,
+            silent=silent,
+        )
+
+    async def a_send(
+        self,
+        message: Union[Dict, str],
+        recipient: Agent,
+        request_reply: Optional[bool] = None,
+        silent: Optional[bool] = False,
+    ) -> bool:
+        """Async send used by the async stages: UI messages are queued without blocking the event loop"""
+        for author, content in _agent_events(self, recipient, message):
+            await a_emit_event(author, content)
+
+        await super(ChainlitAssistantAgent, self).a_send(
+            message=message,
+            recipient=recipient,
+            request_reply=request_reply,
+            silent=silent,
+        )
+
+# async def ask_helper(func, **kwargs):
+#     res = await func(**kwargs).send()
+#     while not res:
+#         res = await func(**kwargs).send()
+#     return res
+
+class ChainlitUserProxyAgent(InstrumentedAgentMixin, UserProxyAgent):
+    """
+    Wrapper for AutoGens Assistant Agent
+    """
+    # def get_human_input(self, prompt: str) -> str:
+    #     if prompt.startswith(
+    #         "Provide feedback to chat_manager. Press enter to skip and use auto-reply"
+    #     ):
+    #         res = cl.run_sync(
+    #             ask_helper(
+    #                 cl.AskActionMessage,
+    #                 content="Continue or provide feedback?",
+    #                 actions=[
+    #                     cl.Action( name="continue", value="continue", label="✅ Continue" ),
+    #                     cl.Action( name="feedback",value="feedback", label="💬 Provide feedback"),
+    #                     cl.Action( name="exit",value="exit", label="🔚 Exit Conversation" )
+    #                 ],
+    #             )
+    #         )
+    #         if res.get("value") == "continue":
+    #             return ""
+    #         if res.get("value") == "exit":
+    #             return "exit"
+
+    #     reply = cl.run_sync(ask_helper(cl.AskUserMessage, content=prompt, timeout=60))
+
+    #     return reply["output"].strip()
+    
+    def send(
+        self,
+        message: Union[Dict, str],
+        recipient: Agent,
+        request_reply: Optional[bool] = None,
+        silent: Optional[bool] = False,
+    ) -> bool:
+        
+        for author, content in _agent_events(self, recipient, message):
+            emit_event(author, content)
+
+        super(ChainlitUserProxyAgent, self).send(
+            message=message,
+            recipient=recipient,
+            request_reply=request_reply,
+            silent=silent,
+        )
+
+    async def a_send(
+        self,
+        message: Union[Dict, str],
+        recipient: Agent,
+        request_reply: Optional[bool] = None,
+        silent: Optional[bool] = False,
+    ) -> bool:
+        """Async send used by the async stages: UI messages are queued without blocking the event loop"""
+        for author, content in _agent_events(self, recipient, message):
+            await a_emit_event(author, content)
+
+        await super(ChainlitUserProxyAgent, self).a_send(
+            message=message,
+            recipient=recipient,
+            request_reply=request_reply,
+            silent=silent,
+        )
@@ -0,0 +1,155 @@
+import copy
+import inspect
+from typing import Any, Optional, Union
+
+import autogen
+from autogen import Agent, AfterWorkOption, ConversableAgent, GroupChat, SwarmResult
+from autogen.agentchat.contrib import swarm_agent
+
+# Private AG2 swarm helpers a_initiate_swarm_chat calls, with the parameters it passes. They can
+# change in any autogen release (pinned in pyproject.toml), so a mismatch fails at import
+_SWARM_HELPERS = {
+    "_prepare_swarm_agents": ["initial_agent", "agents", "context_variables", "exclude_transit_message"],
+    "_process_initial_messages": ["messages", "user_agent", "agents", "nested_chat_agents"],
+    "create_swarm_transition": ["initial_agent", "tool_execution", "swarm_agent_names", "user_agent", "swarm_after_work"],
+    "_create_swarm_manager": ["groupchat", "swarm_manager_args", "agents"],
+    "_setup_context_variables": ["tool_execution", "agents", "manager", "context_variables"],
+    "_cleanup_temp_user_messages": ["chat_result"],
+}
+
+
+def _check_swarm_helpers() -> None:
+    changed = []
+    for name, params in _SWARM_HELPERS.items():
+        helper = getattr(swarm_agent, name, None)
+        if not callable(helper):
+            changed.append(f"{name} is missing")
+        elif list(inspect.signature(helper).parameters) != params:
+            changed.append(f"{name}{inspect.signature(helper)} doesn't take ({', '.join(params)})")
+    if changed:
+        raise ImportError(f"async_swarm doesn't support autogen {autogen.__version__}: {'; '.join(changed)}. "
+                          f"Install the version pinned in pyproject.toml or port a_initiate_swarm_chat.")
+
+
+_check_swarm_helpers()
+
+
+async def _a_generate_swarm_tool_reply(
+    agent: ConversableAgent,
+    messages: Optional[list[dict[str, Any]]] = None,
+    sender: Optional[Agent] = None,
+    config: Optional[Any] = None,
+) -> tuple[bool, Optional[dict[str, Any]]]:
+    """
+    Async counterpart of AG2's swarm tool executor reply.
+
+    AG2 0.8.5 executes swarm tools through a sync reply even inside `a_initiate_swarm_chat`,
+    which cannot await coroutine tools on a running loop. This reply awaits them instead and
+    applies SwarmResult context/agent updates the same way.
+    """
+    if messages is None:
+        messages = agent._oai_messages[sender]
+
+    message = messages[-1]
+    if "tool_calls" not in message:
+        return False, None
+
+    next_agent = None
+    tool_responses_inner = []
+    contents = []
+    tool_message = None
+    for tool_call in message["tool_calls"]:
+        # Execute one tool at a time so context updates are visible to the next call
+        message_copy = copy.deepcopy(message)
+        message_copy["tool_calls"] = [tool_call]
+
+        _, tool_message = await agent.a_generate_tool_calls_reply([message_copy])
+        if tool_message is None:
+            raise ValueError("Tool call did not return a message")
+
+        for tool_response in tool_message["tool_responses"]:
+            content = tool_response.get("content")
+
+            if isinstance(content, SwarmResult):
+                if content.context_variables != {}:
+                    agent._context_variables.update(content.context_variables)
+                if content.agent is not None:
+                    next_agent = content.agent
+            elif isinstance(content, Agent):
+                next_agent = content
+
+            if content is not None:
+                tool_response["content"] = str(content)
+
+            tool_responses_inner.append(tool_response)
+            contents.append(str(tool_response["content"]))
+
+    agent._swarm_next_agent = next_agent
+
+    tool_message["tool_responses"] = tool_responses_inner
+    tool_message["content"] = "\n".join(contents)
+    return True, tool_message
+
+
+async def a_initiate_swarm_chat(
+    initial_agent: ConversableAgent,
+    messages: Union[list[dict[str, Any]], str],
+    agents: list[ConversableAgent],
+    max_rounds: int = 20,
+    context_variables: Optional[dict[str, Any]] = None,
+    after_work: Any = AfterWorkOption.TERMINATE,
+    exclude_transit_message: bool = True,
+):
+    """
+    Run a swarm chat natively on the event loop.
+
+    Same arguments and return value as `autogen.initiate_swarm_chat`, but LLM calls, agent
+    sends and coroutine tools are all awaited instead of blocking a worker thread.
+    """
+    context_variables = context_variables or {}
+    tool_execution, nested_chat_agents = swarm_agent._prepare_swarm_agents(
+        initial_agent, agents, context_variables, exclude_transit_message
+    )
+    tool_execution.register_reply([Agent, None], _a_generate_swarm_tool_reply)
+
+    processed_messages, last_agent, swarm_agent_names, temp_user_list = swarm_agent._process_initial_messages(
+        messages, None, agents, nested_chat_agents
+    )
+
+    swarm_transition = swarm_agent.create_swarm_transition(
+        initial_agent=initial_agent,
+        tool_execution=tool_execution,
+        swarm_agent_names=swarm_agent_names,
+        user_agent=None,
+        swarm_after_work=after_work,
+    )
+
+    groupchat = GroupChat(
+        agents=[tool_execution] + agents + nested_chat_agents + temp_user_list,
+        messages=[],
+        max_round=max_rounds,
+        speaker_selection_method=swarm_transition,
+    )
+
+    manager = swarm_agent._create_swarm_manager(groupchat, None, agents)
+    swarm_agent._setup_context_variables(tool_execution, agents, manager, context_variables)
+
+    if len(processed_messages) > 1:
+        last_agent, last_message = await manager.a_resume(messages=processed_messages)
+        clear_history = False
+    else:
+        last_message = processed_messages[0]
+        clear_history = True
+
+    if last_agent is None:
+        raise ValueError("No agent selected to start the conversation")
+
+    chat_result = await last_agent.a_initiate_chat(
+        manager,
+        message=last_message,
+        clear_history=clear_history,
+    )
+
+    swarm_agent._cleanup_temp_user_messages(chat_result)
+
+    return chat_result, context_variables if context_variables != {} else None, manager.last_speaker
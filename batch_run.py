@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from dataset import ProblemInfo, get_dataset_index
+from events import EVENT_BACKENDS
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Run the RTL generation pipeline for many problems in parallel')
+    parser.add_argument('problems', nargs='*',
+                        help='Problem IDs or glob patterns (e.g. "Prob00*"); defaults to every problem in the dataset')
+    parser.add_argument('--problem-list', help='File with one problem ID or glob pattern per line')
+    parser.add_argument('--dataset-dir', default='./verilog-eval-v2', help='Directory holding the dataset problems')
+    kind = parser.add_mutually_exclusive_group()
+    kind.add_argument('--sequential', action='store_true', help='Only problems with clocked logic')
+    kind.add_argument('--combinational', action='store_true', help='Only purely combinational problems')
+    parser.add_argument('--max-spec-chars', type=int, help='Only problems whose spec has at most this many characters')
+    parser.add_argument('--order', choices=['largest', 'given'], default='largest',
+                        help='Start the largest problems first (by baseline sim time or spec/testbench size) or keep the given order')
+    parser.add_argument('--jobs', type=int, default=min(8, os.cpu_count() or 1),
+                        help='Maximum number of problems to run at once')
+    parser.add_argument('--start-from', choices=['spec2plan', 'plan2graph', 'graph2tasks', 'generate_rtl', 'verify_rtl'],
+                        help='Start every pipeline from the specified checkpoint stage')
+    parser.add_argument('--events', choices=EVENT_BACKENDS, default='none',
+                        help='Where agent/tool messages go: dropped (none) or work/<id>/events.jsonl (jsonl)')
+    parser.add_argument('--summary', default='./checkpoints/batch_summary.md',
+                        help='Path of the pass/fail summary table')
+    return parser.parse_args()
+
+
+def select_problems(patterns, dataset_dir):
+    """Expand problem IDs and glob patterns against the dataset, keeping the given order"""
+    return get_dataset_index(dataset_dir).select(patterns)
+
+
+def run_problem(problem: ProblemInfo, start_from=None, events='none'):
+    """
+    Run the full pipeline for one dataset problem inside a pool worker.
+
+    The pipeline output is redirected to work/<id>/run.log so parallel runs don't interleave on the console.
+    Agent/tool messages go to the given headless event backend.
+
+    Returns:
+        dict with the problem ID, status (pass/fail/error) and wall time in seconds
+    """
+    from main import run_pipeline
+    from events import make_event_backend, use_event_backend
+
+    problem_id = problem.problem_id
+    work_dir = f"./work/{problem_id}"
+    os.makedirs(work_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    status, error = 'error', ''
+    with open(os.path.join(work_dir, 'run.log'), 'w') as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log), \
+            use_event_backend(make_event_backend(events, os.path.join(work_dir, 'events.jsonl'))):
+        try:
+            is_pass = run_pipeline(
+                problem_id,
+                spec_file=problem.prompt_path,
+                testbench_file=problem.test_path,
+                reference_file=problem.ref_path,
+                start_from=start_from,
+                use_dataset_tb=True
+            )
+            if is_pass is not None:
+                status = 'pass' if is_pass else 'fail'
+        except Exception as e:
+            traceback.print_exc()
+            error = f"{type(e).__name__}: {e}"
+
+    return {
+        'problem_id': problem_id,
+        'status': status,
+        'wall_time': time.perf_counter() - start,
+        'error': error
+    }
+
+
+def format_summary(results, total_time):
+    """Format the batch results as a markdown table"""
+    lines = [
+        "| Problem | Status | Wall time (s) | Error |",
+        "|---|---|---|---|"
+    ]
+    for r in sorted(results, key=lambda r: r['problem_id']):
+        lines.append(f"| {r['problem_id']} | {r['status']} | {r['wall_time']:.1f} | {r['error']} |")
+
+    passed = sum(r['status'] == 'pass' for r in results)
+    lines.append("")
+    lines.append(f"Passed {passed}/{len(results)} problems in {total_time:.1f} s")
+    return "\n".join(lines)
+
+
+def run_batch(problem_ids, dataset_dir, jobs, start_from=None, events='none'):
+    """Run the pipeline for every problem in a bounded process pool, submitted in the given order"""
+    index = get_dataset_index(dataset_dir)
+    results = []
+    # A fresh worker per problem keeps agent, tool and module state from leaking between runs
+    with ProcessPoolExecutor(max_workers=jobs, max_tasks_per_child=1) as pool:
+        futures = {pool.submit(run_problem, index.get(pid), start_from, events): pid for pid in problem_ids}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'problem_id': futures[future], 'status': 'error', 'wall_time': 0.0,
+                          'error': f"{type(e).__name__}: {e}"}
+            results.append(result)
+            print(f"[{len(results)}/{len(problem_ids)}] {result['problem_id']}: {result['status']} "
+                  f"({result['wall_time']:.1f} s)")
+    return results
+
+
+def main():
+    args = parse_arguments()
+
+    patterns = list(args.problems)
+    if args.problem_list:
+        with open(args.problem_list, 'r') as f:
+            patterns += [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+    index = get_dataset_index(args.dataset_dir)
+    sequential = True if args.sequential else False if args.combinational else None
+    problem_ids = index.filter(index.select(patterns), sequential, args.max_spec_chars)
+    if args.order == 'largest':
+        problem_ids = index.largest_first(problem_ids)
+    if not problem_ids:
+        print("Error: No problems selected")
+        return 1
+
+    print(f"Running {len(problem_ids)} problems with {args.jobs} workers...")
+    start = time.perf_counter()
+    results = run_batch(problem_ids, args.dataset_dir, args.jobs, args.start_from, args.events)
+    summary = format_summary(results, time.perf_counter() - start)
+
+    os.makedirs(os.path.dirname(args.summary) or '.', exist_ok=True)
+    with open(args.summary, 'w') as f:
+        f.write(summary + "\n")
+
+    print()
+    print(summary)
+    print(f"Summary written to: {args.summary}")
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
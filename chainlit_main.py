@@ -1,81 +1,47 @@
-from spec2plan import spec2plan
-from plan2graph import plan2graph
-from graph2tasks import graph2tasks
-from tasks2rtl import generate_rtl
-from verify_rtl import verify_rtl
-from utils import equally_formatted, load_checkpoint, save_checkpoint, ensure_checkpoint_dir
+from spec2plan import a_spec2plan
+from plan2graph import a_plan2graph
+from graph2tasks import a_graph2tasks
+from tasks2rtl import a_generate_rtl
+from verify_rtl import a_verify_rtl
+from events import ChainlitBackend, a_flush_events
+from metrics import collect_metrics
+from incremental import stage_inputs_hash, stage_is_current, record_stage_hash
+from utils import VerilogKnowledgeGraph, equally_formatted, load_checkpoint, save_checkpoint, ensure_checkpoint_dir
+from graph_render import graph_image_name, render_in_background
+from dataset import get_dataset_index
 import chainlit as cl
+import asyncio
 import json
 import os
 
+# Problems offered as starters, with an optional label; STARTER_PROBLEMS (comma-separated IDs or globs) replaces them
+STARTERS = {
+    'Prob115_shift18': None,
+    'Prob118_history_shift': None,
+    'Prob129_ece241_2013_q8': None,
+    'Prob139_2013_q2bfsm': None,
+    'Prob141_count_clock': None,
+    'Prob144_conwaylife': None,
+    'Prob148_2013_q2afsm': None,
+    'Prob149_ece241_2013_q4': None,
+    'Prob151_review2015_fsm': None,
+    'Prob153_gshare': None,
+    'Prob154_fsm_ps2data': None,
+    'Prob155_lemmings4': None,
+    'Prob005_notgate': 'not gate',
+    'Prob022_mux2to1': 'mux 2to1',
+    'Prob087_gates': 'combinational gates',
+    'Prob132_always_if2': 'debug code',
+}
+
+
 @cl.set_starters
 async def set_starters():
-    return [
-        cl.Starter(
-            label="Prob115_shift18",
-            message="PROB_ID=Prob115_shift18",
-        ),
-        cl.Starter(
-            label="Prob118_history_shift",
-            message="PROB_ID=Prob118_history_shift",
-        ),
-        cl.Starter(
-            label="Prob129_ece241_2013_q8",
-            message="PROB_ID=Prob129_ece241_2013_q8",
-        ),
-        cl.Starter(
-            label="Prob139_2013_q2bfsm",
-            message="PROB_ID=Prob139_2013_q2bfsm",
-        ),
-        cl.Starter(
-            label="Prob141_count_clock",
-            message="PROB_ID=Prob141_count_clock",
-        ),
-        cl.Starter(
-            label="Prob144_conwaylife",
-            message="PROB_ID=Prob144_conwaylife",
-        ),
-        cl.Starter(
-            label="Prob148_2013_q2afsm",
-            message="PROB_ID=Prob148_2013_q2afsm",
-        ),
-        cl.Starter(
-            label="Prob149_ece241_2013_q4",
-            message="PROB_ID=Prob149_ece241_2013_q4",
-        ),
-        cl.Starter(
-            label="Prob151_review2015_fsm",
-            message="PROB_ID=Prob151_review2015_fsm",
-        ),
-        cl.Starter(
-            label="Prob153_gshare",
-            message="PROB_ID=Prob153_gshare",
-        ),
-        cl.Starter(
-            label="Prob154_fsm_ps2data",
-            message="PROB_ID=Prob154_fsm_ps2data",
-        ),
-        cl.Starter(
-            label="Prob155_lemmings4",
-            message="PROB_ID=Prob155_lemmings4",
-        ),
-        cl.Starter(
-            label="not gate",
-            message="PROB_ID=Prob005_notgate",
-        ),
-        cl.Starter(
-            label="mux 2to1",
-            message="PROB_ID=Prob022_mux2to1",
-        ),
-        cl.Starter(
-            label="combinational gates",
-            message="PROB_ID=Prob087_gates",
-        ),
-        cl.Starter(
-            label="debug code",
-            message="PROB_ID=Prob132_always_if2",
-        )
-    ]
+    index = get_dataset_index()
+    patterns = [p.strip() for p in os.environ.get('STARTER_PROBLEMS', '').split(',') if p.strip()]
+    # Starters whose problem isn't in the dataset are left out
+    problem_ids = index.select(patterns) if patterns else [pid for pid in STARTERS if index.get(pid)]
+    return [cl.Starter(label=STARTERS.get(pid) or pid, message=f"PROB_ID={pid}") for pid in problem_ids]
 
 @cl.on_chat_start
 async def on_chat_start():
@@ -129,14 +95,21 @@ async def main(message):
 
     content = message.content
     if "PROB_ID" in content:
-        spec_id = content.split("PROB_ID=")[1]
-        spec_file = f"./verilog-eval-v2/{spec_id}_prompt.txt"
+        spec_id = content.split("PROB_ID=")[1].strip()
+        problem = get_dataset_index().get(spec_id)
+        if problem is None:
+            await cl.Message(content=f"No problem `{spec_id}` in the dataset.").send()
+            return
+        spec_file = problem.prompt_path
         with open(spec_file, 'r') as f:
             spec = f.read()
-        testbench_file = f"./verilog-eval-v2/{spec_id}_test.sv"
-        reference_file = f"./verilog-eval-v2/{spec_id}_ref.sv"
+        testbench_file = problem.test_path
+        reference_file = problem.ref_path
         use_dataset_tb = True
-        await code_flow(spec_id,spec,spec_file,testbench_file,reference_file,use_dataset_tb)
+        async with ChainlitBackend():
+            with collect_metrics() as metrics:
+                await code_flow(spec_id,spec,spec_file,testbench_file,reference_file,use_dataset_tb)
+        await cl.make_async(save_checkpoint)(metrics.report(), 'metrics.json', spec_id)
         return
 
     
@@ -153,9 +126,19 @@ async def main(message):
         testbench_file = None
         reference_file = None
         use_dataset_tb = False
-        await code_flow(spec_id,spec,spec_file,testbench_file,reference_file,use_dataset_tb)
+        async with ChainlitBackend():
+            with collect_metrics() as metrics:
+                await code_flow(spec_id,spec,spec_file,testbench_file,reference_file,use_dataset_tb)
+        await cl.make_async(save_checkpoint)(metrics.report(), 'metrics.json', spec_id)
         return
 
+async def show_graph(graph, image_path, rerender):
+    """Render the knowledge graph in the background (unless a current image exists), then post it"""
+    if rerender or not os.path.exists(image_path):
+        await asyncio.wrap_future(render_in_background(graph.G, image_path))
+    await cl.Message(content=equally_formatted("Graph Generated: graph"), elements=[cl.Image(name="graph", path=image_path, display="page")]).send()
+
+
 async def code_flow(spec_id,spec,spec_file,testbench_file,reference_file,use_dataset_tb):
     await cl.Message(content=equally_formatted("Putting agents to work"),elements=[cl.Image(name="agents", path='./images/agents.jpeg', display="page")]).send()
 
@@ -168,10 +151,13 @@ async def code_flow(spec_id,spec,spec_file,testbench_file,reference_file,use_dat
     print("Running spec2plan...")
     await update_task(task_num=1)
     await cl.Message(content=equally_formatted("Running spec2plan")).send()
-    plan = await cl.make_async(load_checkpoint)('plan.json', spec_id)
+    digest = stage_inputs_hash('spec2plan', spec)
+    plan = await cl.make_async(load_checkpoint)('plan.json', spec_id) if stage_is_current('spec2plan', digest, spec_id) else None
     if plan is None:
-        plan = await cl.make_async(spec2plan)(spec)
+        plan = await a_spec2plan(spec)
+        await a_flush_events()
         await cl.make_async(save_checkpoint)(plan, 'plan.json', spec_id) #save_checkpoint(plan, 'plan.json', spec_id)
+        record_stage_hash('spec2plan', digest, spec_id)
     await cl.Message(content=equally_formatted("Plan Generated: plan"), elements=[cl.Text(name="plan", content=json.dumps(plan, indent=4).__str__(), display="page", language="python")]).send()    
     await cl.Message(content=equally_formatted("Exiting spec2plan")).send()
     await update_task(task_num=1, done=True)
@@ -180,14 +166,21 @@ async def code_flow(spec_id,spec,spec_file,testbench_file,reference_file,use_dat
     print("Running plan2graph...")
     await update_task(task_num=2)
     await cl.Message(content=equally_formatted("Running plan2graph")).send()
-    graph = await cl.make_async(load_checkpoint)('graph.json', spec_id) #if load_checkpoint('graph.json', spec_id):
-    if graph is None:
+    digest = stage_inputs_hash('plan2graph', spec, plan)
+    graph_data = await cl.make_async(load_checkpoint)('graph.json', spec_id) if stage_is_current('plan2graph', digest, spec_id) else None
+    graph = VerilogKnowledgeGraph.from_dict(graph_data) if graph_data else None
+    new_graph = graph is None
+    if new_graph:
         async with cl.Step(name='plan2graph', type='llm') as step:
-            graph = await cl.make_async(plan2graph)(spec, plan) #plan2graph(spec, plan)
-        await cl.make_async(graph.export_graph)(os.path.join(ensure_checkpoint_dir(spec_id),'graph.json')) 
-        await cl.make_async(graph.visualize_graph)(os.path.join(ensure_checkpoint_dir(spec_id), 'verilog_knowledge_graph.png'))
-        
-    await cl.Message(content=equally_formatted("Graph Generated: graph"), elements=[cl.Image(name="graph", path=os.path.join(ensure_checkpoint_dir(spec_id), 'verilog_knowledge_graph.png'), display="page")]).send()
+            graph = await a_plan2graph(spec, plan)
+            await a_flush_events()
+        graph_data = graph.export_graph(filename=None)
+        await cl.make_async(save_checkpoint)(graph_data, 'graph.json', spec_id)
+        record_stage_hash('plan2graph', digest, spec_id)
+
+    # The graph image is posted when its render finishes, RTL generation doesn't wait for it
+    graph_image = os.path.join(ensure_checkpoint_dir(spec_id), graph_image_name())
+    graph_shown = asyncio.create_task(show_graph(graph, graph_image, rerender=new_graph))
     await cl.Message(content=equally_formatted("Exiting plan2graph")).send()
     await update_task(task_num=2, done=True)
 
@@ -196,16 +189,19 @@ async def code_flow(spec_id,spec,spec_file,testbench_file,reference_file,use_dat
     print("Running graph2tasks...")
     await update_task(task_num=3)
     await cl.Message(content=equally_formatted("Running graph2tasks")).send()
-    tasks = await cl.make_async(load_checkpoint)('tasks.json', spec_id) #if load_checkpoint('tasks.json', spec_id):
+    digest = stage_inputs_hash('graph2tasks', spec, graph_data)
+    tasks = await cl.make_async(load_checkpoint)('tasks.json', spec_id) if stage_is_current('graph2tasks', digest, spec_id) else None
     if tasks is None:
         async with cl.Step(name='graph2tasks', type='llm') as step:
-            tasks = await cl.make_async(graph2tasks)(spec, graph) #graph2tasks(spec, graph)
+            tasks = await a_graph2tasks(spec, graph)
+            await a_flush_events()
         await cl.make_async(save_checkpoint)(tasks, 'tasks.json', spec_id)
-        cl.run_sync(cl.Message(content=equally_formatted("Tasks Generated: tasks"), elements=[cl.Text(name="tasks", content="\n".join(tasks), display="page")]).send())
+        record_stage_hash('graph2tasks', digest, spec_id)
+        await cl.Message(content=equally_formatted("Tasks Generated: tasks"), elements=[cl.Text(name="tasks", content="\n".join(tasks), display="page")]).send()
     else:
-        cl.run_sync(cl.Message(content=equally_formatted("Tasks Generated: tasks"), elements=[cl.Text(name="tasks", content=json.dumps(tasks, indent=4), display="page", language="python")]).send())
+        await cl.Message(content=equally_formatted("Tasks Generated: tasks"), elements=[cl.Text(name="tasks", content=json.dumps(tasks, indent=4), display="page", language="python")]).send()
 
-    cl.run_sync(cl.Message(content=equally_formatted("Exiting graph2tasks")).send())
+    await cl.Message(content=equally_formatted("Exiting graph2tasks")).send()
     await update_task(task_num=3, done=True)
 
     # Step 4: generate_rtl
@@ -213,13 +209,18 @@ async def code_flow(spec_id,spec,spec_file,testbench_file,reference_file,use_dat
     await update_task(task_num=4)
     await cl.Message(content=equally_formatted("Running tasks2rtl")).send()
 
-    code = await cl.make_async(load_checkpoint)('TopModule_int.v', spec_id) #if load_checkpoint('code.json', spec_id):
-    interface = await cl.make_async(load_checkpoint)('interface.v', spec_id) #if load_checkpoint('interface.json', spec_id):
+    digest = stage_inputs_hash('generate_rtl', spec, tasks, graph_data)
+    code, interface = None, None
+    if stage_is_current('generate_rtl', digest, spec_id):
+        code = await cl.make_async(load_checkpoint)('TopModule_int.v', spec_id)
+        interface = await cl.make_async(load_checkpoint)('interface.v', spec_id)
     
     if code is None or interface is None:
-        code, interface = await cl.make_async(generate_rtl)(spec, tasks, work_dir)
+        code, interface = await a_generate_rtl(spec, tasks, work_dir, graph=graph)
+        await a_flush_events()
         await cl.make_async(save_checkpoint)(code, 'TopModule_int.v', spec_id)
         await cl.make_async(save_checkpoint)(interface, 'interface.v', spec_id)
+        record_stage_hash('generate_rtl', digest, spec_id)
 
     await cl.Message(content=equally_formatted("Code Generated: code"), elements=[cl.Text(name="code", content=code, display="page", language="verilog")]).send()
     await cl.Message(content=equally_formatted("Interface Generated: interface"), elements=[cl.Text(name="interface", content=interface, display="page", language="verilog")]).send()
@@ -249,7 +250,8 @@ async def code_flow(spec_id,spec,spec_file,testbench_file,reference_file,use_dat
     await update_task(task_num=5)
     await cl.Message(content=equally_formatted("Running verify_rtl")).send()
 
-    is_pass, code, tb = await cl.make_async(verify_rtl)(spec, code, interface, reference_rtl_path, tb_code, use_dataset_tb, work_dir)
+    is_pass, code, tb = await a_verify_rtl(spec, code, interface, reference_rtl_path, tb_code, use_dataset_tb, work_dir)
+    await a_flush_events()
     await cl.make_async(save_checkpoint)(tb, 'tb.sv', spec_id)
     
     if is_pass:
@@ -260,6 +262,7 @@ async def code_flow(spec_id,spec,spec_file,testbench_file,reference_file,use_dat
     await cl.Message(content=equally_formatted("Exiting verify_rtl")).send()
     await update_task(task_num=5, done=True)
     await update_task(task_num=6, done=True)
+    await graph_shown
     #except Exception as e:
     #    print(f"Error in RTL generation pipeline: {str(e)}")
 
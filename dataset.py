@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+
+import argparse
+import fnmatch
+import json
+import os
+import re
+import shlex
+import sys
+import tempfile
+import threading
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+PROMPT_SUFFIX = '_prompt.txt'
+TEST_SUFFIX = '_test.sv'
+REF_SUFFIX = '_ref.sv'
+MANIFEST_FILE = '.manifest.json'
+
+_COMMENT_RE = re.compile(r'//[^\n]*|/\*.*?\*/', re.DOTALL)
+_HEADER_RE = re.compile(r'\bmodule\s+RefModule\s*\((.*?)\)\s*;', re.DOTALL)
+_PORT_RE = re.compile(r'^\s*(input|output|inout)?\s*(?:wire|reg|logic)?\s*(signed)?\s*(\[[^\]]*\])?\s*([A-Za-z_]\w*)\s*$')
+_RANGE_RE = re.compile(r'\[\s*(\d+)\s*:\s*(\d+)\s*\]')
+_EDGE_RE = re.compile(r'\b(posedge|negedge)\b')
+
+
+@dataclass
+class ProblemInfo:
+    """A verilog-eval problem: its files and the metadata used to pick and schedule runs"""
+    problem_id: str
+    prompt_path: str
+    test_path: str
+    ref_path: str
+    spec_chars: int = 0
+    tb_lines: int = 0
+    sequential: bool = False
+    ports: List[dict] = field(default_factory=list)
+    baseline_sim_seconds: Optional[float] = None
+    signature: List[int] = field(default_factory=list)
+
+    @property
+    def size(self) -> float:
+        """Scheduling weight: the baseline simulation time when measured, else the spec and testbench size"""
+        if self.baseline_sim_seconds is not None:
+            return self.baseline_sim_seconds * 1000 + self.spec_chars
+        return self.spec_chars + 10 * self.tb_lines
+
+
+def reference_header(ref_code: str) -> Optional[str]:
+    """Port list of the RefModule header without comments, None if the reference has no plain header"""
+    match = _HEADER_RE.search(_COMMENT_RE.sub('', ref_code))
+    return match.group(1) if match else None
+
+
+def reference_ports(ref_code: str) -> List[dict]:
+    """Ports of the RefModule header as {'name', 'direction', 'width'} (width in bits, or the range text if not numeric)"""
+    header = reference_header(ref_code)
+    if header is None:
+        return []
+
+    ports = []
+    direction, width = None, 1
+    for item in header.split(','):
+        m = _PORT_RE.match(item)
+        if not m:
+            continue
+        if m.group(1):
+            # A direction starts a new declaration, later bare names share its direction and range
+            direction, width = m.group(1), 1
+            if m.group(3):
+                bits = _RANGE_RE.fullmatch(m.group(3).strip())
+                width = abs(int(bits.group(1)) - int(bits.group(2))) + 1 if bits else m.group(3).strip()
+        ports.append({'name': m.group(4), 'direction': direction, 'width': width})
+    return ports
+
+
+def _read_problem(problem_id: str, dataset_dir: str, signature: List[int]) -> ProblemInfo:
+    paths = [os.path.join(dataset_dir, problem_id + suffix) for suffix in (PROMPT_SUFFIX, TEST_SUFFIX, REF_SUFFIX)]
+    texts = []
+    for path in paths:
+        with open(path, 'r') as f:
+            texts.append(f.read())
+    spec, tb, ref = texts
+    return ProblemInfo(
+        problem_id=problem_id,
+        prompt_path=paths[0],
+        test_path=paths[1],
+        ref_path=paths[2],
+        spec_chars=len(spec),
+        tb_lines=tb.count('\n'),
+        sequential=bool(_EDGE_RE.search(_COMMENT_RE.sub('', ref))),
+        ports=reference_ports(ref),
+        signature=signature,
+    )
+
+
+class DatasetIndex:
+    """
+    Index of the problems in a verilog-eval dataset directory.
+
+    The directory is listed once; a problem counts only if its prompt, testbench and reference
+    all exist. Per-problem metadata is kept in <dataset_dir>/.manifest.json together with the
+    sizes and modification times of the files it came from, so later loads only re-read the
+    problems whose files changed. Baseline simulation times (see measure_baselines) survive
+    as long as the problem's files don't change.
+    """
+
+    def __init__(self, dataset_dir: str = './verilog-eval-v2'):
+        self.dataset_dir = dataset_dir
+        self.manifest_path = os.path.join(dataset_dir, MANIFEST_FILE)
+        self.problems: Dict[str, ProblemInfo] = {}
+        self._scan()
+
+    def _load_manifest(self) -> Dict[str, ProblemInfo]:
+        try:
+            with open(self.manifest_path, 'r') as f:
+                return {p['problem_id']: ProblemInfo(**p) for p in json.load(f)['problems']}
+        except (OSError, json.JSONDecodeError, KeyError, TypeError):
+            return {}
+
+    def _scan(self) -> None:
+        files = {}
+        try:
+            with os.scandir(self.dataset_dir) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        files[entry.name] = [stat.st_size, stat.st_mtime_ns]
+        except FileNotFoundError:
+            return
+
+        cached = self._load_manifest()
+        changed = False
+        for name in sorted(files):
+            if not name.endswith(PROMPT_SUFFIX):
+                continue
+            problem_id = name[:-len(PROMPT_SUFFIX)]
+            parts = [problem_id + suffix for suffix in (PROMPT_SUFFIX, TEST_SUFFIX, REF_SUFFIX)]
+            if not all(part in files for part in parts):
+                continue
+            signature = [value for part in parts for value in files[part]]
+            info = cached.get(problem_id)
+            if info is None or info.signature != signature:
+                info = _read_problem(problem_id, self.dataset_dir, signature)
+                changed = True
+            else:
+                # The manifest may have been written through another spelling of dataset_dir
+                info.prompt_path, info.test_path, info.ref_path = (os.path.join(self.dataset_dir, part) for part in parts)
+            self.problems[problem_id] = info
+
+        if changed or set(cached) != set(self.problems):
+            self.save()
+
+    def save(self) -> None:
+        """Write the manifest (to a temporary file renamed into place, so readers never see half of it)"""
+        data = {'problems': [asdict(info) for info in self.problems.values()]}
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.dataset_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, indent=1)
+            # mkstemp creates the file private to its owner
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.manifest_path)
+        except OSError as e:
+            # A read-only dataset still works, it's just scanned on every load. Warnings go to stderr,
+            # run.sh evaluates the output of 'dataset.py paths'
+            print(f"Warning: Could not write the dataset manifest: {e}", file=sys.stderr)
+
+    def ids(self) -> List[str]:
+        return sorted(self.problems)
+
+    def get(self, problem_id: str) -> Optional[ProblemInfo]:
+        return self.problems.get(problem_id)
+
+    def select(self, patterns: Optional[List[str]] = None) -> List[str]:
+        """Expand problem IDs and glob patterns, keeping the given order (every problem if patterns is empty)"""
+        available = self.ids()
+        if not patterns:
+            return available
+
+        selected = {}
+        for pattern in patterns:
+            matches = [pattern] if pattern in self.problems else fnmatch.filter(available, pattern)
+            if not matches:
+                print(f"Warning: No problem matches '{pattern}'", file=sys.stderr)
+            selected.update(dict.fromkeys(matches))
+        return list(selected)
+
+    def filter(self, problem_ids: Optional[List[str]] = None, sequential: Optional[bool] = None,
+               max_spec_chars: Optional[int] = None, max_tb_lines: Optional[int] = None) -> List[str]:
+        """Problems (of problem_ids, default all) that match every given criterion"""
+        result = []
+        for problem_id in (self.ids() if problem_ids is None else problem_ids):
+            info = self.problems[problem_id]
+            if sequential is not None and info.sequential != sequential:
+                continue
+            if max_spec_chars is not None and info.spec_chars > max_spec_chars:
+                continue
+            if max_tb_lines is not None and info.tb_lines > max_tb_lines:
+                continue
+            result.append(problem_id)
+        return result
+
+    def largest_first(self, problem_ids: List[str]) -> List[str]:
+        """Order problems by decreasing size, so a worker pool doesn't end on one long straggler"""
+        return sorted(problem_ids, key=lambda problem_id: -self.problems[problem_id].size)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_dataset_index(dataset_dir: str = './verilog-eval-v2') -> DatasetIndex:
+    """Return the process-wide index of a dataset directory"""
+    with _indexes_lock:
+        if dataset_dir not in _indexes:
+            _indexes[dataset_dir] = DatasetIndex(dataset_dir)
+        return _indexes[dataset_dir]
+
+
+def measure_baselines(index: DatasetIndex, problem_ids: List[str], work_dir: str = './work/dataset_baseline') -> None:
+    """Simulate the reference solutions with the configured simulator and record their run time in the manifest"""
+    import shutil
+    from sim_benchmark import benchmark_problem
+    from simulators import get_simulator
+
+    simulator = get_simulator()
+    for problem_id in problem_ids:
+        result = benchmark_problem(problem_id, index.dataset_dir, simulator, work_dir)
+        index.problems[problem_id].baseline_sim_seconds = result['cold_run']
+        print(f"{problem_id}: {result['cold_run']:.2f} s [{simulator.name}], passed: {result['passed']}")
+    shutil.rmtree(work_dir, ignore_errors=True)
+    index.save()
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Query the verilog-eval dataset index')
+    parser.add_argument('--dataset-dir', default='./verilog-eval-v2', help='Directory holding the dataset problems')
+    sub = parser.add_subparsers(dest='command', required=True)
+    lst = sub.add_parser('list', help='List problems with their metadata')
+    lst.add_argument('problems', nargs='*', help='Problem IDs or glob patterns (default: all)')
+    kind = lst.add_mutually_exclusive_group()
+    kind.add_argument('--sequential', action='store_true', help='Only problems with clocked logic')
+    kind.add_argument('--combinational', action='store_true', help='Only purely combinational problems')
+    lst.add_argument('--max-spec-chars', type=int, help='Only specs up to this many characters')
+    lst.add_argument('--max-tb-lines', type=int, help='Only testbenches up to this many lines')
+    lst.add_argument('--largest-first', action='store_true', help='Order by decreasing size')
+    lst.add_argument('--ids', action='store_true', help='Print only the problem IDs')
+    show = sub.add_parser('show', help='Print the metadata of a problem as JSON')
+    show.add_argument('problem_id')
+    paths = sub.add_parser('paths', help='Print the spec, testbench and reference paths of a problem as shell variables')
+    paths.add_argument('problem_id')
+    measure = sub.add_parser('measure', help='Record the simulation time of the reference solutions')
+    measure.add_argument('problems', nargs='*', help='Problem IDs or glob patterns (default: all)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    index = get_dataset_index(args.dataset_dir)
+
+    if args.command == 'list':
+        sequential = True if args.sequential else False if args.combinational else None
+        problem_ids = index.filter(index.select(args.problems), sequential, args.max_spec_chars, args.max_tb_lines)
+        if args.largest_first:
+            problem_ids = index.largest_first(problem_ids)
+        for problem_id in problem_ids:
+            info = index.get(problem_id)
+            if args.ids:
+                print(problem_id)
+                continue
+            baseline = f"{info.baseline_sim_seconds:.2f} s" if info.baseline_sim_seconds is not None else "-"
+            print(f"{problem_id:40} {'seq ' if info.sequential else 'comb'}  spec {info.spec_chars:5} chars  "
+                  f"tb {info.tb_lines:4} lines  {len(info.ports):3} ports  sim {baseline}")
+    elif args.command in ('show', 'paths'):
+        info = index.get(args.problem_id)
+        if info is None:
+            print(f"Error: No problem {args.problem_id} in {args.dataset_dir}")
+            return 1
+        if args.command == 'show':
+            print(json.dumps(asdict(info), indent=2))
+        else:
+            for name, path in (('SPEC_FILE', info.prompt_path), ('TESTBENCH_FILE', info.test_path), ('REFERENCE_FILE', info.ref_path)):
+                print(f"{name}={shlex.quote(path)}")
+    elif args.command == 'measure':
+        measure_baselines(index, index.select(args.problems))
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
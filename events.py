@@ -0,0 +1,280 @@
+import asyncio
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import List, Optional
+
+
+@dataclass
+class UIEvent:
+    """A message shown in the UI on behalf of an agent or tool"""
+    author: str
+    content: str
+
+
+def coalesce(events: List[UIEvent]) -> List[UIEvent]:
+    """Merge consecutive events of the same author into a single message"""
+    merged = []
+    for event in events:
+        if merged and merged[-1].author == event.author:
+            merged[-1] = UIEvent(event.author, merged[-1].content + "\n\n" + event.content)
+        else:
+            merged.append(UIEvent(event.author, event.content))
+    return merged
+
+
+class EventBackend:
+    """
+    Destination of the agent/tool messages and user questions of a run.
+
+    The base class is the no-op backend: messages are dropped and questions get no answer,
+    which the pipeline treats like a user accepting the current result.
+    """
+
+    name = "none"
+
+    def emit(self, author: str, content: str) -> None:
+        pass
+
+    async def a_emit(self, author: str, content: str) -> None:
+        self.emit(author, content)
+
+    def flush(self) -> None:
+        """Make sure earlier events are delivered, e.g. before asking the user a question"""
+        pass
+
+    async def a_flush(self) -> None:
+        self.flush()
+
+    def ask_user(self, question: str, timeout: int = 100) -> Optional[str]:
+        """Ask the user a question and return the answer, None if there is none"""
+        return None
+
+    async def a_ask_user(self, question: str, timeout: int = 100) -> Optional[str]:
+        return self.ask_user(question, timeout)
+
+    def close(self) -> None:
+        pass
+
+
+NullBackend = EventBackend
+
+
+class JsonlBackend(EventBackend):
+    """Append every event as one JSON line to a log file (thread-safe)"""
+
+    name = "jsonl"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a", buffering=1)
+
+    def _write(self, record: dict) -> None:
+        line = json.dumps(record)
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line + "\n")
+
+    def emit(self, author: str, content: str) -> None:
+        self._write({"time": time.time(), "type": "message", "author": author, "content": content})
+
+    def ask_user(self, question: str, timeout: int = 100) -> Optional[str]:
+        self._write({"time": time.time(), "type": "question", "author": "user", "content": question})
+        return None
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class ChainlitBackend(EventBackend):
+    """
+    Buffered queue between the agents and the Chainlit websocket.
+
+    Agents enqueue events and return immediately. A background task on the Chainlit event
+    loop drains the queue in batches of up to batch_size, merges consecutive events of the
+    same author and sends them. Producers only wait when max_pending events are already
+    queued; producers on the event loop itself never block, since the flusher runs there.
+
+    Use as `async with ChainlitBackend():` around a run; the backend is made current for
+    everything started inside the block, including tool threads.
+    """
+
+    name = "chainlit"
+
+    def __init__(self, max_pending: int = 256, batch_size: int = 32, flush_interval: float = 0.05):
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._events = deque()
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._loop = None
+        self._task = None
+        self._closing = False
+        self._token = None
+
+    async def start(self) -> "ChainlitBackend":
+        self._loop = asyncio.get_running_loop()
+        self._closing = False
+        self._task = self._loop.create_task(self._run())
+        self._token = _current_backend.set(self)
+        return self
+
+    async def a_close(self) -> None:
+        """Send everything still queued and stop the flusher"""
+        self._closing = True
+        if self._task is not None:
+            await self._task
+            self._task = None
+        if self._token is not None:
+            _current_backend.reset(self._token)
+            self._token = None
+
+    async def __aenter__(self) -> "ChainlitBackend":
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        await self.a_close()
+
+    def _on_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def emit(self, author: str, content: str) -> None:
+        """Queue an event, waiting for room only when called off the event loop"""
+        with self._cond:
+            if not self._on_loop():
+                while len(self._events) >= self.max_pending and self._task is not None:
+                    self._cond.wait()
+            self._events.append(UIEvent(author, content))
+
+    async def a_emit(self, author: str, content: str) -> None:
+        """Queue an event from a coroutine, yielding to the flusher while the queue is full"""
+        while True:
+            with self._cond:
+                if len(self._events) < self.max_pending or self._task is None:
+                    self._events.append(UIEvent(author, content))
+                    return
+            await asyncio.sleep(self.flush_interval)
+
+    def _take(self) -> List[UIEvent]:
+        with self._cond:
+            batch = [self._events.popleft() for _ in range(min(self.batch_size, len(self._events)))]
+            self._in_flight = len(batch)
+            self._cond.notify_all()
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = self._take()
+            if not batch:
+                if self._closing:
+                    return
+                await asyncio.sleep(self.flush_interval)
+                continue
+            for event in coalesce(batch):
+                try:
+                    await self.deliver(event)
+                except Exception as e:
+                    print(f"Failed to send UI message from {event.author}: {e}")
+            with self._cond:
+                self._in_flight = 0
+                self._cond.notify_all()
+
+    async def deliver(self, event: UIEvent) -> None:
+        import chainlit as cl
+        await cl.Message(content=event.content, author=event.author).send()
+
+    def _drained(self) -> bool:
+        return not self._events and not self._in_flight
+
+    async def a_flush(self) -> None:
+        """Wait until every queued event has been sent"""
+        while not self._drained() and self._task is not None:
+            await asyncio.sleep(self.flush_interval)
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Blocking flush for worker threads (never call it on the event loop)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self._drained() and self._task is not None:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return
+                self._cond.wait(remaining)
+
+    def ask_user(self, question: str, timeout: int = 100) -> Optional[str]:
+        import chainlit as cl
+        self.flush()
+        answer = cl.run_sync(cl.AskUserMessage(content=question, timeout=timeout).send())
+        return answer.get("output") if answer else None
+
+    async def a_ask_user(self, question: str, timeout: int = 100) -> Optional[str]:
+        import chainlit as cl
+        await self.a_flush()
+        answer = await cl.AskUserMessage(content=question, timeout=timeout).send()
+        return answer.get("output") if answer else None
+
+
+EVENT_BACKENDS = ["none", "jsonl"]
+
+_current_backend = contextvars.ContextVar("event_backend", default=NullBackend())
+
+
+def get_event_backend() -> EventBackend:
+    return _current_backend.get()
+
+
+def make_event_backend(name: str = "none", path: Optional[str] = None) -> EventBackend:
+    """Create a headless backend by name (the Chainlit backend is started by the app itself)"""
+    if name == "none":
+        return NullBackend()
+    if name == "jsonl":
+        return JsonlBackend(path or "./events.jsonl")
+    raise ValueError(f"Unknown event backend: {name}")
+
+
+@contextlib.contextmanager
+def use_event_backend(backend: EventBackend):
+    """Route the events of everything run inside the block to backend, closing it afterwards"""
+    token = _current_backend.set(backend)
+    try:
+        yield backend
+    finally:
+        _current_backend.reset(token)
+        backend.close()
+
+
+def emit_event(author: str, content: str) -> None:
+    """Show a message through the backend of the current run"""
+    get_event_backend().emit(author, content)
+
+
+async def a_emit_event(author: str, content: str) -> None:
+    await get_event_backend().a_emit(author, content)
+
+
+def ask_user(question: str, timeout: int = 100) -> Optional[str]:
+    return get_event_backend().ask_user(question, timeout)
+
+
+async def a_ask_user(question: str, timeout: int = 100) -> Optional[str]:
+    return await get_event_backend().a_ask_user(question, timeout)
+
+
+def flush_events() -> None:
+    get_event_backend().flush()
+
+
+async def a_flush_events() -> None:
+    await get_event_backend().a_flush()
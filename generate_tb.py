@@ -1,7 +1,12 @@
 from collections import deque
 import os
 from typing import Any, List
-from utils import VerilogToolKits, get_traces, ChainlitAssistantAgent, ChainlitUserProxyAgent
+from utils import VerilogToolKits, get_traces, tool_message, as_async_tool
+from agents import ChainlitAssistantAgent, ChainlitUserProxyAgent
+from async_swarm import a_initiate_swarm_chat
+from llm_cache import apply_llm_cache
+from memory import apply_memory_policy
+from metrics import timed_stage, record_chat
 from prompts import TB_DESIGNER_SYSTEM_MESSAGE, TB_REVIEWER_SYSTEM_MESSAGE, TB_DESIGNER_EXAMPLES, TB_DESIGNER_PROMPT
 
 from autogen import (
@@ -19,10 +24,14 @@ from autogen import (
 )
 
 from typing import Annotated
-import chainlit as cl
 
-def generate_tb(spec: str, interface: str, messages, work_dir: str = "./work", llm_config_path: str = "LLM_CONFIG"):
+def _build_tb_swarm(spec: str, interface: str, messages, work_dir: str, llm_config_path: str, vcd_path: str, is_async: bool = False) -> dict:
+    """
+    Create the agents and hand-offs of the testbench generation swarm.
 
+    With is_async the tools run their blocking work in a worker thread, for use with
+    `a_initiate_swarm_chat`.
+    """
     llm_config = LLMConfig.from_json(
         path=llm_config_path
     )
@@ -40,12 +49,7 @@ def generate_tb(spec: str, interface: str, messages, work_dir: str = "./work", l
         Input the completed verilog testbench module in string format. Output is the string of pass or failed.
         """
         [compile_pass, log] = vtk.tb_syntax_check_tool(completed_verilog=completed_verilog)
-        cl.run_sync(
-                cl.Message(
-                    content=f'***** Response from calling tool *****\n\n{log}',
-                    author="tool call",
-                ).send()
-            )
+        tool_message(log)
 
         context_variables["compile_pass"] = compile_pass
         context_variables["code"] = completed_verilog if compile_pass else None
@@ -65,7 +69,7 @@ def generate_tb(spec: str, interface: str, messages, work_dir: str = "./work", l
         """
         Trace the functionally incorrect signal waveforms.
         """
-        return get_traces(f"{work_dir}/wave.vcd", signals, start_time, (end_time-start_time), "tb.clk") + \
+        return get_traces(vcd_path, signals, start_time, (end_time-start_time), "tb.clk") + \
                "\n\n**Please use the `waveform_trace_tool` again with some more signals/time if you are not 100 % sure about the bug in tb. " + \
                "Suggest changes to the 'tb_designer' based on the 'user' feedback and waveform.**\n" 
 
@@ -79,7 +83,7 @@ def generate_tb(spec: str, interface: str, messages, work_dir: str = "./work", l
         name="tb_designer",
         description="Assistant who writes Testbench code in verilog.",
         system_message=TB_DESIGNER_SYSTEM_MESSAGE.format(TB_DESIGNER_EXAMPLES=TB_DESIGNER_EXAMPLES),
-        functions=[tb_syntax_check_tool],
+        functions=[as_async_tool(tb_syntax_check_tool) if is_async else tb_syntax_check_tool],
         llm_config=llm_config,
     )
 
@@ -87,10 +91,13 @@ def generate_tb(spec: str, interface: str, messages, work_dir: str = "./work", l
         name="tb_reviewer",
         description="Assistant who reviews Testbench code in verilog.",
         system_message=TB_REVIEWER_SYSTEM_MESSAGE,
-        functions=[waveform_trace_tool],
+        functions=[as_async_tool(waveform_trace_tool) if is_async else waveform_trace_tool],
         llm_config=llm_config,
     )
 
+    apply_llm_cache(tb_designer, tb_reviewer)
+    apply_memory_policy(tb_designer, tb_reviewer)
+
     #register_hand_off(
     #    agent=tb_reviewer,
     #    hand_to=[
@@ -135,7 +142,7 @@ def generate_tb(spec: str, interface: str, messages, work_dir: str = "./work", l
 
     initial_agent = tb_designer if len(messages) < 2 else tb_reviewer
 
-    chat_history = initiate_swarm_chat(
+    return dict(
         initial_agent=initial_agent,
         agents=[tb_designer, tb_reviewer, user],
         context_variables=workflow_context,  # Our shared context
@@ -143,5 +150,28 @@ def generate_tb(spec: str, interface: str, messages, work_dir: str = "./work", l
         max_rounds=40  # Maximum number of turns
     )
 
+
+@timed_stage('generate_tb')
+def generate_tb(spec: str, interface: str, messages, work_dir: str = "./work", llm_config_path: str = "LLM_CONFIG", vcd_path: str = None):
+
+    # Waveform of the latest simulation of the RTL under test, traced by the reviewer
+    vcd_path = vcd_path or os.path.join(work_dir, "wave.vcd")
+
+    swarm = _build_tb_swarm(spec, interface, messages, work_dir, llm_config_path, vcd_path)
+    chat_history = initiate_swarm_chat(**swarm)
+    record_chat(chat_history[0])
+
     # Return the generated code from the workflow context
-    return workflow_context["code"], chat_history[0].chat_history
+    return swarm["context_variables"]["code"], chat_history[0].chat_history
+
+
+@timed_stage('generate_tb')
+async def a_generate_tb(spec: str, interface: str, messages, work_dir: str = "./work", llm_config_path: str = "LLM_CONFIG", vcd_path: str = None):
+    """Async version of generate_tb for the Chainlit app."""
+    vcd_path = vcd_path or os.path.join(work_dir, "wave.vcd")
+
+    swarm = _build_tb_swarm(spec, interface, messages, work_dir, llm_config_path, vcd_path, is_async=True)
+    chat_history = await a_initiate_swarm_chat(**swarm)
+    record_chat(chat_history[0])
+
+    return swarm["context_variables"]["code"], chat_history[0].chat_history
@@ -1,67 +1,64 @@
 import json
-from langchain.chat_models import init_chat_model
+from typing import List
+from pydantic import BaseModel, Field
 from prompts import *
 from utils import VerilogKnowledgeGraph
-import os
+from llm_cache import init_cached_chat_model
+from metrics import timed_stage, langchain_config
+
+
+class PlanRelations(BaseModel):
+    """Plan with related signals, states and examples."""
+    plan: str = ""
+    signals: List[str] = []
+    fsm_states: List[str] = []
+    examples: List[str] = []
+
+class PlansRelations(BaseModel):
+    """Collection of all plans with their relationships."""
+    plans: List[PlanRelations] = []
+    
+class FinalPlans(BaseModel):
+    """Final plans draft."""
+    plans: List[str] = Field(description="List of the plans")
+
+
+def get_plan_relationships(knowledge_graph, plan_name: str, depth: int = 3) -> PlanRelations:
+    """
+    Build a PlanRelations object by traversing relationships in the knowledge graph.
+    
+    Args:
+        knowledge_graph: The knowledge graph object with BFS capability
+        plan_name: Name of the plan to find relationships for
+        depth: How deep to search in the graph
+    
+    Returns:
+        PlanRelations object with populated relationships
+    """
+    plan_relations = PlanRelations()
+    nodes = knowledge_graph.G.nodes
+    categories = {'signal': plan_relations.signals, 'fsm_state': plan_relations.fsm_states, 'example': plan_relations.examples}
+
+    # The memoized neighborhood lists every reachable node once, in BFS order
+    for target_node in knowledge_graph.neighborhood(plan_name, depth):
+        if not target_node or target_node not in nodes:
+            continue
+
+        node_type = nodes[target_node].get('type', 'unknown')
+        node_desc = nodes[target_node].get('description', 'No description available')
+        formatted_info = f"{target_node}: {node_desc}"
+
+        # Add information to appropriate category
+        if node_type == 'plan':
+            plan_relations.plan = formatted_info
+        elif node_type in categories:
+            categories[node_type].append(formatted_info)
+    
+    return plan_relations
 
-def graph2tasks(spec: str, kg: VerilogKnowledgeGraph) -> list[str]:
-    """Generate relationships between plans, signals, states, and examples."""
-    from typing import List
-    from pydantic import BaseModel, Field
-
-    class PlanRelations(BaseModel):
-        """Plan with related signals, states and examples."""
-        plan: str = ""
-        signals: List[str] = []
-        fsm_states: List[str] = []
-        examples: List[str] = []
-
-    class PlansRelations(BaseModel):
-        """Collection of all plans with their relationships."""
-        plans: List[PlanRelations] = []
-        
-    class FinalPlans(BaseModel):
-        """Final plans draft."""
-        plans: List[str] = Field(description="List of the plans")
-
-    def get_plan_relationships(knowledge_graph, plan_name: str, depth: int = 3) -> PlanRelations:
-        """
-        Build a PlanRelations object by traversing relationships in the knowledge graph.
-        
-        Args:
-            knowledge_graph: The knowledge graph object with BFS capability
-            plan_name: Name of the plan to find relationships for
-            depth: How deep to search in the graph
-        
-        Returns:
-            PlanRelations object with populated relationships
-        """
-        plan_relations = PlanRelations()
-        related_nodes = knowledge_graph.bfs_relationship(plan_name, depth)
-        
-        # Process relationships from BFS traversal
-        for level in related_nodes:
-            for relationship in level:
-                target_node = relationship['target']
-                if not target_node or target_node not in knowledge_graph.G.nodes:
-                    continue
-                    
-                node_type = knowledge_graph.G.nodes[target_node].get('type', 'unknown')
-                node_desc = knowledge_graph.G.nodes[target_node].get('description', 'No description available')
-                formatted_info = f"{target_node}: {node_desc}"
-                
-                # Add information to appropriate category
-                if node_type == 'plan':
-                    plan_relations.plan = formatted_info
-                elif node_type == 'signal' and formatted_info not in plan_relations.signals:
-                    plan_relations.signals.append(formatted_info)
-                elif node_type == 'fsm_state' and formatted_info not in plan_relations.fsm_states:
-                    plan_relations.fsm_states.append(formatted_info)
-                elif node_type == 'example' and formatted_info not in plan_relations.examples:
-                    plan_relations.examples.append(formatted_info)
-        
-        return plan_relations
 
+def _plans_relations_json(kg: VerilogKnowledgeGraph) -> str:
+    """Collect the relationships of every plan in the knowledge graph as JSON"""
     # Fetch all plan IDs from the knowledge graph
     plan_ids = [item['name'] for item in kg.query_graph("list_entities", entity_type="plan")]
     
@@ -71,12 +68,33 @@ def graph2tasks(spec: str, kg: VerilogKnowledgeGraph) -> list[str]:
     )
     
     # Generate JSON output
-    json_output = plans_relations.model_dump_json(indent=2)
+    return plans_relations.model_dump_json(indent=2)
+
+
+@timed_stage('graph2tasks')
+def graph2tasks(spec: str, kg: VerilogKnowledgeGraph) -> list[str]:
+    """Generate relationships between plans, signals, states, and examples."""
+    json_output = _plans_relations_json(kg)
     
     # Process with LLM 
-    llm = init_chat_model(os.environ.get('CHAT_MODEL'))
+    llm = init_cached_chat_model()
     final_plans = llm.with_structured_output(FinalPlans).invoke(
-        PLAN_EXTRACT_PROMPT.format(spec=spec, json_struct=json_output)
+        PLAN_EXTRACT_PROMPT.format(spec=spec, json_struct=json_output),
+        config=langchain_config('plan_extractor')
     )
     
     return final_plans.plans
+
+
+@timed_stage('graph2tasks')
+async def a_graph2tasks(spec: str, kg: VerilogKnowledgeGraph) -> list[str]:
+    """Async version of graph2tasks that awaits the LLM call on the event loop."""
+    json_output = _plans_relations_json(kg)
+
+    llm = init_cached_chat_model()
+    final_plans = await llm.with_structured_output(FinalPlans).ainvoke(
+        PLAN_EXTRACT_PROMPT.format(spec=spec, json_struct=json_output),
+        config=langchain_config('plan_extractor')
+    )
+
+    return final_plans.plans
@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import tempfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Tuple
+
+GRAPH_LAYOUTS = ['auto', 'spring', 'hierarchical']
+
+# Above this many nodes 'auto' uses the hierarchical layout; spring_layout is quadratic per iteration
+SPRING_LAYOUT_MAX_NODES = 150
+# Above this many nodes labels and arrow heads are left out, they would only be ink
+LABEL_MAX_NODES = 500
+# Longest side of raster images in pixels; tall hierarchical figures get a lower dpi instead
+MAX_IMAGE_PIXELS = 8000
+
+# Column of each node type in the hierarchical layout, other types go last
+LAYERS = {"plan": 0, "signal": 1, "fsm_state": 2, "example": 2}
+
+NODE_COLORS = {"plan": "lightblue", "signal": "lightgreen", "fsm_state": "lightcoral", "example": "gray"}
+NODE_LABELS = {"plan": "Plan", "signal": "Signal", "fsm_state": "FSM State", "example": "Example"}
+EDGE_COLORS = {"IMPLEMENTS": "green", "STATETRANSITION": "red", "EXAMPLES": "gray"}
+
+_layouts = {}
+_render_executor = None
+
+
+def graph_image_name() -> str:
+    """File name of the rendered graph, GRAPH_IMAGE_FORMAT picks png (default) or svg"""
+    image_format = os.environ.get("GRAPH_IMAGE_FORMAT", "png")
+    if image_format not in ("png", "svg"):
+        raise ValueError(f"GRAPH_IMAGE_FORMAT must be 'png' or 'svg', not {image_format!r}")
+    return f"verilog_knowledge_graph.{image_format}"
+
+
+def layout_key(G, layout: str) -> str:
+    """Hash of the nodes (with their types), the relationships and the layout, independent of insertion order"""
+    content = {
+        "layout": layout,
+        "nodes": sorted((str(n), a.get("type", "")) for n, a in G.nodes(data=True)),
+        "edges": sorted((str(u), str(v), d.get("relationship", "")) for u, v, d in G.edges(data=True)),
+    }
+    return hashlib.sha256(json.dumps(content).encode("utf-8")).hexdigest()
+
+
+def hierarchical_layout(G) -> Dict[str, Tuple[float, float]]:
+    """
+    Columns of plans, signals and FSM states/examples, linear in the size of the graph.
+
+    Plans keep their order. Every other node is placed by the mean row of the nodes pointing
+    to it (barycenter ordering), which keeps most relationships short and uncrossed.
+    """
+    columns = {}
+    for node, attrs in G.nodes(data=True):
+        columns.setdefault(LAYERS.get(attrs.get("type"), max(LAYERS.values()) + 1), []).append(node)
+
+    rows = {}
+    for layer in sorted(columns):
+        nodes = columns[layer]
+        if layer > 0:
+            def barycenter(item):
+                index, node = item
+                parents = [rows[p] for p in G.predecessors(node) if p in rows]
+                return (sum(parents) / len(parents) if parents else float("inf"), index)
+            nodes = [node for _, node in sorted(enumerate(nodes), key=barycenter)]
+        for row, node in enumerate(nodes):
+            rows[node] = row / max(len(nodes) - 1, 1)
+
+    layer_of = {node: layer for layer, nodes in columns.items() for node in nodes}
+    return {node: (float(layer_of[node]), 1.0 - row) for node, row in rows.items()}
+
+
+def graph_layout(G, layout: str = "auto") -> Dict[str, Tuple[float, float]]:
+    """
+    Node positions of a graph, cached in memory and on disk by graph content.
+
+    GRAPH_LAYOUT_CACHE_DIR sets the cache directory (default ./.graph_cache, empty keeps the
+    layouts in memory only), so re-rendering an unchanged graph skips the layout entirely.
+    """
+    if layout not in GRAPH_LAYOUTS:
+        raise ValueError(f"layout must be one of {GRAPH_LAYOUTS}, not {layout!r}")
+    if layout == "auto":
+        layout = "spring" if G.number_of_nodes() <= SPRING_LAYOUT_MAX_NODES else "hierarchical"
+
+    key = layout_key(G, layout)
+    if key in _layouts:
+        return _layouts[key]
+
+    cache_dir = os.environ.get("GRAPH_LAYOUT_CACHE_DIR", "./.graph_cache")
+    cache_path = os.path.join(cache_dir, f"{key}.json") if cache_dir else None
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with open(cache_path, "r") as f:
+                pos = {node: tuple(xy) for node, xy in json.load(f).items()}
+            if set(pos) == set(map(str, G.nodes)):
+                _layouts[key] = pos
+                return pos
+        except (OSError, json.JSONDecodeError):
+            pass
+
+    if layout == "spring":
+        import networkx as nx
+        pos = {node: (float(x), float(y)) for node, (x, y) in nx.spring_layout(G, seed=42).items()}
+    else:
+        pos = hierarchical_layout(G)
+    _layouts[key] = pos
+
+    if cache_path:
+        # Written to a temporary file and renamed, so concurrent runs never read half a layout
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(pos, f)
+        os.replace(tmp_path, cache_path)
+    return pos
+
+
+def render_graph(G, filename: str, figsize=(12, 10), layout: str = "auto", dpi: int = 300) -> str:
+    """
+    Draw a knowledge graph to filename; the format follows its extension (.png, .svg, .pdf).
+
+    Uses a standalone matplotlib Figure instead of pyplot, so renders don't share global state
+    and the figure is freed afterwards.
+    """
+    import networkx as nx
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from matplotlib.lines import Line2D
+
+    pos = graph_layout(G, layout)
+    large = G.number_of_nodes() > LABEL_MAX_NODES
+    if layout != "spring" and G.number_of_nodes() > SPRING_LAYOUT_MAX_NODES:
+        # Tall columns need room for their rows
+        column = max((sum(1 for p in pos.values() if p[0] == x) for x in {p[0] for p in pos.values()}), default=0)
+        figsize = (figsize[0], max(figsize[1], min(column * 0.12, 200)))
+
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+
+    # Draw nodes, colored by type
+    node_colors = [NODE_COLORS.get(G.nodes[node].get("type"), "white") for node in G.nodes()]
+    nx.draw_networkx_nodes(G, pos, ax=ax, node_color=node_colors, node_size=100 if large else 800, alpha=0.8)
+    if not large:
+        nx.draw_networkx_labels(G, pos, ax=ax, labels={node: node for node in G.nodes()}, font_size=8)
+
+    # Draw edges with different colors based on relationship
+    for rel_type, color in EDGE_COLORS.items():
+        rel_edges = [(u, v) for u, v, d in G.edges(data=True) if d.get("relationship") == rel_type]
+        if rel_edges:
+            # Arrow heads are one patch per edge; large graphs get a single line collection
+            if large:
+                nx.draw_networkx_edges(G, pos, ax=ax, edgelist=rel_edges, edge_color=color, arrows=False, width=0.5, alpha=0.7)
+            else:
+                nx.draw_networkx_edges(G, pos, ax=ax, edgelist=rel_edges, edge_color=color, arrows=True,
+                                       arrowsize=15, width=1.5, alpha=0.7)
+
+    # Add legend
+    node_legend_elements = [
+        Line2D([0], [0], marker='o', color='w', markerfacecolor=NODE_COLORS[t], markersize=10, label=label)
+        for t, label in NODE_LABELS.items()
+    ]
+    edge_legend_elements = [Line2D([0], [0], color=color, lw=2, label=rel) for rel, color in EDGE_COLORS.items()]
+    ax.legend(handles=node_legend_elements + edge_legend_elements, loc='upper right')
+
+    ax.set_title("Verilog Specification Knowledge Graph")
+    ax.axis("off")
+    fig.tight_layout()
+    fig.savefig(filename, dpi=min(dpi, MAX_IMAGE_PIXELS / max(figsize)), bbox_inches="tight")
+    return filename
+
+
+def render_in_background(G, filename: str, **kwargs) -> Future:
+    """
+    Render a graph in a background thread and return the future of its file name.
+
+    Renders run one at a time in their own thread, off the pipeline's critical path. The
+    graph is copied first, so the caller can keep using it.
+    """
+    global _render_executor
+    if _render_executor is None:
+        _render_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="graph-render")
+    return _render_executor.submit(render_graph, G.copy(), filename, **kwargs)
@@ -0,0 +1,69 @@
+import hashlib
+import json
+import os
+from typing import Any, Optional
+
+from prompts import *
+from utils import load_checkpoint, save_checkpoint
+
+
+STAGES = ['spec2plan', 'plan2graph', 'graph2tasks', 'generate_rtl', 'verify_rtl']
+
+# Prompt templates that shape the output of each stage
+STAGE_PROMPTS = {
+    'spec2plan': [PLANNER_SYSTEM_MESSAGE, PLAN_REVIEWER_SYSTEM_MESSAGE, PLANNER_PROMPT],
+    'plan2graph': [ENTITY_EXTRACT_PROMPT, RELATIONSHIP_EXTRACT_PROMPT, GRAPH_LINK_PROMPT],
+    'graph2tasks': [PLAN_EXTRACT_PROMPT],
+    'generate_rtl': [RTL_DESIGNER_SYSTEM_MESSAGE, RTL_REVIEWER_SYSTEM_MESSAGE, RTL_DESIGNER_PROMPT],
+    'verify_rtl': [RTL_DEBUGGER_SYSTEM_MESSAGE, RTL_DEBUGGER_PROMPT, TB_DESIGNER_SYSTEM_MESSAGE,
+                   TB_REVIEWER_SYSTEM_MESSAGE, TB_DESIGNER_EXAMPLES, TB_DESIGNER_PROMPT],
+}
+
+# Stages driven by langchain use CHAT_MODEL, the AG2 ones the LLM_CONFIG file
+LANGCHAIN_STAGES = ['plan2graph', 'graph2tasks']
+
+
+def model_config(stage: str, llm_config_path: str = "LLM_CONFIG") -> str:
+    """The model settings a stage runs with, without API keys"""
+    if stage in LANGCHAIN_STAGES:
+        return os.environ.get('CHAT_MODEL', '')
+    try:
+        with open(llm_config_path, 'r') as f:
+            config = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return ''
+    entries = config if isinstance(config, list) else [config]
+    return json.dumps([{k: v for k, v in entry.items() if k != 'api_key'} for entry in entries if isinstance(entry, dict)],
+                      sort_keys=True)
+
+
+def _canonical(value: Any) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, sort_keys=True)
+
+
+def stage_inputs_hash(stage: str, *inputs: Any, llm_config_path: str = "LLM_CONFIG") -> str:
+    """
+    Hash everything a stage's output depends on: its inputs (spec, upstream artifacts),
+    its prompt templates and its model configuration.
+    """
+    h = hashlib.sha256()
+    for part in [stage, model_config(stage, llm_config_path), *STAGE_PROMPTS[stage], *map(_canonical, inputs)]:
+        data = part.encode('utf-8')
+        h.update(len(data).to_bytes(8, 'little'))
+        h.update(data)
+    return h.hexdigest()
+
+
+def stage_is_current(stage: str, digest: str, spec_id: Optional[str] = None) -> bool:
+    """Whether the checkpoints of a stage were produced from inputs with this hash"""
+    recorded = load_checkpoint(f'{stage}.hash', spec_id)
+    return recorded is not None and recorded.strip() == digest
+
+
+def record_stage_hash(stage: str, digest: str, spec_id: Optional[str] = None) -> None:
+    """Store the input hash next to the checkpoints of a stage, once they are saved"""
+    save_checkpoint(digest + '\n', f'{stage}.hash', spec_id)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import random
+import time
+
+from graph2tasks import PlanRelations, get_plan_relationships
+from utils import VerilogKnowledgeGraph
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Benchmark the knowledge graph queries on synthetic graphs')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 20000],
+                        help='Approximate number of nodes of each synthetic graph')
+    parser.add_argument('--depth', type=int, default=3, help='BFS depth of the plan relationships')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the graph generator')
+    parser.add_argument('--summary', default='./checkpoints/kg_benchmark.md', help='Path of the result table')
+    return parser.parse_args()
+
+
+def synthetic_graph(num_nodes, seed=42):
+    """
+    A plan2graph-shaped graph of about num_nodes nodes: plans implementing a few signals each,
+    signals with FSM states and examples. Signals are shared between plans and states between
+    signals, like the control signals of a real spec.
+    """
+    rng = random.Random(seed)
+    num_plans = max(1, num_nodes // 10)
+    num_signals = max(1, num_nodes * 4 // 10)
+    num_states = max(1, num_nodes * 2 // 10)
+    num_examples = max(1, num_nodes - num_plans - num_signals - num_states)
+
+    data = {
+        'plans': [{'name': f'plan_{i}', 'description': f'Step {i} of the design'} for i in range(num_plans)],
+        'signals': [{'name': f'sig_{i}', 'description': f'Signal {i}'} for i in range(num_signals)],
+        'fsm_states': [{'name': f'S{i}', 'description': f'State {i}'} for i in range(num_states)],
+        'signal_examples': [{'name': f'ex_{i}', 'description': f'Example {i}'} for i in range(num_examples)],
+    }
+    connections = {
+        'plans': [{'name': p['name'], 'signals': [f'sig_{rng.randrange(num_signals)}' for _ in range(8)]}
+                  for p in data['plans']],
+        'signals': [{'name': s['name'],
+                     'fsm_states': [f'S{rng.randrange(num_states)}' for _ in range(2)],
+                     'examples': [f'ex_{rng.randrange(num_examples)}' for _ in range(2)]}
+                    for s in data['signals']],
+    }
+    kg = VerilogKnowledgeGraph(data, connections)
+    kg.build_graph()
+    return kg
+
+
+def legacy_plan_relationships(kg, plan_name, depth=3):
+    """get_plan_relationships as it was before the graph indexes: per-node edge queries, list dedup"""
+    levels = [[{'source': 'root', 'target': plan_name, 'relationship': ''}]]
+    for _ in range(depth):
+        levels.append([{'source': rel['target'], 'target': target, 'relationship': attrs['relationship']}
+                       for rel in levels[-1] for _, target, attrs in kg.G.out_edges(rel['target'], data=True)])
+
+    plan_relations = PlanRelations()
+    for level in levels:
+        for relationship in level:
+            target_node = relationship['target']
+            if not target_node or target_node not in kg.G.nodes:
+                continue
+            node_type = kg.G.nodes[target_node].get('type', 'unknown')
+            formatted_info = f"{target_node}: {kg.G.nodes[target_node].get('description')}"
+            if node_type == 'plan':
+                plan_relations.plan = formatted_info
+            elif node_type == 'signal' and formatted_info not in plan_relations.signals:
+                plan_relations.signals.append(formatted_info)
+            elif node_type == 'fsm_state' and formatted_info not in plan_relations.fsm_states:
+                plan_relations.fsm_states.append(formatted_info)
+            elif node_type == 'example' and formatted_info not in plan_relations.examples:
+                plan_relations.examples.append(formatted_info)
+    return plan_relations
+
+
+def legacy_list_entities(kg, entity_type):
+    return [{'name': node, 'description': attrs.get('description', '')}
+            for node, attrs in kg.G.nodes(data=True) if attrs.get('type') == entity_type]
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def benchmark_graph(kg, depth):
+    """
+    Time what graph2tasks and tasks2rtl do with a graph, before and after the indexes:
+    one entity listing per plan, the relationships of every plan, and a second pass over
+    the plans (served by the memoized neighborhoods).
+
+    Returns:
+        dict with the timings and whether both versions produced the same relations
+    """
+    plans = [item['name'] for item in kg.query_graph('list_entities', entity_type='plan')]
+    _, legacy_list = timed(lambda: [legacy_list_entities(kg, 'signal') for _ in range(len(plans) // 10 or 1)])
+    _, indexed_list = timed(lambda: [kg.query_graph('list_entities', entity_type='signal') for _ in range(len(plans) // 10 or 1)])
+
+    legacy, legacy_time = timed(lambda: [legacy_plan_relationships(kg, p, depth) for p in plans])
+    kg.invalidate_index()
+    indexed, indexed_time = timed(lambda: [get_plan_relationships(kg, p, depth) for p in plans])
+    _, memoized_time = timed(lambda: [get_plan_relationships(kg, p, depth) for p in plans])
+
+    return {
+        'nodes': kg.G.number_of_nodes(),
+        'edges': kg.G.number_of_edges(),
+        'legacy_list': legacy_list,
+        'indexed_list': indexed_list,
+        'legacy_relations': legacy_time,
+        'indexed_relations': indexed_time,
+        'memoized_relations': memoized_time,
+        'same': [r.model_dump() for r in legacy] == [r.model_dump() for r in indexed],
+    }
+
+
+def format_summary(results):
+    """Format the benchmark results as a markdown table"""
+    lines = [
+        "| Nodes | Edges | List scan (s) | List indexed (s) | Relations legacy (s) | Relations indexed (s) | Relations memoized (s) | Same result |",
+        "|---|---|---|---|---|---|---|---|"
+    ]
+    for r in results:
+        lines.append(f"| {r['nodes']} | {r['edges']} | {r['legacy_list']:.4f} | {r['indexed_list']:.4f} | "
+                     f"{r['legacy_relations']:.3f} | {r['indexed_relations']:.3f} | {r['memoized_relations']:.3f} | {r['same']} |")
+    return "\n".join(lines)
+
+
+def main():
+    args = parse_arguments()
+
+    results = []
+    for size in args.sizes:
+        kg, build_time = timed(lambda: synthetic_graph(size, args.seed))
+        result = benchmark_graph(kg, args.depth)
+        print(f"{result['nodes']} nodes (built in {build_time:.2f} s): relations {result['legacy_relations']:.3f} s -> "
+              f"{result['indexed_relations']:.3f} s ({result['memoized_relations']:.3f} s memoized), same: {result['same']}")
+        results.append(result)
+
+    summary = format_summary(results)
+    os.makedirs(os.path.dirname(args.summary) or '.', exist_ok=True)
+    with open(args.summary, 'w') as f:
+        f.write(summary + "\n")
+
+    print()
+    print(summary)
+    print(f"Summary written to: {args.summary}")
+    return 0 if all(r['same'] for r in results) else 1
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,175 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+
+class ResponseCache:
+    """
+    Persistent LLM response cache shared by the AG2 agents and the langchain calls.
+
+    Responses are pickled into a single SQLite file keyed by a hash of the model, request
+    parameters and full message list. Entries expire after ttl_seconds and the least recently
+    used entries are dropped once more than max_entries are stored.
+
+    The get/set/close/context-manager methods implement AG2's cache protocol, so an instance
+    can be passed as `cache=` to `initiate_chat` or assigned to an agent's `client_cache`.
+    """
+
+    def __init__(self, path: str = "./.llm_cache.db", ttl_seconds: Optional[float] = None, max_entries: int = 100000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        """Hash request parts into a fixed-size key"""
+        h = hashlib.sha256()
+        for part in parts:
+            data = part.encode("utf-8")
+            h.update(len(data).to_bytes(8, "little"))
+            h.update(data)
+        return h.hexdigest()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the cached response for key, or default on a miss or expired entry"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return default
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return pickle.loads(row[0])
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a response and evict the least recently used entries over max_entries"""
+        now = time.time()
+        blob = pickle.dumps(value)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, blob, now, now)
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY accessed ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        """Hit/miss counters of this process"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def close(self) -> None:
+        # The cache is shared by every stage of a run, so closing is left to process exit
+        pass
+
+    def __enter__(self) -> "ResponseCache":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[ResponseCache]:
+    """
+    Return the process-wide response cache, or None if caching is not enabled.
+
+    The cache is opt-in: set LLM_CACHE_PATH to the SQLite file to use. LLM_CACHE_TTL_HOURS
+    and LLM_CACHE_MAX_ENTRIES configure eviction.
+    """
+    global _llm_cache
+    path = os.environ.get("LLM_CACHE_PATH")
+    if not path:
+        return None
+    with _llm_cache_lock:
+        if _llm_cache is None or _llm_cache.path != path:
+            ttl_hours = os.environ.get("LLM_CACHE_TTL_HOURS")
+            _llm_cache = ResponseCache(
+                path,
+                ttl_seconds=float(ttl_hours) * 3600 if ttl_hours else None,
+                max_entries=int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "100000"))
+            )
+    return _llm_cache
+
+
+def apply_llm_cache(*agents) -> Optional[ResponseCache]:
+    """Make the given AG2 agents answer repeated requests from the response cache"""
+    cache = get_llm_cache()
+    if cache is not None:
+        for agent in agents:
+            agent.client_cache = cache
+    return cache
+
+
+def init_cached_chat_model(model: Optional[str] = None):
+    """
+    Create a langchain chat model (CHAT_MODEL by default) that uses the response cache.
+
+    Structured-output calls are covered too, since the bound tool schema is part of the
+    llm_string langchain hands to the cache.
+    """
+    from langchain.chat_models import init_chat_model
+
+    model = model or os.environ.get('CHAT_MODEL')
+    cache = get_llm_cache()
+    if cache is None:
+        return init_chat_model(model)
+    return init_chat_model(model, cache=_langchain_cache(cache))
+
+
+def _langchain_cache(cache: ResponseCache):
+    """Wrap a ResponseCache in langchain's BaseCache interface"""
+    from langchain_core.caches import BaseCache
+
+    class LangchainResponseCache(BaseCache):
+        def lookup(self, prompt: str, llm_string: str):
+            return cache.get(ResponseCache.make_key("langchain", llm_string, prompt))
+
+        def update(self, prompt: str, llm_string: str, return_val) -> None:
+            cache.set(ResponseCache.make_key("langchain", llm_string, prompt), return_val)
+
+        def clear(self, **kwargs: Any) -> None:
+            cache.clear()
+
+    return LangchainResponseCache()
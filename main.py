@@ -1,11 +1,11 @@
-from spec2plan import spec2plan
-from plan2graph import plan2graph
-from graph2tasks import graph2tasks
-from tasks2rtl import generate_rtl
-from verify_rtl import verify_rtl
 import os
 import argparse
-from utils import VerilogKnowledgeGraph, save_checkpoint, load_checkpoint, ensure_checkpoint_dir
+from utils import VerilogKnowledgeGraph, save_checkpoint, load_checkpoint
+from llm_cache import get_llm_cache
+from metrics import collect_metrics
+from incremental import STAGES, stage_inputs_hash, stage_is_current, record_stage_hash
+from events import EVENT_BACKENDS, make_event_backend, use_event_backend
+from dataset import get_dataset_index
 
 
 def parse_arguments():
@@ -13,17 +13,49 @@ def parse_arguments():
     parser = argparse.ArgumentParser(description='RTL Generation Pipeline with Checkpoints')
     parser.add_argument('--spec-id', required=True,
                         help='Unique identifier for the specification (used for checkpoint directory)')
-    parser.add_argument('--start-from', choices=['spec2plan', 'plan2graph', 'graph2tasks', 'generate_rtl', 'verify_rtl'],
-                        help='Start pipeline from specified checkpoint stage')
+    parser.add_argument('--start-from', choices=STAGES,
+                        help='Start pipeline from specified checkpoint stage (default: re-run only stages whose inputs changed)')
     parser.add_argument('--spec-file', help='Path to spec file to use as input')
     parser.add_argument('--testbench-file', help='Path to testbench file for verification')
     parser.add_argument('--reference-file', help='Path to reference file for verification')
     parser.add_argument('--use-dataset-tb', action='store_true', help='Whether to use tb from dataset')
+    parser.add_argument('--dataset-dir', default='./verilog-eval-v2',
+                        help='Dataset to look up the spec, testbench and reference of --spec-id in when they are not given')
+    parser.add_argument('--events', choices=EVENT_BACKENDS, default='none',
+                        help='Where agent/tool messages go: dropped (none) or appended to a JSONL log (jsonl)')
+    parser.add_argument('--events-file', help='Path of the JSONL event log (default: work/<spec-id>/events.jsonl)')
     return parser.parse_args()
 
-def main():
-    args = parse_arguments()
-    spec_id = args.spec_id
+def run_pipeline(spec_id, spec_file=None, testbench_file=None, reference_file=None, start_from=None, use_dataset_tb=False):
+    """
+    Run the RTL generation pipeline for a single specification.
+
+    Args:
+        spec_id: Unique identifier for the specification (work/checkpoint directory name)
+        spec_file: Path to spec file to use as input
+        testbench_file: Path to testbench file for verification
+        reference_file: Path to reference file for verification
+        start_from: Stage to start the pipeline from (None re-runs only the stages whose input hash changed)
+        use_dataset_tb: Whether to use the testbench and reference RTL from the dataset
+
+    Returns:
+        True/False for a passing/failing RTL, None if the pipeline could not run
+    """
+    with collect_metrics() as metrics:
+        is_pass = _run_stages(spec_id, spec_file, testbench_file, reference_file, start_from, use_dataset_tb)
+
+    # Per-stage/per-agent tokens, LLM and tool time and swarm rounds of this run
+    print(f"Metrics written to: {save_checkpoint(metrics.report(), 'metrics.json', spec_id)}")
+    return is_pass
+
+
+def _run_stages(spec_id, spec_file, testbench_file, reference_file, start_from, use_dataset_tb):
+    """
+    Run (or reuse) every pipeline stage, see run_pipeline.
+
+    Stage modules are imported when their stage runs, so reused stages don't pay for loading
+    autogen, langchain or networkx.
+    """
     spec = None
     work_dir = f"./work/{spec_id}"
 
@@ -31,98 +63,145 @@ def main():
         os.makedirs(work_dir)
 
     # If starting from the beginning and spec file is provided, load and save it to checkpoint
-    if args.spec_file and os.path.exists(args.spec_file):
-        with open(args.spec_file, 'r') as f:
+    if spec_file and os.path.exists(spec_file):
+        with open(spec_file, 'r') as f:
             spec = f.read()
         # Save spec to checkpoint for future runs
         save_checkpoint(spec, 'spec.txt', spec_id)
     else:
         # Try to load spec from checkpoint if not provided
         spec = load_checkpoint('spec.txt', spec_id)
-        if spec is None and args.start_from != 'generate_rtl':  # Only generate_rtl might not need the original spec
+        if spec is None and start_from != 'generate_rtl':  # Only generate_rtl might not need the original spec
             print(f"Error: No spec file provided and no spec checkpoint found for {spec_id}")
-            return
+            return None
+
+    def reuse(stage, digest):
+        """Stages before --start-from are loaded, later ones re-run; otherwise only changed inputs re-run"""
+        if start_from is not None:
+            return STAGES.index(stage) < STAGES.index(start_from)
+        if stage_is_current(stage, digest, spec_id):
+            print(f"Inputs of {stage} unchanged, reusing its checkpoint")
+            return True
+        return False
 
     #try:
     # Step 1: spec2plan
-    if args.start_from in [None, 'spec2plan']:
+    digest = stage_inputs_hash('spec2plan', spec)
+    plan = load_checkpoint('plan.json', spec_id) if reuse('spec2plan', digest) else None
+    if plan is None:
         if spec is None:
             print("Error: Cannot run spec2plan without a specification")
-            return
+            return None
         print("Running spec2plan...")
+        from spec2plan import spec2plan
         plan = spec2plan(spec)
         save_checkpoint(plan, 'plan.json', spec_id)
-    else:
-        # Load plan from checkpoint
-        plan = load_checkpoint('plan.json', spec_id)
-        if plan is None:
-            print(f"Error: Could not load plan checkpoint for {spec_id}")
-            return
+        record_stage_hash('spec2plan', digest, spec_id)
 
     # Step 2: plan2graph
-    if args.start_from in [None, 'spec2plan', 'plan2graph']:
+    digest = stage_inputs_hash('plan2graph', spec, plan)
+    graph_data = load_checkpoint('graph.json', spec_id) if reuse('plan2graph', digest) else None
+    # A reused graph is only rebuilt if a later stage runs
+    graph = None
+    if not graph_data or not graph_data['nodes']:
         print("Running plan2graph...")
+        from plan2graph import plan2graph
         graph = plan2graph(spec, plan)
-        graph.export_graph(filename=os.path.join(ensure_checkpoint_dir(spec_id), 'graph.json'))
-    else:
-        graph_path = os.path.join(ensure_checkpoint_dir(spec_id), 'graph.json')
-        graph = VerilogKnowledgeGraph.load_from_json(graph_path)
-        if not graph or not hasattr(graph, 'G') or graph.G.number_of_nodes() == 0:
-            print(f"Error: Could not load graph checkpoint from {graph_path}")
-            return
+        graph_data = graph.export_graph(filename=None)
+        save_checkpoint(graph_data, 'graph.json', spec_id)
+        record_stage_hash('plan2graph', digest, spec_id)
 
     # Step 3: graph2tasks
-    if args.start_from in [None, 'spec2plan', 'plan2graph', 'graph2tasks']:
+    digest = stage_inputs_hash('graph2tasks', spec, graph_data)
+    tasks = load_checkpoint('tasks.json', spec_id) if reuse('graph2tasks', digest) else None
+    if tasks is None:
         print("Running graph2tasks...")
+        from graph2tasks import graph2tasks
+        graph = graph or VerilogKnowledgeGraph.from_dict(graph_data)
         tasks = graph2tasks(spec, graph)
         save_checkpoint(tasks, 'tasks.json', spec_id)
-    else:
-        tasks = load_checkpoint('tasks.json', spec_id)
-        if tasks is None:
-            print(f"Error: Could not load tasks checkpoint for {spec_id}")
-            return
+        record_stage_hash('graph2tasks', digest, spec_id)
 
     # Step 4: generate_rtl
-    if args.start_from in [None, 'spec2plan', 'plan2graph', 'graph2tasks', 'generate_rtl']:
+    digest = stage_inputs_hash('generate_rtl', spec, tasks, graph_data)
+    code, interface = None, None
+    if reuse('generate_rtl', digest):
+        code = load_checkpoint('TopModule_int.v', spec_id)
+        interface = load_checkpoint('interface.v', spec_id)
+    if code is None:
         print("Running generate_rtl...")
-        code, interface = generate_rtl(spec, tasks, work_dir)
+        from tasks2rtl import generate_rtl
+        graph = graph or VerilogKnowledgeGraph.from_dict(graph_data)
+        code, interface = generate_rtl(spec, tasks, work_dir, graph=graph)
         save_checkpoint(code, 'TopModule_int.v', spec_id)
         save_checkpoint(interface, 'interface.v', spec_id)
-    else:
-        code = load_checkpoint('TopModule_int.v', spec_id)
-        interface = load_checkpoint('interface.v', spec_id)
-        if code is None:
-            print(f"Error: Could not load code checkpoint for {spec_id}")
-            return
+        record_stage_hash('generate_rtl', digest, spec_id)
 
-    if args.use_dataset_tb:
+    if use_dataset_tb:
         print("Using the TB form dataset...")
-        if not os.path.exists(args.testbench_file):
-            print(f"Error: Testbench file not found at {args.testbench_file}")
-            return
-        if not os.path.exists(args.reference_file ):
-            print(f"Error: Reference file not found at {args.reference_file }")
-            return
-        with open(args.testbench_file, "r") as f:
+        if not os.path.exists(testbench_file):
+            print(f"Error: Testbench file not found at {testbench_file}")
+            return None
+        if not os.path.exists(reference_file):
+            print(f"Error: Reference file not found at {reference_file}")
+            return None
+        with open(testbench_file, "r") as f:
             tb_code = f.read()
-        reference_rtl_path = args.reference_file
+        with open(reference_file, "r") as f:
+            ref_code = f.read()
+        reference_rtl_path = reference_file
     else:
         tb_code = ""
+        ref_code = ""
         reference_rtl_path = ""
 
     # Step 5: verify_rtl
-    print("Running verify_rtl...")
-    is_pass, code, tb = verify_rtl(spec, code, interface, reference_rtl_path, tb_code, args.use_dataset_tb, work_dir)
-    save_checkpoint(tb, 'tb.v', spec_id)
-    if is_pass:
-        save_checkpoint(code, 'TopModule.v', spec_id)
+    digest = stage_inputs_hash('verify_rtl', spec, code, interface, tb_code, ref_code, use_dataset_tb)
+    result = load_checkpoint('verify_result.json', spec_id) if reuse('verify_rtl', digest) else None
+    # Only a pass is final, a failed verification gets another try
+    if result is not None and result.get('is_pass'):
+        is_pass = True
     else:
-        save_checkpoint(code, 'TopModule_buggy.v', spec_id)
+        print("Running verify_rtl...")
+        from verify_rtl import verify_rtl
+        is_pass, code, tb = verify_rtl(spec, code, interface, reference_rtl_path, tb_code, use_dataset_tb, work_dir)
+        save_checkpoint(tb, 'tb.v', spec_id)
+        if is_pass:
+            save_checkpoint(code, 'TopModule.v', spec_id)
+        else:
+            save_checkpoint(code, 'TopModule_buggy.v', spec_id)
+        save_checkpoint({'is_pass': is_pass}, 'verify_result.json', spec_id)
+        record_stage_hash('verify_rtl', digest, spec_id)
+
+    llm_cache = get_llm_cache()
+    if llm_cache is not None:
+        print(f"LLM response cache: {llm_cache.stats()}")
 
+    return is_pass
     #except Exception as e:
     #    print(f"Error in RTL generation pipeline: {str(e)}")
 
 
+def main():
+    args = parse_arguments()
+
+    # Dataset problems only need their ID, the index knows their files
+    if args.use_dataset_tb and not (args.testbench_file and args.reference_file):
+        problem = get_dataset_index(args.dataset_dir).get(args.spec_id)
+        if problem is None:
+            print(f"Error: No problem {args.spec_id} in {args.dataset_dir}")
+            return 1
+        args.spec_file = args.spec_file or problem.prompt_path
+        args.testbench_file = args.testbench_file or problem.test_path
+        args.reference_file = args.reference_file or problem.ref_path
+
+    events_file = args.events_file or os.path.join(f"./work/{args.spec_id}", 'events.jsonl')
+    with use_event_backend(make_event_backend(args.events, events_file)):
+        run_pipeline(args.spec_id, args.spec_file, args.testbench_file, args.reference_file,
+                     args.start_from, args.use_dataset_tb)
+    return 0
+
+
 if __name__ == '__main__':
-    main()
+    exit(main())
 
@@ -0,0 +1,178 @@
+import json
+import os
+import re
+from typing import Any, Optional
+
+_tokenizer_available = True
+
+
+def count_tokens(text: str) -> int:
+    """Token count of text (tiktoken when its encodings are available, else ~4 characters per token)"""
+    global _tokenizer_available
+    if _tokenizer_available:
+        try:
+            from autogen.token_count_utils import count_token
+            return count_token(text)
+        except Exception:
+            # Encodings are downloaded on first use, which fails offline
+            _tokenizer_available = False
+    return len(text) // 4 + 1
+
+
+_CODE_BLOCK_RE = re.compile(r"```.*?(```|$)", re.DOTALL)
+
+
+def _is_tool_response(message: dict) -> bool:
+    return message.get("role") == "tool" or bool(message.get("tool_responses"))
+
+
+def _message_tokens(message: dict) -> int:
+    text = str(message.get("content") or "")
+    if message.get("tool_calls"):
+        text += json.dumps(message["tool_calls"])
+    if message.get("tool_responses") and not message.get("content"):
+        text += "".join(str(r.get("content") or "") for r in message["tool_responses"])
+    return count_tokens(text)
+
+
+def _brief(text: Any, limit: int = 160) -> str:
+    """One line of text with code blocks elided"""
+    text = _CODE_BLOCK_RE.sub("[code]", str(text or ""))
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+def _submitted_code(message: dict) -> Optional[str]:
+    """Verilog passed to a tool by a message's tool call, if any"""
+    for tool_call in message.get("tool_calls") or []:
+        try:
+            arguments = json.loads(tool_call["function"]["arguments"])
+        except (json.JSONDecodeError, KeyError, TypeError):
+            continue
+        if isinstance(arguments, dict) and arguments.get("completed_verilog"):
+            return arguments["completed_verilog"]
+    return None
+
+
+def _shorten(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    half = max_chars // 2
+    return f"{text[:half]}\n...[{len(text) - max_chars} characters cut]...\n{text[-half:]}"
+
+
+class CondensedHistory:
+    """
+    AG2 message transform that bounds an agent's prompt in long debugging chats.
+
+    The first message (the task with spec, code and testbench) and the last keep_turns messages
+    are kept verbatim; the messages in between become one summary message with a line per
+    turn (speaker, tool called, head of the text) and the latest Verilog submitted to a tool.
+    If the prompt is still above max_tokens, long outputs in the verbatim part are cut to
+    their head and tail, then the oldest summary lines are dropped. Tool calls and their
+    responses are never separated. The first message, the latest one and the system message
+    (handled by AG2) are always kept whole, so they can exceed the cap on their own.
+    """
+
+    def __init__(self, max_tokens: int, keep_turns: int = 6):
+        self.max_tokens = max_tokens
+        self.keep_turns = keep_turns
+
+    def _tail_start(self, messages: list) -> int:
+        start = max(1, len(messages) - self.keep_turns)
+        # A tool response must stay after the message that called the tool
+        while start > 1 and _is_tool_response(messages[start]):
+            start -= 1
+        return start
+
+    def _summary_lines(self, messages: list) -> list:
+        lines = []
+        for message in messages:
+            speaker = message.get("name") or message.get("role", "")
+            code = _submitted_code(message)
+            if code:
+                names = ", ".join(c["function"]["name"] for c in message["tool_calls"])
+                lines.append(f"- {speaker} submitted {len(code.splitlines())} lines of Verilog to {names}")
+            elif message.get("tool_calls"):
+                calls = ", ".join(
+                    f"{c['function']['name']}({_brief(c['function'].get('arguments'), 80)})"
+                    for c in message["tool_calls"]
+                )
+                lines.append(f"- {speaker} called {calls}")
+            elif _is_tool_response(message):
+                lines.append(f"- tool result: {_brief(message.get('content'))}")
+            elif message.get("content"):
+                lines.append(f"- {speaker}: {_brief(message['content'])}")
+        return lines
+
+    def apply_transform(self, messages: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        total = sum(_message_tokens(m) for m in messages)
+        if total <= self.max_tokens:
+            return messages
+
+        start = self._tail_start(messages)
+        head, middle, tail = messages[:1], messages[1:start], messages[start:]
+
+        code = None
+        if middle and not any(_submitted_code(m) for m in tail):
+            code = next((c for c in map(_submitted_code, reversed(middle)) if c), None)
+
+        lines = self._summary_lines(middle)
+
+        def summary_message(lines):
+            content = f"[Summary of {len(middle)} earlier messages]\n" + "\n".join(lines)
+            if code:
+                content += f"\n\nLatest submitted code:\n```verilog\n{code}\n```"
+            return {"role": "user", "content": content}
+
+        tail = list(tail)
+        total = sum(_message_tokens(m) for m in head + tail) + (_message_tokens(summary_message(lines)) if middle else 0)
+        # Too long: first cut the long outputs of older verbatim messages (the latest one stays whole) ...
+        for message in tail[:-1]:
+            if total <= self.max_tokens:
+                break
+            before = _message_tokens(message)
+            if isinstance(message.get("content"), str):
+                message["content"] = _shorten(message["content"], 2000)
+            for response in message.get("tool_responses") or []:
+                if isinstance(response.get("content"), str):
+                    response["content"] = _shorten(response["content"], 2000)
+            total -= before - _message_tokens(message)
+
+        if not middle:
+            return head + tail
+
+        # ... then drop the oldest summary lines
+        summary = summary_message(lines)
+        budget = self.max_tokens - sum(_message_tokens(m) for m in head + tail)
+        while lines and _message_tokens(summary) > budget:
+            lines = lines[1:]
+            summary = summary_message(lines)
+        return head + [summary] + tail
+
+    def get_logs(self, pre_transform_messages: list[dict[str, Any]],
+                 post_transform_messages: list[dict[str, Any]]) -> tuple[str, bool]:
+        pre = sum(_message_tokens(m) for m in pre_transform_messages)
+        post = sum(_message_tokens(m) for m in post_transform_messages)
+        if post < pre:
+            return f"Condensed chat history from {pre} to {post} tokens.", True
+        return "No history condensed.", False
+
+
+def apply_memory_policy(*agents) -> Optional[CondensedHistory]:
+    """
+    Bound the LLM prompt of the given AG2 agents with a CondensedHistory.
+
+    Opt-in: MEMORY_MAX_TOKENS sets the token cap of the chat history (the system message
+    comes on top), MEMORY_KEEP_TURNS the number of latest messages kept verbatim (default 6).
+    """
+    max_tokens = int(os.environ.get("MEMORY_MAX_TOKENS", "0"))
+    if not max_tokens:
+        return None
+
+    from autogen.agentchat.contrib.capabilities.transform_messages import TransformMessages
+
+    policy = CondensedHistory(max_tokens, int(os.environ.get("MEMORY_KEEP_TURNS", "6")))
+    for agent in agents:
+        TransformMessages(transforms=[policy], verbose=False).add_to_agent(agent)
+    return policy
@@ -0,0 +1,235 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Optional
+
+
+def _entry() -> dict:
+    return {
+        "wall_time": 0.0,
+        "llm_time": 0.0,
+        "llm_calls": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "tool_time": 0.0,
+        "tool_calls": 0,
+        "rounds": 0,
+    }
+
+
+class RunMetrics:
+    """
+    Token, latency and round counters of one pipeline run.
+
+    Everything is charged to a stage (spec2plan ... verify_rtl, generate_tb) and, where known,
+    to the agent that spent it. LLM/tool time is the wall time of the calls themselves;
+    stage wall time includes everything, and generate_tb runs nested inside verify_rtl.
+    Tool-level runs (iverilog, vvp, VCD tracing, checkpoint I/O) are broken out per stage as well.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self.stages = defaultdict(_entry)
+        self.stage_agents = defaultdict(lambda: defaultdict(_entry))
+        self.stage_tools = defaultdict(lambda: defaultdict(lambda: {"calls": 0, "time": 0.0}))
+
+    def _charge(self, stage: Optional[str], agent: Optional[str], **amounts: Any) -> None:
+        stage = stage or "other"
+        with self._lock:
+            targets = [self.stages[stage]] + ([self.stage_agents[stage][agent]] if agent else [])
+            for target in targets:
+                for key, value in amounts.items():
+                    target[key] += value
+
+    def record_stage(self, stage: str, seconds: float) -> None:
+        self._charge(stage, None, wall_time=seconds)
+
+    def record_llm(self, stage: Optional[str], agent: Optional[str], seconds: float,
+                   prompt_tokens: int = 0, completion_tokens: int = 0) -> None:
+        self._charge(stage, agent, llm_time=seconds, llm_calls=1,
+                     prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+    def record_tool_call(self, stage: Optional[str], agent: Optional[str], seconds: float) -> None:
+        self._charge(stage, agent, tool_time=seconds, tool_calls=1)
+
+    def record_tool_run(self, stage: Optional[str], tool: str, seconds: float) -> None:
+        with self._lock:
+            entry = self.stage_tools[stage or "other"][tool]
+            entry["calls"] += 1
+            entry["time"] += seconds
+
+    def record_rounds(self, stage: Optional[str], messages: list) -> None:
+        """Count the messages of a finished (swarm) chat as rounds of the stage and of each speaker"""
+        self._charge(stage, None, rounds=len(messages))
+        with self._lock:
+            for message in messages:
+                if message.get("name"):
+                    self.stage_agents[stage or "other"][message["name"]]["rounds"] += 1
+
+    def report(self) -> dict:
+        """Machine-readable report of the run"""
+        with self._lock:
+            stages = {}
+            agents = defaultdict(_entry)
+            totals = _entry()
+            # Tool runs outside any stage (e.g. checkpoint I/O) still get a stage entry
+            for stage in dict.fromkeys([*self.stages, *self.stage_tools]):
+                entry = self.stages[stage]
+                stages[stage] = dict(entry)
+                stages[stage]["agents"] = {name: dict(a) for name, a in self.stage_agents[stage].items()}
+                stages[stage]["tools"] = {name: dict(t) for name, t in self.stage_tools[stage].items()}
+                for name, a in self.stage_agents[stage].items():
+                    for key, value in a.items():
+                        agents[name][key] += value
+                for key in ("llm_time", "llm_calls", "prompt_tokens", "completion_tokens", "tool_time", "tool_calls", "rounds"):
+                    totals[key] += entry[key]
+            totals["wall_time"] = time.time() - self.started
+            return {"started": self.started, "totals": totals, "stages": stages, "agents": dict(agents)}
+
+
+_current_metrics = contextvars.ContextVar("run_metrics", default=None)
+_current_stage = contextvars.ContextVar("metrics_stage", default=None)
+
+
+def get_metrics() -> Optional[RunMetrics]:
+    return _current_metrics.get()
+
+
+def current_stage() -> Optional[str]:
+    return _current_stage.get()
+
+
+@contextlib.contextmanager
+def collect_metrics():
+    """Record the metrics of everything run inside the block"""
+    metrics = RunMetrics()
+    token = _current_metrics.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current_metrics.reset(token)
+
+
+def timed_stage(stage: str):
+    """Decorator charging a stage function's wall time (and everything it records) to stage"""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                token = _current_stage.set(stage)
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    _current_stage.reset(token)
+                    if get_metrics() is not None:
+                        get_metrics().record_stage(stage, time.perf_counter() - start)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            token = _current_stage.set(stage)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _current_stage.reset(token)
+                if get_metrics() is not None:
+                    get_metrics().record_stage(stage, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+@contextlib.contextmanager
+def timed_tool_run(tool: str):
+    """Time a tool-level run (iverilog, vvp, VCD tracing, checkpoint I/O) for the current stage"""
+    metrics = get_metrics()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.record_tool_run(current_stage(), tool, time.perf_counter() - start)
+
+
+def instrument_tool(func, agent: str, metrics: Optional[RunMetrics], stage: Optional[str]):
+    """Wrap an agent's tool function so its wall time is charged to the agent"""
+    if metrics is None:
+        return func
+
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                metrics.record_tool_call(stage, agent, time.perf_counter() - start)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            metrics.record_tool_call(stage, agent, time.perf_counter() - start)
+    return wrapper
+
+
+def usage_tokens(usage_summary: Optional[dict]) -> tuple[int, int]:
+    """(prompt, completion) tokens of an AG2 usage summary"""
+    prompt = completion = 0
+    for value in (usage_summary or {}).values():
+        if isinstance(value, dict):
+            prompt += value.get("prompt_tokens", 0)
+            completion += value.get("completion_tokens", 0)
+    return prompt, completion
+
+
+def record_chat(chat_result) -> None:
+    """Count the messages of a finished chat as rounds of the current stage"""
+    metrics = get_metrics()
+    if metrics is not None and chat_result is not None:
+        metrics.record_rounds(current_stage(), chat_result.chat_history)
+
+
+def langchain_config(agent: str) -> Optional[dict]:
+    """Runnable config that charges a langchain call's latency and tokens to agent"""
+    metrics = get_metrics()
+    if metrics is None:
+        return None
+    return {"callbacks": [_langchain_handler(metrics, current_stage(), agent)]}
+
+
+def _langchain_handler(metrics: RunMetrics, stage: Optional[str], agent: str):
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class MetricsCallbackHandler(BaseCallbackHandler):
+        run_inline = True
+
+        def __init__(self):
+            self.starts = {}
+
+        def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+            self.starts[run_id] = time.perf_counter()
+
+        def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+            self.starts[run_id] = time.perf_counter()
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            start = self.starts.pop(run_id, None)
+            prompt = completion = 0
+            for generations in response.generations:
+                for generation in generations:
+                    usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    prompt += usage.get("input_tokens", 0)
+                    completion += usage.get("output_tokens", 0)
+            metrics.record_llm(stage, agent, time.perf_counter() - start if start else 0.0, prompt, completion)
+
+    return MetricsCallbackHandler()
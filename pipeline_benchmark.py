@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from dataset import get_dataset_index
+from simulators import get_simulator
+from stub_llm import STUB_MODEL, ScriptedLLM, StubLLMServer
+
+# A small slice of verilog-eval-v2: combinational, counters, FSMs and the two longest simulations
+DEFAULT_PROBLEMS = [
+    'Prob004_vector2', 'Prob009_popcount3', 'Prob035_count1to10', 'Prob093_ece241_2014_q3',
+    'Prob121_2014_q3bfsm', 'Prob128_fsm_ps2', 'Prob144_conwaylife', 'Prob153_gshare',
+]
+
+STAGE_ORDER = ['spec2plan', 'plan2graph', 'graph2tasks', 'generate_rtl', 'verify_rtl', 'generate_tb', 'other']
+
+# Seconds per stage that are compared against the baseline
+REGRESSION_METRICS = ['non_llm', 'orchestration', 'compile', 'sim', 'vcd_trace', 'checkpoint_io']
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Time the non-LLM work of every pipeline stage against a local stub LLM')
+    parser.add_argument('problems', nargs='*', default=DEFAULT_PROBLEMS,
+                        help='Problem IDs or glob patterns (default: a slice of eight representative problems)')
+    parser.add_argument('--dataset-dir', default='./verilog-eval-v2', help='Directory holding the dataset problems')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs of the whole slice (the fastest run of each stage is kept)')
+    parser.add_argument('--no-debug-first', action='store_true',
+                        help='Submit the reference right away in verify_rtl instead of first debugging a broken DUT')
+    parser.add_argument('--baseline', help='Results JSON of an earlier commit to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Relative slowdown that counts as a regression')
+    parser.add_argument('--min-seconds', type=float, default=0.05, help='Absolute slowdown below which nothing counts as a regression')
+    parser.add_argument('--output', default='./checkpoints/pipeline_benchmark.json', help='Path of the results JSON')
+    parser.add_argument('--summary', default='./checkpoints/pipeline_benchmark.md', help='Path of the result table')
+    parser.add_argument('--keep-work', action='store_true', help='Keep the scratch directory of the runs')
+    return parser.parse_args()
+
+
+def git_commit():
+    """Short hash of the checked out commit, None outside a git checkout"""
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def use_stub_llm(base_url, work_dir):
+    """Point both LLM clients (AG2 through LLM_CONFIG, langchain through CHAT_MODEL) at the stub"""
+    with open(os.path.join(work_dir, 'LLM_CONFIG'), 'w') as f:
+        json.dump([{'api_type': 'openai', 'model': STUB_MODEL, 'api_key': 'stub', 'base_url': base_url}], f, indent=4)
+    os.environ.update({
+        'CHAT_MODEL': f'openai:{STUB_MODEL}',
+        'OPENAI_API_KEY': 'stub',
+        'OPENAI_BASE_URL': base_url,
+        'OPENAI_API_BASE': base_url,
+        # Every run does its own compiles and simulations
+        'SIM_CACHE_DIR': '',
+    })
+    os.environ.pop('LLM_CACHE_PATH', None)
+    # A CI proxy must not intercept the local endpoint
+    os.environ['NO_PROXY'] = ','.join(filter(None, [os.environ.get('NO_PROXY'), '127.0.0.1', 'localhost']))
+
+
+def stage_times(report, simulator):
+    """Seconds of each stage of a metrics report, split into LLM and non-LLM work"""
+    times = {}
+    for stage, entry in report['stages'].items():
+        tools = entry.get('tools', {})
+
+        def tool(name):
+            return tools.get(name, {}).get('time', 0.0)
+
+        non_llm = max(0.0, entry['wall_time'] - entry['llm_time'])
+        times[stage] = {
+            'wall': entry['wall_time'],
+            'llm': entry['llm_time'],
+            'non_llm': non_llm,
+            # Swarm turns, prompt building, graph building: everything but the LLM and the tools
+            'orchestration': max(0.0, non_llm - entry['tool_time']),
+            'compile': tool(simulator.compile_tool),
+            'sim': tool(simulator.run_tool),
+            'vcd_trace': tool('vcd_trace'),
+            'checkpoint_io': tool('checkpoint_read') + tool('checkpoint_write'),
+            'llm_calls': entry['llm_calls'],
+            'rounds': entry['rounds'],
+        }
+    return times
+
+
+def run_problem(problem):
+    """Run the whole pipeline on a problem with the dataset testbench, in the current directory"""
+    from main import run_pipeline
+    from utils import load_checkpoint
+
+    spec_id = f"bench_{problem.problem_id}"
+    start = time.perf_counter()
+    is_pass = run_pipeline(spec_id, problem.prompt_path, problem.test_path, problem.ref_path,
+                           start_from='spec2plan', use_dataset_tb=True)
+    wall_time = time.perf_counter() - start
+    return {'problem_id': problem.problem_id, 'passed': bool(is_pass), 'wall_time': wall_time,
+            'stages': stage_times(load_checkpoint('metrics.json', spec_id), get_simulator())}
+
+
+def total_stages(runs):
+    """Per-stage sums over the problems of one run of the slice"""
+    stages = {}
+    for run in runs:
+        for stage, times in run['stages'].items():
+            totals = stages.setdefault(stage, {})
+            for metric, value in times.items():
+                totals[metric] = totals.get(metric, 0) + value
+    return stages
+
+
+def fastest(slices):
+    """Per stage and metric, the lowest time over repeated runs of the slice"""
+    stages = {}
+    for stages_of_run in slices:
+        for stage, times in stages_of_run.items():
+            best = stages.setdefault(stage, dict(times))
+            for metric, value in times.items():
+                best[metric] = min(best[metric], value)
+    return stages
+
+
+def find_regressions(results, baseline, threshold, min_seconds):
+    """Stage timings that got slower than the baseline by more than threshold and min_seconds"""
+    regressions = []
+    for stage, times in results['stages'].items():
+        before = baseline['stages'].get(stage)
+        if before is None:
+            continue
+        for metric in REGRESSION_METRICS:
+            old, new = before.get(metric, 0.0), times.get(metric, 0.0)
+            if new - old > min_seconds and new > old * (1 + threshold):
+                change = f"+{(new - old) / old * 100:.0f}%" if old else "new"
+                regressions.append(f"{stage} {metric}: {old:.3f} s -> {new:.3f} s ({change})")
+    return regressions
+
+
+def format_summary(results, baseline=None):
+    """Format the benchmark results as a markdown table (with the baseline's non-LLM time if given)"""
+    lines = [
+        f"Commit {results['commit'] or '-'}, {results['simulator']}, {len(results['problems'])} problems, "
+        f"fastest of {results['repeat']} run(s)",
+        "",
+        "| Stage | Wall (s) | Stub LLM (s) | Non-LLM (s) | Orchestration (s) | Compile (s) | Sim (s) | VCD trace (s) "
+        "| Checkpoint I/O (s) | LLM calls | Rounds |" + (" Baseline non-LLM (s) |" if baseline else ""),
+        "|---|---|---|---|---|---|---|---|---|---|---|" + ("---|" if baseline else ""),
+    ]
+    stages = results['stages']
+    for stage in sorted(stages, key=lambda s: STAGE_ORDER.index(s) if s in STAGE_ORDER else len(STAGE_ORDER)):
+        t = stages[stage]
+        line = (f"| {stage} | {t['wall']:.3f} | {t['llm']:.3f} | {t['non_llm']:.3f} | {t['orchestration']:.3f} | "
+                f"{t['compile']:.3f} | {t['sim']:.3f} | {t['vcd_trace']:.3f} | {t['checkpoint_io']:.3f} | "
+                f"{t['llm_calls']:.0f} | {t['rounds']:.0f} |")
+        if baseline:
+            before = baseline['stages'].get(stage)
+            line += f" {before['non_llm']:.3f} |" if before else " - |"
+        lines.append(line)
+
+    lines.append("")
+    lines.append(f"{sum(r['passed'] for r in results['runs'])}/{len(results['runs'])} passed, "
+                 f"{sum(r['wall_time'] for r in results['runs']):.1f} s in total")
+    return "\n".join(lines)
+
+
+def main():
+    args = parse_arguments()
+
+    index = get_dataset_index(os.path.abspath(args.dataset_dir))
+    problems = [index.get(problem_id) for problem_id in index.select(args.problems)]
+    simulator = get_simulator()
+    if not simulator.available():
+        print(f"Error: {simulator.compile_tool} not found, the benchmark needs the simulator")
+        return 1
+    if not problems:
+        print("Error: Nothing to benchmark")
+        return 1
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if baseline['problems'] != [p.problem_id for p in problems] or baseline['simulator'] != simulator.name:
+            print(f"Error: {args.baseline} covers other problems or another simulator, the timings are not comparable")
+            return 1
+
+    output, summary_path = os.path.abspath(args.output), os.path.abspath(args.summary)
+    cwd = os.getcwd()
+    work_dir = tempfile.mkdtemp(prefix='pipeline_benchmark_')
+    slices, runs = [], []
+    with StubLLMServer(ScriptedLLM(problems, debug_first=not args.no_debug_first)) as server:
+        use_stub_llm(server.base_url, work_dir)
+        # Checkpoints, work directories and LLM_CONFIG of the runs stay in the scratch directory
+        os.chdir(work_dir)
+        try:
+            for i in range(args.repeat):
+                runs = []
+                for problem in problems:
+                    run = run_problem(problem)
+                    print(f"[{i + 1}/{args.repeat}] {problem.problem_id}: {run['wall_time']:.2f} s, passed: {run['passed']}")
+                    runs.append(run)
+                slices.append(total_stages(runs))
+        finally:
+            os.chdir(cwd)
+            if not args.keep_work:
+                shutil.rmtree(work_dir, ignore_errors=True)
+        print(f"Stub LLM answered {server.requests} requests")
+
+    results = {
+        'commit': git_commit(),
+        'simulator': simulator.name,
+        'problems': [p.problem_id for p in problems],
+        'repeat': args.repeat,
+        'stages': fastest(slices),
+        'runs': runs,
+    }
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    summary = format_summary(results, baseline)
+    os.makedirs(os.path.dirname(summary_path) or '.', exist_ok=True)
+    with open(summary_path, 'w') as f:
+        f.write(summary + "\n")
+
+    print()
+    print(summary)
+    print(f"Results written to: {output}")
+    print(f"Summary written to: {summary_path}")
+    if args.keep_work:
+        print(f"Runs kept in: {work_dir}")
+
+    failed = [r['problem_id'] for r in runs if not r['passed']]
+    if failed:
+        print(f"Error: The pipeline failed on {', '.join(failed)} with the scripted replies")
+        return 1
+    if baseline is not None:
+        regressions = find_regressions(results, baseline, args.threshold, args.min_seconds)
+        if regressions:
+            print(f"Regressions against {baseline.get('commit') or args.baseline}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"No regressions against {baseline.get('commit') or args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -1,15 +1,154 @@
-from langchain.chat_models import init_chat_model
 from typing import Optional
 from pydantic import BaseModel, Field
 import json
 from utils import VerilogKnowledgeGraph
+from llm_cache import init_cached_chat_model
+from metrics import timed_stage, langchain_config
 from prompts import *
 import os
 
 
+# Define entity models
+class Entity(BaseModel):
+    """An named entity with a description."""
+    name: str = Field(description="A unique name of the entity")
+    description: str = Field(description="The description/example of the entity")
+
+class Entities(BaseModel):
+    """A class which represents all the extracted entities from a design specification."""
+    signals: Optional[list[Entity]] = Field(description="List of signal entities")
+    fsm_states: Optional[list[Entity]] = Field(default=None, description="List of fsm_state entities")
+    signal_examples: Optional[list[Entity]] = Field(default=None, description="List signal example entities")
+
+
+# Relationship models
+class Plan(BaseModel):
+    """Plan containing name, description and related signals."""
+    name: str = Field(description="The name of the plan")
+    signals: Optional[list[str]] = Field(default=None, description="The list signal names implemented/declared by the plan")
+
+class Signal(BaseModel):
+    """Signal containing name, influencing fsm_states and related examples."""
+    name: str = Field(description="The name of the signal")
+    fsm_states: Optional[list[str]] = Field(default=None, description="The list of fsm_state names impacting the signal")
+    examples: Optional[list[str]] = Field(default=None, description="The list signal_example names which provides examples of the signal")
+
+class Relationships(BaseModel):
+    """A class which defines the relationships among entities."""
+    plans: list[Plan] = Field(description="List of plans")
+    signals: list[Signal] = Field(description="List of signals")
+
+
+# Single-call models: the entities together with their links
+class LinkedSignal(Entity):
+    """Signal entity with its influencing fsm_states and related examples."""
+    fsm_states: Optional[list[str]] = Field(default=None, description="The list of fsm_state names impacting the signal")
+    examples: Optional[list[str]] = Field(default=None, description="The list signal_example names which provides examples of the signal")
+
+class GraphExtraction(BaseModel):
+    """All the entities extracted from a design specification and their relationships to the plans."""
+    plans: list[Plan] = Field(description="List of plans with the signals they implement")
+    signals: list[LinkedSignal] = Field(description="List of signal entities with their fsm_states and examples")
+    fsm_states: Optional[list[Entity]] = Field(default=None, description="List of fsm_state entities")
+    signal_examples: Optional[list[Entity]] = Field(default=None, description="List signal example entities")
+
+
+def _merge_entities(plans: list[dict], entities: Entities) -> str:
+    """Merge plans with extracted entities into a single JSON structure"""
+    full_json = {
+        "plans": plans,
+        "signals": entities.model_dump().get("signals", []),
+        "fsm_states": entities.model_dump().get("fsm_states", []),
+        "signal_examples": entities.model_dump().get("signal_examples", [])
+    }
+    return json.dumps(full_json, indent=2)
+
+
+def _build_graph(full_json: str, relationships: Relationships) -> VerilogKnowledgeGraph:
+    """Create and build the knowledge graph"""
+    relationships_json = relationships.model_dump_json(indent=2)
+    graph = VerilogKnowledgeGraph(full_json, relationships_json)
+    graph.build_graph()
+    # graph.visualize_graph()
+    return graph
+
+
+def plan2graph_mode() -> str:
+    """PLAN2GRAPH_MODE: 'single' (default) extracts entities and relationships in one LLM call, 'two-call' in two"""
+    mode = os.environ.get('PLAN2GRAPH_MODE', 'single')
+    if mode not in ('single', 'two-call'):
+        raise ValueError(f"PLAN2GRAPH_MODE must be 'single' or 'two-call', not {mode!r}")
+    return mode
+
+
+def _single_call_prompt(spec: str, plans: list[dict]) -> str:
+    return ENTITY_EXTRACT_PROMPT.format(spec=spec) + GRAPH_LINK_PROMPT.format(plans=json.dumps(plans, indent=2))
+
+
+def check_extraction(extraction: Optional[GraphExtraction], plans: list[dict]) -> list[str]:
+    """
+    Referential integrity problems of a single-call extraction: missing or duplicate names
+    (they would drop or merge graph nodes), links from unknown plans or signals and links to
+    entities that were not extracted. Plans without links are fine, they just implement no signal.
+    """
+    if extraction is None:
+        return ["no structured output"]
+
+    problems = []
+    names = {}
+    for kind, items in (('plan', plans), ('signal', extraction.signals),
+                        ('fsm_state', extraction.fsm_states or []), ('signal_example', extraction.signal_examples or [])):
+        for item in items:
+            name = item.get('name') if isinstance(item, dict) else item.name
+            if not name:
+                problems.append(f"a {kind} has no name")
+                continue
+            if name in names:
+                problems.append(f"{kind} '{name}' has the name of a {names[name]}")
+            names.setdefault(name, kind)
+
+    def check_links(owner, kind, targets):
+        for target in targets or []:
+            if names.get(target) != kind:
+                problems.append(f"{owner} links to unknown {kind} '{target}'")
+
+    for plan in extraction.plans:
+        if names.get(plan.name) != 'plan':
+            problems.append(f"links of unknown plan '{plan.name}'")
+        check_links(f"plan '{plan.name}'", 'signal', plan.signals)
+    for signal in extraction.signals:
+        check_links(f"signal '{signal.name}'", 'fsm_state', signal.fsm_states)
+        check_links(f"signal '{signal.name}'", 'signal_example', signal.examples)
+    return problems
+
+
+def _split_extraction(extraction: GraphExtraction) -> tuple[Entities, Relationships]:
+    """The entities and relationships of a single-call extraction, as the two-call path returns them"""
+    entities = Entities(
+        signals=[Entity(name=s.name, description=s.description) for s in extraction.signals],
+        fsm_states=extraction.fsm_states,
+        signal_examples=extraction.signal_examples
+    )
+    relationships = Relationships(
+        plans=extraction.plans,
+        signals=[Signal(name=s.name, fsm_states=s.fsm_states, examples=s.examples) for s in extraction.signals]
+    )
+    return entities, relationships
+
+
+def _fallback_reason(problems: list[str]) -> str:
+    more = f" and {len(problems) - 3} more" if len(problems) > 3 else ""
+    return "; ".join(problems[:3]) + more
+
+
+@timed_stage('plan2graph')
 def plan2graph(spec: str, plans: list[dict]) -> VerilogKnowledgeGraph:
     """
     Creates a knowledge graph from a Verilog design description and plans.
+
+    In single mode one LLM call extracts the entities with their relationships. If that
+    output fails the referential integrity check, the entities and the relationships are
+    extracted in two calls, which is also what two-call mode always does.
     
     Args:
         spec (str): The design description
@@ -19,56 +158,56 @@ def plan2graph(spec: str, plans: list[dict]) -> VerilogKnowledgeGraph:
         nx.DiGraph: The generated knowledge graph
     """
     # Initialize LLM
-    llm = init_chat_model(os.environ.get('CHAT_MODEL'))
-    
-    # Define entity models
-    class Entity(BaseModel):
-        """An named entity with a description."""
-        name: str = Field(description="A unique name of the entity")
-        description: str = Field(description="The description/example of the entity")
-
-    class Entities(BaseModel):
-        """A class which represents all the extracted entities from a design specification."""
-        signals: Optional[list[Entity]] = Field(description="List of signal entities")
-        fsm_states: Optional[list[Entity]] = Field(default=None, description="List of fsm_state entities")
-        signal_examples: Optional[list[Entity]] = Field(default=None, description="List signal example entities")
+    llm = init_cached_chat_model()
+
+    if plan2graph_mode() == 'single':
+        try:
+            extraction = llm.with_structured_output(GraphExtraction).invoke(
+                _single_call_prompt(spec, plans), config=langchain_config('graph_extractor')
+            )
+            problems = check_extraction(extraction, plans)
+        except ValueError as e:
+            problems = [f"invalid output: {e}"]
+        if not problems:
+            entities, relationships = _split_extraction(extraction)
+            return _build_graph(_merge_entities(plans, entities), relationships)
+        print(f"Single-call graph extraction failed validation ({_fallback_reason(problems)}), extracting in two calls...")
 
     # Extract entities from description
-    entities = llm.with_structured_output(Entities).invoke(ENTITY_EXTRACT_PROMPT.format(spec=spec))
-    
-    # Merge plans with extracted entities into a single structure
-    full_json = {
-        "plans": plans,
-        "signals": entities.model_dump().get("signals", []),
-        "fsm_states": entities.model_dump().get("fsm_states", []),
-        "signal_examples": entities.model_dump().get("signal_examples", [])
-    }
-    full_json = json.dumps(full_json, indent=2)
-    
-    # Extract relationships
-    class Plan(BaseModel):
-        """Plan containing name, description and related signals."""
-        name: str = Field(description="The name of the plan")
-        signals: Optional[list[str]] = Field(default=None, description="The list signal names implemented/declared by the plan")
-
-    class Signal(BaseModel):
-        """Signal containing name, influencing fsm_states and related examples."""
-        name: str = Field(description="The name of the signal")
-        fsm_states: Optional[list[str]] = Field(default=None, description="The list of fsm_state names impacting the signal")
-        examples: Optional[list[str]] = Field(default=None, description="The list signal_example names which provides examples of the signal")
-
-    class Relationships(BaseModel):
-        """A class which defines the relationships among entities."""
-        plans: list[Plan] = Field(description="List of plans")
-        signals: list[Signal] = Field(description="List of signals")
+    entities = llm.with_structured_output(Entities).invoke(ENTITY_EXTRACT_PROMPT.format(spec=spec), config=langchain_config('entity_extractor'))
+    full_json = _merge_entities(plans, entities)
 
+    # Extract relationships
     relationships = llm.with_structured_output(Relationships).invoke(
-        RELATIONSHIP_EXTRACT_PROMPT.format(json_struct=full_json)
+        RELATIONSHIP_EXTRACT_PROMPT.format(json_struct=full_json),
+        config=langchain_config('relationship_extractor')
     )
-    relationships_json = relationships.model_dump_json(indent=2)
-    
-    # Create and build the knowledge graph
-    graph = VerilogKnowledgeGraph(full_json, relationships_json)
-    graph.build_graph()
-    # graph.visualize_graph()
-    return graph
+    return _build_graph(full_json, relationships)
+
+
+@timed_stage('plan2graph')
+async def a_plan2graph(spec: str, plans: list[dict]) -> VerilogKnowledgeGraph:
+    """Async version of plan2graph that awaits the LLM calls on the event loop."""
+    llm = init_cached_chat_model()
+
+    if plan2graph_mode() == 'single':
+        try:
+            extraction = await llm.with_structured_output(GraphExtraction).ainvoke(
+                _single_call_prompt(spec, plans), config=langchain_config('graph_extractor')
+            )
+            problems = check_extraction(extraction, plans)
+        except ValueError as e:
+            problems = [f"invalid output: {e}"]
+        if not problems:
+            entities, relationships = _split_extraction(extraction)
+            return _build_graph(_merge_entities(plans, entities), relationships)
+        print(f"Single-call graph extraction failed validation ({_fallback_reason(problems)}), extracting in two calls...")
+
+    entities = await llm.with_structured_output(Entities).ainvoke(ENTITY_EXTRACT_PROMPT.format(spec=spec), config=langchain_config('entity_extractor'))
+    full_json = _merge_entities(plans, entities)
+
+    relationships = await llm.with_structured_output(Relationships).ainvoke(
+        RELATIONSHIP_EXTRACT_PROMPT.format(json_struct=full_json),
+        config=langchain_config('relationship_extractor')
+    )
+    return _build_graph(full_json, relationships)
@@ -129,6 +129,20 @@ You are a Verilog RTL design expert with experience in determining the relations
 """
 
 
+GRAPH_LINK_PROMPT="""
+[Plans]
+```json
+{plans}
+```
+
+[Relationships]
+Together with the entities, determine the relationships between the plans above and the entities you extract by following the numbered steps below. Only refer to the names of these plans and of the extracted entities.
+1. For each plan, determine which signals it implements/declares based on their descriptions. A single plan can implement multiple signals. If the plan doesn't implement any signal, leave it empty.
+2. For each signal, determine which fsm_states are influencing it based on their descriptions. A signal can be influenced by multiple fsm_states. If the signal doesn't gets impacted by any fsm_state, leave it empty.
+3. For each signal, determine if they have an example provided in the signal_examples list. A signal can have multiple examples. If the signal doesn't have any example, leave it empty.
+"""
+
+
 PLAN_EXTRACT_PROMPT="""
 You are a Verilog RTL designer. You make a final plan draft for the designing a digital block. You will be provided with the description of the module along with a JSON structure containing a list of initial plan draft along with its relationships catagorized as `signals`, `fsm_states` and `examples. This json structure is retireved from a Knowledge Graph database representing the possible relationships of signals, fsm_states and example to the plan. 
 
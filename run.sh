@@ -18,26 +18,12 @@ if [ $# -ge 2 ]; then
     START_FROM="--start-from $2"
 fi
 
-# Construct the file paths based on problem ID
-SPEC_FILE="./verilog-eval-v2/${PROBLEM_ID}_prompt.txt"
-TESTBENCH_FILE="./verilog-eval-v2/${PROBLEM_ID}_test.sv"
-REFERENCE_FILE="./verilog-eval-v2/${PROBLEM_ID}_ref.sv"
-
-# Check if the files exist
-if [ ! -f "$SPEC_FILE" ]; then
-    echo "Error: Specification file not found: $SPEC_FILE"
-    exit 1
-fi
-
-if [ ! -f "$TESTBENCH_FILE" ]; then
-    echo "Error: Testbench file not found: $TESTBENCH_FILE"
-    exit 1
-fi
-
-if [ ! -f "$REFERENCE_FILE" ]; then
-    echo "Error: Reference file not found: $REFERENCE_FILE"
+# Look up the problem's spec, testbench and reference in the dataset index
+if ! PATHS=$(python dataset.py paths "$PROBLEM_ID"); then
+    echo "$PATHS"
     exit 1
 fi
+eval "$PATHS"
 
 # Run the Python script with the constructed file paths
 echo "Running for problem: $PROBLEM_ID"
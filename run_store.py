@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, List, Optional
+
+
+# Pipeline stage that produces each checkpoint artifact
+ARTIFACT_STAGES = {
+    'spec.txt': 'input',
+    'plan.json': 'spec2plan',
+    'graph.json': 'plan2graph',
+    'tasks.json': 'graph2tasks',
+    'TopModule_int.v': 'generate_rtl',
+    'interface.v': 'generate_rtl',
+    'tb.v': 'verify_rtl',
+    'tb.sv': 'verify_rtl',
+    'TopModule.v': 'verify_rtl',
+    'TopModule_buggy.v': 'verify_rtl',
+    'verify_result.json': 'verify_rtl',
+    'metrics.json': 'report',
+}
+
+
+def artifact_stage(name: str) -> str:
+    if name in ARTIFACT_STAGES:
+        return ARTIFACT_STAGES[name]
+    if name.endswith('.hash'):
+        return name[:-len('.hash')]
+    return 'other'
+
+
+class RunStore:
+    """
+    Single-file SQLite store of pipeline checkpoints.
+
+    Every saved artifact is a row indexed by problem, stage and run, so one file replaces the
+    checkpoints/<spec_id>/ tree and queries across thousands of runs don't touch the file
+    system. Each write is its own transaction, and WAL mode lets parallel batch workers write
+    while others read. Loading an artifact returns the latest version saved for the problem,
+    like overwriting a checkpoint file did.
+    """
+
+    def __init__(self, path: str = "./checkpoints/runs.db", run_id: Optional[str] = None):
+        self.path = path
+        self.run_id = run_id or os.environ.get('RUN_ID') or f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS artifacts ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " problem_id TEXT NOT NULL, stage TEXT NOT NULL, run_id TEXT NOT NULL,"
+            " name TEXT NOT NULL, data TEXT NOT NULL, created REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS artifacts_latest ON artifacts(problem_id, name, id);"
+            "CREATE INDEX IF NOT EXISTS artifacts_stage ON artifacts(stage, problem_id);"
+            "CREATE INDEX IF NOT EXISTS artifacts_run ON artifacts(run_id, problem_id);"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _encode(name: str, data: Any) -> str:
+        return json.dumps(data) if name.endswith('.json') else data
+
+    @staticmethod
+    def _decode(name: str, data: str) -> Any:
+        return json.loads(data) if name.endswith('.json') else data
+
+    def put(self, problem_id: str, name: str, data: Any, run_id: Optional[str] = None, created: Optional[float] = None) -> None:
+        """Save an artifact (JSON-encoded for .json names) in its own transaction"""
+        row = (problem_id or '', artifact_stage(name), run_id or self.run_id, name,
+               self._encode(name, data), created or time.time())
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO artifacts (problem_id, stage, run_id, name, data, created) VALUES (?, ?, ?, ?, ?, ?)", row
+            )
+
+    def get(self, problem_id: str, name: str, run_id: Optional[str] = None) -> Any:
+        """Latest version of an artifact (of the given run, if any), None if it was never saved"""
+        query = "SELECT data FROM artifacts WHERE problem_id = ? AND name = ?"
+        params = [problem_id or '', name]
+        if run_id is not None:
+            query += " AND run_id = ?"
+            params.append(run_id)
+        with self._lock:
+            row = self._conn.execute(query + " ORDER BY id DESC LIMIT 1", params).fetchone()
+        return self._decode(name, row[0]) if row else None
+
+    def runs(self, problem_id: Optional[str] = None) -> List[dict]:
+        """Runs with their problem, number of artifacts and time span, newest first"""
+        query = ("SELECT run_id, problem_id, COUNT(*), MIN(created), MAX(created) FROM artifacts"
+                 + (" WHERE problem_id = ?" if problem_id else "")
+                 + " GROUP BY run_id, problem_id ORDER BY MAX(created) DESC")
+        with self._lock:
+            rows = self._conn.execute(query, (problem_id,) if problem_id else ()).fetchall()
+        return [{'run_id': r[0], 'problem_id': r[1], 'artifacts': r[2], 'started': r[3], 'finished': r[4]} for r in rows]
+
+    def artifacts(self, problem_id: str, stage: Optional[str] = None, run_id: Optional[str] = None) -> List[dict]:
+        """Artifact versions of a problem (without their data), oldest first"""
+        query = "SELECT name, stage, run_id, created, LENGTH(data) FROM artifacts WHERE problem_id = ?"
+        params = [problem_id]
+        if stage is not None:
+            query += " AND stage = ?"
+            params.append(stage)
+        if run_id is not None:
+            query += " AND run_id = ?"
+            params.append(run_id)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY id", params).fetchall()
+        return [{'name': r[0], 'stage': r[1], 'run_id': r[2], 'created': r[3], 'size': r[4]} for r in rows]
+
+    def import_checkpoints(self, base_dir: str = "./checkpoints") -> int:
+        """Copy an existing checkpoint tree into the store in one transaction, returns the number of files"""
+        rows = []
+        for problem_id in sorted(os.listdir(base_dir)):
+            problem_dir = os.path.join(base_dir, problem_id)
+            if not os.path.isdir(problem_dir):
+                continue
+            for name in sorted(os.listdir(problem_dir)):
+                path = os.path.join(problem_dir, name)
+                if not os.path.isfile(path) or not (name in ARTIFACT_STAGES or name.endswith('.hash')):
+                    continue
+                with open(path, 'r') as f:
+                    data = f.read()
+                if name.endswith('.json'):
+                    data = json.dumps(json.loads(data))
+                rows.append((problem_id, artifact_stage(name), 'import', name, data, os.path.getmtime(path)))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO artifacts (problem_id, stage, run_id, name, data, created) VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+        return len(rows)
+
+
+_run_store = None
+_run_store_lock = threading.Lock()
+
+
+def get_run_store() -> Optional[RunStore]:
+    """
+    Return the process-wide run store, or None to keep checkpoints as files.
+
+    Set CHECKPOINT_STORE to the SQLite file to use (e.g. ./checkpoints/runs.db).
+    """
+    global _run_store
+    path = os.environ.get('CHECKPOINT_STORE')
+    if not path:
+        return None
+    with _run_store_lock:
+        if _run_store is None or _run_store.path != path:
+            _run_store = RunStore(path)
+    return _run_store
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Inspect or fill the SQLite checkpoint store')
+    parser.add_argument('--db', default=os.environ.get('CHECKPOINT_STORE', './checkpoints/runs.db'),
+                        help='Path of the SQLite store')
+    sub = parser.add_subparsers(dest='command', required=True)
+    imp = sub.add_parser('import', help='Import a checkpoints/<spec_id>/ tree')
+    imp.add_argument('checkpoint_dir', nargs='?', default='./checkpoints')
+    runs = sub.add_parser('runs', help='List runs')
+    runs.add_argument('problem_id', nargs='?')
+    show = sub.add_parser('show', help='Print the latest version of an artifact')
+    show.add_argument('problem_id')
+    show.add_argument('name')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    store = RunStore(args.db)
+
+    if args.command == 'import':
+        print(f"Imported {store.import_checkpoints(args.checkpoint_dir)} checkpoint files into {args.db}")
+    elif args.command == 'runs':
+        for run in store.runs(args.problem_id):
+            print(f"{run['run_id']}  {run['problem_id']}  {run['artifacts']} artifacts  "
+                  f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(run['finished']))}")
+    elif args.command == 'show':
+        data = store.get(args.problem_id, args.name)
+        if data is None:
+            print(f"Error: No {args.name} saved for {args.problem_id}")
+            return 1
+        print(json.dumps(data, indent=2) if args.name.endswith('.json') else data)
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
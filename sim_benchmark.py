@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import time
+
+from batch_run import select_problems
+from metrics import collect_metrics
+from simulators import SIMULATORS, get_simulator
+from utils import VerilogToolKits
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Compare the simulator backends on the dataset testbenches')
+    parser.add_argument('problems', nargs='*', default=['Prob144_conwaylife', 'Prob153_gshare'],
+                        help='Problem IDs or glob patterns (default: the conwaylife and gshare problems)')
+    parser.add_argument('--dataset-dir', default='./verilog-eval-v2', help='Directory holding the dataset problems')
+    parser.add_argument('--simulators', nargs='+', choices=list(SIMULATORS), default=list(SIMULATORS),
+                        help='Backends to compare')
+    parser.add_argument('--work-dir', default='./work/sim_benchmark', help='Scratch directory of the simulations')
+    parser.add_argument('--summary', default='./checkpoints/sim_benchmark.md', help='Path of the result table')
+    return parser.parse_args()
+
+
+def reference_as_dut(ref_code):
+    """The reference solution renamed to TopModule, a passing DUT for the problem's testbench"""
+    return re.sub(r'\bmodule\s+RefModule\b', 'module TopModule', ref_code, count=1)
+
+
+def revised_dut(dut_code):
+    """
+    The DUT with a logic change that doesn't affect its outputs: a new public signal, which
+    Verilator keeps in the model, so the DUT's generated C++ really changes (a comment wouldn't)
+    """
+    top = re.search(r'\bmodule\s+TopModule\b', dut_code)
+    end = re.compile(r'\bendmodule\b').search(dut_code, top.end() if top else 0)
+    if end is None:
+        return dut_code
+    revision = "  logic bench_revision /*verilator public*/;\n  assign bench_revision = 1'b1;\n"
+    return dut_code[:end.start()] + revision + dut_code[end.start():]
+
+
+def ccache_stats():
+    """(hits, misses) of the ccache statistics, None without ccache (or one older than 4.0)"""
+    if not shutil.which('ccache'):
+        return None
+    try:
+        output = subprocess.run(['ccache', '--print-stats'], capture_output=True, text=True).stdout
+    except OSError:
+        return None
+    stats = dict(line.split('\t', 1) for line in output.splitlines() if '\t' in line)
+    try:
+        hits = int(stats.get('direct_cache_hit', 0)) + int(stats.get('preprocessed_cache_hit', 0))
+        return hits, int(stats['cache_miss'])
+    except (KeyError, ValueError):
+        return None
+
+
+def benchmark_problem(problem_id, dataset_dir, simulator, work_dir):
+    """
+    Simulate a problem's reference solution twice with one backend: a cold build and a
+    rebuild after a DUT-only logic change, which is what every repair iteration does.
+
+    Returns:
+        dict with the compile/run seconds of both builds, the ccache hits and misses of
+        each Verilator build (None without ccache) and whether both runs passed
+    """
+    with open(os.path.join(dataset_dir, f'{problem_id}_test.sv'), 'r') as f:
+        tb_code = f.read()
+    with open(os.path.join(dataset_dir, f'{problem_id}_ref.sv'), 'r') as f:
+        dut_code = reference_as_dut(f.read())
+
+    vtk = VerilogToolKits(os.path.join(work_dir, simulator.name, problem_id), simulator=simulator)
+    vtk.cache = None
+    vtk.load_ref_rtl_path(os.path.join(dataset_dir, f'{problem_id}_ref.sv'))
+    vtk.load_test_bench(tb_code)
+
+    result = {'problem_id': problem_id, 'simulator': simulator.name, 'passed': True}
+    for build, code in (('cold', dut_code), ('rebuild', revised_dut(dut_code))):
+        before = ccache_stats() if simulator.name == 'verilator' else None
+        with collect_metrics() as metrics:
+            start = time.perf_counter()
+            compile_pass, sim_pass, _ = vtk.verilog_simulation_tool(completed_verilog=code)
+            elapsed = time.perf_counter() - start
+        after = ccache_stats() if before is not None else None
+        result[f'{build}_ccache'] = [a - b for a, b in zip(after, before)] if after is not None else None
+        tools = metrics.report()['stages'].get('other', {}).get('tools', {})
+        result[f'{build}_compile'] = tools.get(simulator.compile_tool, {}).get('time', 0.0)
+        result[f'{build}_run'] = tools.get(simulator.run_tool, {}).get('time', 0.0)
+        result[f'{build}_total'] = elapsed
+        result['passed'] = result['passed'] and compile_pass and sim_pass
+    vtk.discard()
+    return result
+
+
+def format_summary(results):
+    """Format the benchmark results as a markdown table"""
+    lines = [
+        "| Problem | Simulator | Cold compile (s) | Cold run (s) | Rebuild compile (s) | Rebuild run (s) "
+        "| Rebuild ccache hits | Passed |",
+        "|---|---|---|---|---|---|---|---|"
+    ]
+    for r in results:
+        ccache = r['rebuild_ccache']
+        hits = f"{ccache[0]}/{ccache[0] + ccache[1]}" if ccache else "-"
+        lines.append(f"| {r['problem_id']} | {r['simulator']} | {r['cold_compile']:.2f} | {r['cold_run']:.2f} | "
+                     f"{r['rebuild_compile']:.2f} | {r['rebuild_run']:.2f} | {hits} | {r['passed']} |")
+
+    lines.append("")
+    for name in dict.fromkeys(r['simulator'] for r in results):
+        own = [r for r in results if r['simulator'] == name]
+        lines.append(f"{name}: {sum(r['cold_total'] for r in own):.1f} s cold, "
+                     f"{sum(r['rebuild_total'] for r in own):.1f} s per repair iteration, "
+                     f"{sum(r['passed'] for r in own)}/{len(own)} passed")
+    return "\n".join(lines)
+
+
+def main():
+    args = parse_arguments()
+
+    problem_ids = select_problems(args.problems, args.dataset_dir)
+    simulators = []
+    for name in args.simulators:
+        simulator = get_simulator(name)
+        if simulator.available():
+            simulators.append(simulator)
+        else:
+            print(f"Warning: {simulator.compile_tool} not found, skipping the {name} backend")
+    if not problem_ids or not simulators:
+        print("Error: Nothing to benchmark")
+        return 1
+
+    results = []
+    for problem_id in problem_ids:
+        for simulator in simulators:
+            result = benchmark_problem(problem_id, args.dataset_dir, simulator, args.work_dir)
+            print(f"{problem_id} [{simulator.name}]: cold {result['cold_total']:.2f} s, "
+                  f"rebuild {result['rebuild_total']:.2f} s, passed: {result['passed']}")
+            results.append(result)
+    shutil.rmtree(args.work_dir, ignore_errors=True)
+
+    summary = format_summary(results)
+    os.makedirs(os.path.dirname(args.summary) or '.', exist_ok=True)
+    with open(args.summary, 'w') as f:
+        f.write(summary + "\n")
+
+    print()
+    print(summary)
+    print(f"Summary written to: {args.summary}")
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Any, List, Optional
+
+
+class SimCache:
+    """
+    On-disk, content-addressed cache of compile and simulation results.
+
+    Each entry lives in <cache_dir>/<key[:2]>/<key>/ and holds result.json plus an optional
+    wave.vcd. Entries are written to a temporary directory and renamed into place, so
+    concurrent processes never see half-written results. The total size is capped and the
+    least recently used entries are evicted first. Eviction scans the whole cache, so it only
+    runs when the size this process tracks passes the cap, and every EVICT_INTERVAL puts to
+    account for entries other processes wrote.
+    """
+
+    RESULT_FILE = "result.json"
+    WAVE_FILE = "wave.vcd"
+    EVICT_INTERVAL = 100
+
+    def __init__(self, cache_dir: str = "./.sim_cache", max_bytes: int = 1024 * 1024 * 1024):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # Total size as of the last scan plus the entries put since, None before the first scan
+        self._size = None
+        self._puts = 0
+        # One cache is shared by the toolkits of parallel candidates and fragments
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> Optional["SimCache"]:
+        """
+        Create the cache configured by the environment.
+
+        SIM_CACHE_DIR sets the cache directory (default ./.sim_cache, empty disables the cache)
+        and SIM_CACHE_MAX_MB the size cap (default 1024).
+        """
+        cache_dir = os.environ.get("SIM_CACHE_DIR", "./.sim_cache")
+        if not cache_dir:
+            return None
+        max_mb = int(os.environ.get("SIM_CACHE_MAX_MB", "1024"))
+        return cls(cache_dir, max_mb * 1024 * 1024)
+
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        """Hash the tool name, sources and flags into a cache key"""
+        h = hashlib.sha256()
+        for part in parts:
+            data = (part or "").encode("utf-8")
+            # Length prefix keeps ("ab", "c") and ("a", "bc") apart
+            h.update(len(data).to_bytes(8, "little"))
+            h.update(data)
+        return h.hexdigest()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        Look up a cached result.
+
+        Returns:
+            dict with 'result' (the stored tool return value as a list) and 'wave'
+            (path of the cached waveform or None), or None on a miss
+        """
+        entry_dir = self._entry_dir(key)
+        result_path = os.path.join(entry_dir, self.RESULT_FILE)
+        try:
+            with open(result_path, "r") as f:
+                result = json.load(f)
+            # Touching the entry marks it as most recently used
+            os.utime(result_path)
+        except (OSError, json.JSONDecodeError):
+            self.misses += 1
+            return None
+
+        wave_path = os.path.join(entry_dir, self.WAVE_FILE)
+        self.hits += 1
+        return {
+            "result": result,
+            "wave": wave_path if os.path.exists(wave_path) else None
+        }
+
+    def put(self, key: str, result: List[Any], wave_path: Optional[str] = None) -> None:
+        """Store a result (and optionally its waveform) and evict old entries if over the cap"""
+        entry_dir = self._entry_dir(key)
+        if os.path.exists(entry_dir):
+            return
+
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=".tmp_", dir=os.path.dirname(entry_dir))
+        try:
+            with open(os.path.join(tmp_dir, self.RESULT_FILE), "w") as f:
+                json.dump(result, f)
+            if wave_path and os.path.exists(wave_path):
+                try:
+                    # A hard link avoids copying large dumps when the sandbox is on the same filesystem
+                    os.link(wave_path, os.path.join(tmp_dir, self.WAVE_FILE))
+                except OSError:
+                    shutil.copyfile(wave_path, os.path.join(tmp_dir, self.WAVE_FILE))
+            size = sum(f.stat().st_size for f in os.scandir(tmp_dir))
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # Another process stored the same key first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+
+        with self._lock:
+            self._puts += 1
+            if self._size is None or self._puts % self.EVICT_INTERVAL == 0:
+                self._evict()
+            else:
+                self._size += size
+                if self._size > self.max_bytes:
+                    self._evict()
+
+    def evict(self) -> None:
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        with self._lock:
+            self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        total = 0
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if not entry.is_dir() or entry.name.startswith("."):
+                    continue
+                try:
+                    size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                    last_used = os.stat(os.path.join(entry.path, self.RESULT_FILE)).st_mtime
+                except OSError:
+                    continue
+                entries.append((last_used, size, entry.path))
+                total += size
+
+        for last_used, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+        self._size = total
+
+
+_SIMULATOR_VERSIONS = {}
+
+
+def simulator_version(tool: str = "iverilog") -> str:
+    """Return the version banner of a simulator so cache keys change when the tool does"""
+    if tool not in _SIMULATOR_VERSIONS:
+        try:
+            out = subprocess.run([tool, "-V"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=30)
+            _SIMULATOR_VERSIONS[tool] = out.stdout.decode("utf-8", errors="replace").splitlines()[0]
+        except (OSError, IndexError, subprocess.TimeoutExpired):
+            _SIMULATOR_VERSIONS[tool] = f"{tool}-unknown-{time.time()}"
+    return _SIMULATOR_VERSIONS[tool]
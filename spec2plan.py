@@ -1,19 +1,13 @@
 from autogen import LLMConfig
-from utils import extract_json_from_markdown, ChainlitAssistantAgent
+from utils import extract_json_from_markdown
+from agents import ChainlitAssistantAgent
 from prompts import *
+from llm_cache import get_llm_cache
+from metrics import timed_stage, record_chat
 
 
-def spec2plan(spec: str, llm_config_path: str = "LLM_CONFIG") -> list[dict]:
-  """
-  Process a specification and generate a task list for RTL implementation.
-  
-  Args:
-    spec: String containing the RTL specification
-    llm_config_path: Path to LLM configuration file
-  
-  Returns:
-    list[dict] containing the planned tasks
-  """
+def _build_planner_agents(llm_config_path: str = "LLM_CONFIG"):
+  """Create the planner and plan reviewer agents"""
   llm_config = LLMConfig.from_json(path=llm_config_path)
   llm_config.cache_seed = None
 
@@ -36,15 +30,55 @@ def spec2plan(spec: str, llm_config_path: str = "LLM_CONFIG") -> list[dict]:
     llm_config=llm_config,
   )
 
-  plan_reviewer.initiate_chat(
-    recipient=planner,
-    message=PLANNER_PROMPT.format(spec=spec),
-    max_turns=10,
-    summary_method="last_msg"
-  )
+  return planner, plan_reviewer
+
 
+def _extract_tasks(planner, plan_reviewer) -> list[dict]:
   task_list= extract_json_from_markdown(
     plan_reviewer.chat_messages_for_summary(planner)[-2]['content']
   )
   
   return task_list['tasks'] if task_list is not None else []
+
+
+@timed_stage('spec2plan')
+def spec2plan(spec: str, llm_config_path: str = "LLM_CONFIG") -> list[dict]:
+  """
+  Process a specification and generate a task list for RTL implementation.
+  
+  Args:
+    spec: String containing the RTL specification
+    llm_config_path: Path to LLM configuration file
+  
+  Returns:
+    list[dict] containing the planned tasks
+  """
+  planner, plan_reviewer = _build_planner_agents(llm_config_path)
+
+  chat_result = plan_reviewer.initiate_chat(
+    recipient=planner,
+    message=PLANNER_PROMPT.format(spec=spec),
+    max_turns=10,
+    summary_method="last_msg",
+    cache=get_llm_cache()
+  )
+  record_chat(chat_result)
+
+  return _extract_tasks(planner, plan_reviewer)
+
+
+@timed_stage('spec2plan')
+async def a_spec2plan(spec: str, llm_config_path: str = "LLM_CONFIG") -> list[dict]:
+  """Async version of spec2plan that awaits LLM calls and UI messages on the event loop."""
+  planner, plan_reviewer = _build_planner_agents(llm_config_path)
+
+  chat_result = await plan_reviewer.a_initiate_chat(
+    recipient=planner,
+    message=PLANNER_PROMPT.format(spec=spec),
+    max_turns=10,
+    summary_method="last_msg",
+    cache=get_llm_cache()
+  )
+  record_chat(chat_result)
+
+  return _extract_tasks(planner, plan_reviewer)
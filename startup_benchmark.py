@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+# Dependencies that take a noticeable time to import
+HEAVY_MODULES = ['autogen', 'langchain', 'langchain_core', 'chainlit', 'networkx', 'matplotlib', 'numpy', 'pydantic', 'vcdvcd']
+
+# What each pipeline entry point and stage imports
+DEFAULT_TARGETS = ['main', 'batch_run', 'spec2plan', 'plan2graph', 'graph2tasks', 'tasks2rtl', 'verify_rtl']
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Measure the import time of the pipeline entry points and stages')
+    parser.add_argument('targets', nargs='*', default=DEFAULT_TARGETS, help='Modules to import (default: main, batch_run and every stage)')
+    parser.add_argument('--repeat', type=int, default=5, help='Fresh interpreters per module (the median is reported)')
+    parser.add_argument('--max-seconds', type=float, help='Exit with 1 if importing main takes longer than this')
+    parser.add_argument('--summary', default='./checkpoints/startup_benchmark.md', help='Path of the result table')
+    return parser.parse_args()
+
+
+def measure_import(module, repeat):
+    """
+    Import module in fresh interpreters.
+
+    Returns:
+        dict with the median import and process times and the heavy dependencies it loaded
+    """
+    probe = _PROBE.format(module=module, heavy=HEAVY_MODULES)
+    imports, processes, loaded = [], [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        processes.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            return {'module': module, 'error': result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'failed'}
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        imports.append(report['seconds'])
+        loaded = report['loaded']
+    return {'module': module, 'import': statistics.median(imports), 'process': statistics.median(processes), 'loaded': loaded}
+
+
+def format_summary(results):
+    """Format the benchmark results as a markdown table"""
+    lines = [
+        "| Module | Import (s) | Process (s) | Heavy dependencies loaded |",
+        "|---|---|---|---|"
+    ]
+    for r in results:
+        if 'error' in r:
+            lines.append(f"| {r['module']} | - | - | error: {r['error']} |")
+        else:
+            lines.append(f"| {r['module']} | {r['import']:.3f} | {r['process']:.3f} | {', '.join(r['loaded']) or '-'} |")
+    return "\n".join(lines)
+
+
+def main():
+    args = parse_arguments()
+
+    results = []
+    for module in args.targets:
+        result = measure_import(module, args.repeat)
+        if 'error' in result:
+            print(f"{module}: {result['error']}")
+        else:
+            print(f"{module}: {result['import']:.3f} s import, {result['process']:.3f} s process")
+        results.append(result)
+
+    summary = format_summary(results)
+    os.makedirs(os.path.dirname(args.summary) or '.', exist_ok=True)
+    with open(args.summary, 'w') as f:
+        f.write(summary + "\n")
+
+    print()
+    print(summary)
+    print(f"Summary written to: {args.summary}")
+
+    main_result = next((r for r in results if r['module'] == 'main'), None)
+    if args.max_seconds is not None and main_result is not None:
+        if 'error' in main_result or main_result['import'] > args.max_seconds:
+            print(f"Error: Importing main takes more than {args.max_seconds} s")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+
+import argparse
+import itertools
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+from dataset import ProblemInfo, get_dataset_index, reference_header, reference_ports
+from prompts import (PLANNER_SYSTEM_MESSAGE, PLAN_REVIEWER_SYSTEM_MESSAGE, RTL_DESIGNER_SYSTEM_MESSAGE,
+                     RTL_REVIEWER_SYSTEM_MESSAGE, RTL_DEBUGGER_SYSTEM_MESSAGE)
+from sim_benchmark import reference_as_dut
+
+STUB_MODEL = "gpt-4.1"
+
+# Agents of the AG2 stages, recognized by their system message
+AGENT_ROLES = {
+    "planner": PLANNER_SYSTEM_MESSAGE,
+    "plan_reviewer": PLAN_REVIEWER_SYSTEM_MESSAGE,
+    "rtl_designer": RTL_DESIGNER_SYSTEM_MESSAGE,
+    "rtl_reviewer": RTL_REVIEWER_SYSTEM_MESSAGE,
+    "rtl_debugger": RTL_DEBUGGER_SYSTEM_MESSAGE,
+}
+
+
+class StubError(Exception):
+    """A request the scripted replies have no answer for"""
+
+
+def _text(content) -> str:
+    """Text of a message content, which may be a list of parts"""
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return str(content or "")
+
+
+def _tool_call(name: str, arguments: dict) -> dict:
+    return {"id": f"call_{uuid.uuid4().hex[:24]}", "type": "function", "function": {"name": name, "arguments": json.dumps(arguments)}}
+
+
+def zeroed_outputs(ref_code: str) -> Optional[str]:
+    """A DUT that compiles but fails the testbench: the reference interface with every output tied to 0"""
+    header = reference_header(ref_code)
+    if header is None:
+        return None
+    outputs = [port["name"] for port in reference_ports(ref_code) if port["direction"] == "output"]
+    body = "".join(f"  assign {name} = '0;\n" for name in outputs)
+    # Outputs declared as reg can't be driven by an assign
+    header = re.sub(r"\b(reg|wire)\b", "logic", header)
+    return f"module TopModule ({header});\n{body}endmodule\n"
+
+
+def plan_tasks(problem: ProblemInfo) -> List[dict]:
+    """The plan the stub planner gives for a problem: the interface, then one subtask per output"""
+    ports = [port["name"] for port in problem.ports]
+    outputs = [port["name"] for port in problem.ports if port["direction"] == "output"]
+    tasks = [{"name": "define_module_io", "description": f"Define module TopModule with the ports {', '.join(ports)}."}]
+    tasks += [{"name": f"implement_{name}", "description": f"Implement the logic driving the output {name}."} for name in outputs]
+    return tasks
+
+
+def plan_links(plans: List[str], signals: List[str]) -> List[dict]:
+    """Signals implemented by each plan of plan_tasks: the first declares them all, implement_<name> its output"""
+    return [{"name": plan, "signals": list(signals) if i == 0 else [name for name in signals if plan == f"implement_{name}"]}
+            for i, plan in enumerate(plans)]
+
+
+class ScriptedLLM:
+    """
+    Canned replies of every pipeline agent for verilog-eval problems.
+
+    The problem is recognized by its spec in the prompt. Plans, graph entities and tasks are
+    derived from the reference ports, and every piece of RTL submitted is the reference
+    solution, so a run passes unless the pipeline itself breaks. With debug_first the RTL
+    debugger first submits a DUT with its outputs tied to 0 and traces the waveform of the
+    failing simulation, so verification also goes through a failed run and VCD parsing.
+
+    Replies depend on the request alone (the state of a chat is read from its messages), so
+    concurrent swarms can share one instance.
+    """
+
+    def __init__(self, problems: List[ProblemInfo], debug_first: bool = True):
+        self.debug_first = debug_first
+        self._problems = []
+        for problem in problems:
+            with open(problem.prompt_path, "r") as f:
+                spec = f.read().strip()
+            with open(problem.ref_path, "r") as f:
+                ref_code = f.read()
+            self._problems.append((spec, problem, ref_code))
+        # Longest first, so a spec that contains another one wins
+        self._problems.sort(key=lambda item: -len(item[0]))
+
+    def _problem(self, messages: list) -> tuple[ProblemInfo, str]:
+        text = "\n".join(_text(m.get("content")) for m in messages)
+        for spec, problem, ref_code in self._problems:
+            if spec in text:
+                return problem, ref_code
+        raise StubError("No known problem spec in the prompt")
+
+    def reply(self, request: dict) -> dict:
+        """The assistant message answering a chat completions request"""
+        messages = request.get("messages") or []
+        system = next((_text(m.get("content")) for m in messages if m.get("role") == "system"), "").strip()
+        role = next((name for name, message in AGENT_ROLES.items() if system.startswith(message.strip())), None)
+        if role is not None:
+            return getattr(self, f"_{role}")(messages, request.get("tools") or [])
+
+        # langchain structured output: a JSON schema response format or a forced tool call
+        response_format = request.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            schema = response_format["json_schema"]["name"]
+            return {"content": json.dumps(self._structured(schema, messages))}
+        tool_choice = request.get("tool_choice")
+        if isinstance(tool_choice, dict) and tool_choice.get("function"):
+            schema = tool_choice["function"]["name"]
+            return {"content": "", "tool_calls": [_tool_call(schema, self._structured(schema, messages))]}
+        return {"content": "TERMINATE"}
+
+    def _planner(self, messages, tools):
+        problem, _ = self._problem(messages)
+        return {"content": f"```json\n{json.dumps({'tasks': plan_tasks(problem)}, indent=2)}\n```"}
+
+    def _plan_reviewer(self, messages, tools):
+        return {"content": "The plan follows the problem statement and the rules. TERMINATE"}
+
+    def _rtl_designer(self, messages, tools):
+        _, ref_code = self._problem(messages)
+        return {"content": "Implemented the subtask.",
+                "tool_calls": [_tool_call("verilog_syntax_check_tool", {"completed_verilog": reference_as_dut(ref_code)})]}
+
+    def _rtl_reviewer(self, messages, tools):
+        names = [tool.get("function", {}).get("name", "") for tool in tools]
+        transfer = next((name for name in names if name.startswith("transfer_") and name.endswith("_to_user")), None)
+        if transfer is None:
+            raise StubError("The rtl_reviewer has no hand-off to the user")
+        return {"content": "The code implements the subtask.", "tool_calls": [_tool_call(transfer, {})]}
+
+    def _rtl_debugger(self, messages, tools):
+        problem, ref_code = self._problem(messages)
+        calls = [c["function"]["name"] for m in messages if m.get("role") == "assistant" for c in m.get("tool_calls") or []]
+        buggy = zeroed_outputs(ref_code) if self.debug_first else None
+
+        if buggy and not calls:
+            code = buggy
+        elif calls and calls[-1] == "verilog_simulation_tool" and "waveform_trace_tool" not in calls and buggy:
+            outputs = [port["name"] for port in problem.ports if port["direction"] == "output"]
+            signals = [f"tb.{instance}.{name}" for name in outputs for instance in ("top_module1", "good1")]
+            return {"content": "The outputs mismatch, tracing them.",
+                    "tool_calls": [_tool_call("waveform_trace_tool", {"signals": signals, "start_time": 0, "end_time": 100})]}
+        else:
+            code = reference_as_dut(ref_code)
+        return {"content": "Running the simulation.",
+                "tool_calls": [_tool_call("verilog_simulation_tool", {"completed_verilog": code})]}
+
+    def _structured(self, schema: str, messages: list) -> dict:
+        if schema == "Relationships":
+            # The relationship prompt holds the merged plans and entities, not the spec
+            match = re.search(r"```json\s*([\s\S]*?)\s*```", "\n".join(_text(m.get("content")) for m in messages))
+            entities = json.loads(match.group(1)) if match else {}
+            signals = [signal["name"] for signal in entities.get("signals") or []]
+            return {"plans": plan_links([plan["name"] for plan in entities.get("plans") or []], signals),
+                    "signals": [{"name": name, "fsm_states": [], "examples": []} for name in signals]}
+
+        problem, _ = self._problem(messages)
+        tasks = plan_tasks(problem)
+        signals = [{"name": port["name"], "description": f"{port['direction']} port, {port['width']} bits"}
+                   for port in problem.ports]
+        if schema == "Entities":
+            return {"signals": signals, "fsm_states": [], "signal_examples": []}
+        if schema == "GraphExtraction":
+            return {"plans": plan_links([task["name"] for task in tasks], [signal["name"] for signal in signals]),
+                    "signals": [dict(signal, fsm_states=[], examples=[]) for signal in signals],
+                    "fsm_states": [], "signal_examples": []}
+        if schema == "FinalPlans":
+            return {"plans": [f"{task['name']}: {task['description']}" for task in tasks]}
+        raise StubError(f"No scripted reply for the {schema} schema")
+
+
+class StubLLMServer:
+    """
+    OpenAI-compatible chat completions endpoint (POST <base_url>/chat/completions) answering
+    with a ScriptedLLM, for running the pipeline without network access or API keys.
+
+    Each request is served in its own thread. Token usage is estimated at ~4 characters per
+    token, so the pipeline's metrics keep working.
+    """
+
+    def __init__(self, llm: ScriptedLLM, host: str = "127.0.0.1", port: int = 0):
+        self.llm = llm
+        self.requests = 0
+        self._ids = itertools.count()
+        self._thread = None
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/models"):
+                    return self._send(200, {"object": "list", "data": [{"id": STUB_MODEL, "object": "model", "owned_by": "stub"}]})
+                self._send(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    return self._send(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+                try:
+                    request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                    self._send(200, server.complete(request))
+                except (json.JSONDecodeError, StubError) as e:
+                    self._send(400, {"error": {"message": str(e), "type": "invalid_request_error"}})
+
+            def _send(self, status, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def complete(self, request: dict) -> dict:
+        """Chat completion response (with n identical choices) for a request"""
+        self.requests += 1
+        message = {"role": "assistant", "content": None, "refusal": None, **self.llm.reply(request)}
+        prompt = sum(len(_text(m.get("content"))) for m in request.get("messages") or []) // 4 + 1
+        completion = (len(message["content"] or "") + len(json.dumps(message.get("tool_calls") or []))) // 4 + 1
+        return {
+            "id": f"chatcmpl-stub-{next(self._ids)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", STUB_MODEL),
+            "choices": [{"index": i, "message": message, "logprobs": None,
+                         "finish_reason": "tool_calls" if message.get("tool_calls") else "stop"}
+                        for i in range(request.get("n") or 1)],
+            "usage": {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion},
+        }
+
+    def start(self) -> str:
+        """Serve in a background thread, returns the base URL"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="stub-llm", daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "StubLLMServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Serve scripted LLM replies for verilog-eval problems on an OpenAI-compatible endpoint')
+    parser.add_argument('problems', nargs='*', help='Problem IDs or glob patterns it answers for (default: all)')
+    parser.add_argument('--dataset-dir', default='./verilog-eval-v2', help='Directory holding the dataset problems')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+    parser.add_argument('--no-debug-first', action='store_true',
+                        help='Let the RTL debugger submit the reference right away instead of debugging a broken DUT first')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    index = get_dataset_index(args.dataset_dir)
+    problems = [index.get(problem_id) for problem_id in index.select(args.problems)]
+    if not problems:
+        print(f"Error: No problems to answer for in {args.dataset_dir}")
+        return 1
+
+    server = StubLLMServer(ScriptedLLM(problems, debug_first=not args.no_debug_first), args.host, args.port)
+    print(f"Stub LLM for {len(problems)} problems at {server.base_url}")
+    print(f"Point the pipeline at it with OPENAI_BASE_URL={server.base_url} and base_url in LLM_CONFIG")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -1,7 +1,16 @@
-from collections import deque
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+import difflib
 import os
-from typing import Any
-from utils import VerilogToolKits, ChainlitAssistantAgent, ChainlitUserProxyAgent
+import re
+from typing import Any, Optional
+from utils import VerilogToolKits, VerilogKnowledgeGraph, tool_message, as_async_tool
+from agents import ChainlitAssistantAgent, ChainlitUserProxyAgent
+from async_swarm import a_initiate_swarm_chat
+from llm_cache import apply_llm_cache
+from metrics import timed_stage, record_chat
 from prompts import RTL_DESIGNER_SYSTEM_MESSAGE, RTL_REVIEWER_SYSTEM_MESSAGE, RTL_DESIGNER_PROMPT
 
 from autogen import (
@@ -19,20 +28,20 @@ from autogen import (
 )
 
 from typing import Annotated
-import chainlit as cl
 
 
-def generate_rtl(spec: str, tasks: list[str], work_dir: str = "./work", llm_config_path: str = "LLM_CONFIG") -> tuple[str, str]:
+def _build_rtl_swarm(spec: str, tasks: list[str], work_dir: str, llm_config_path: str, is_async: bool = False,
+                     code: str = "", interface: str = "") -> dict:
     """
-    Generate RTL code for the given specification and tasks.
-    
-    Args:
-        spec: The specification for RTL generation
-        tasks: List of tasks to implement in RTL
-        llm_config_path: Path to the LLM configuration file
-    
+    Create the agents and hand-offs of the RTL generation swarm.
+
+    code and interface seed the workflow when the subtasks continue an existing implementation.
+
+    With is_async the tools are registered as coroutines that run their blocking work in a
+    worker thread, for use with `a_initiate_swarm_chat`.
+
     Returns:
-        The generated RTL code as a string
+        Keyword arguments for `initiate_swarm_chat` / `a_initiate_swarm_chat`
     """
     llm_config = LLMConfig.from_json(
         path=llm_config_path
@@ -50,12 +59,7 @@ def generate_rtl(spec: str, tasks: list[str], work_dir: str = "./work", llm_conf
         Input the completed verilog module in string format. Output is the string of pass or failed.
         """
         [compile_pass, log] = vtk.verilog_syntax_check_tool(completed_verilog=completed_verilog)
-        cl.run_sync(
-            cl.Message(
-                content=f'***** Response from calling tool *****\n\n{log}',
-                author="tool call",
-            ).send()
-        )
+        tool_message(log)
 
         if context_variables["interface"] in ("", None) and compile_pass:
             context_variables["interface"] = completed_verilog
@@ -80,7 +84,7 @@ def generate_rtl(spec: str, tasks: list[str], work_dir: str = "./work", llm_conf
         name="rtl_designer",
         description="Assistant who writes RTL code in verilog.",
         system_message=RTL_DESIGNER_SYSTEM_MESSAGE,
-        functions=[verilog_syntax_check_tool],
+        functions=[as_async_tool(verilog_syntax_check_tool) if is_async else verilog_syntax_check_tool],
         llm_config=llm_config,
     )
 
@@ -91,12 +95,14 @@ def generate_rtl(spec: str, tasks: list[str], work_dir: str = "./work", llm_conf
         llm_config=llm_config,
     )
 
+    apply_llm_cache(rtl_designer, rtl_reviewer)
+
     workflow_context = {
         "sim_pass": False,
         "rtl_generated": False,
         "compile_pass": False,
-        "code": "",
-        "interface": "",
+        "code": code,
+        "interface": interface,
         "task_current": dict(),
         "tasks_completed": deque(),
         "tasks_remaining": deque(tasks),
@@ -158,7 +164,7 @@ def generate_rtl(spec: str, tasks: list[str], work_dir: str = "./work", llm_conf
         ],
     )
 
-    chat_history = initiate_swarm_chat(
+    return dict(
         initial_agent=user,
         agents=[user, rtl_designer, rtl_reviewer],
         context_variables=workflow_context,
@@ -166,6 +172,217 @@ def generate_rtl(spec: str, tasks: list[str], work_dir: str = "./work", llm_conf
         max_rounds=200,
         after_work=AfterWorkOption.REVERT_TO_USER
     )
-    
-    # Return the generated code from the workflow context
+
+
+_INPUT_PORT_RE = re.compile(r"\binput\b([^;,)]*)")
+_COMMENT_RE = re.compile(r"//[^\n]*|/\*.*?\*/", re.DOTALL)
+# Left-hand side of a continuous, blocking or non-blocking assignment at the start of a statement
+_DRIVER_RE = re.compile(r"(?:^|[;:)]|\bbegin\b|\belse\b|\bassign\b)\s*([A-Za-z_]\w*)\s*(?:\[[^\]]*\]\s*)*<?=(?!=)", re.MULTILINE)
+# Loop indices and integer/genvar variables, scratch variables every block may declare and assign
+_LOOP_VAR_RE = re.compile(r"\bfor\s*\(\s*(?:int\s+|integer\s+|genvar\s+)?([A-Za-z_]\w*)\s*=")
+_INTEGER_DECL_RE = re.compile(r"\b(?:integer|genvar)\s+([^;]*);")
+
+
+def rtl_workers(max_workers: Optional[int] = None) -> int:
+    """Number of subtasks generated at once (RTL_WORKERS, default 1: serial generation)"""
+    if max_workers is None:
+        max_workers = int(os.environ.get('RTL_WORKERS', '1'))
+    return max(1, max_workers)
+
+
+def input_ports(interface: str) -> set[str]:
+    """Names of the input ports declared in a module interface"""
+    ports = set()
+    for m in _INPUT_PORT_RE.finditer(interface or ""):
+        words = re.findall(r"[A-Za-z_]\w*", re.sub(r"\[[^\]]*\]", " ", m.group(1)))
+        if words:
+            ports.add(words[-1])
+    return ports
+
+
+def task_signals(tasks: list[str], graph: VerilogKnowledgeGraph) -> list[set[str]]:
+    """Knowledge-graph signals mentioned by each subtask"""
+    names = [item['name'] for item in graph.query_graph("list_entities", entity_type="signal")]
+    patterns = {name: re.compile(rf"(?<![\w$]){re.escape(name)}(?![\w$])") for name in names if name}
+    return [{name for name, pattern in patterns.items() if pattern.search(task)} for task in tasks]
+
+
+def driven_signals(code: str) -> set[str]:
+    """Names of the signals assigned anywhere in code, without loop indices and integer/genvar variables"""
+    code = _COMMENT_RE.sub("", code or "")
+    scratch = set(_LOOP_VAR_RE.findall(code))
+    for declaration in _INTEGER_DECL_RE.findall(code):
+        scratch.update(re.findall(r"([A-Za-z_]\w*)\s*(?:=[^,]*)?(?:,|$)", re.sub(r"\[[^\]]*\]", " ", declaration)))
+    return set(_DRIVER_RE.findall(code)) - scratch
+
+
+def schedule_subtasks(tasks: list[str], graph: VerilogKnowledgeGraph, interface: str = "") -> list[list[int]]:
+    """
+    Group the subtasks after the first one into levels that can be generated concurrently.
+
+    The first subtask sets up the module and its interface and always runs alone. A later
+    subtask goes one level after every earlier subtask it shares a signal with; input ports
+    are read-only and don't count as shared. A subtask that mentions no known signal might
+    touch any of them, so it goes after every earlier subtask and every later one goes after
+    it. Subtasks of a level touch disjoint signals, so the number of levels is the critical
+    path of the task list.
+
+    Returns:
+        List of levels, each a list of task indices in their original order
+    """
+    inputs = input_ports(interface)
+    signals = [sig - inputs for sig in task_signals(tasks, graph)]
+
+    level_of = {}
+    for j in range(1, len(tasks)):
+        level_of[j] = max((level_of[i] + 1 for i in range(1, j)
+                           if not signals[i] or not signals[j] or signals[i] & signals[j]), default=0)
+
+    levels = defaultdict(list)
+    for j, level in level_of.items():
+        levels[level].append(j)
+    return [levels[level] for level in sorted(levels)]
+
+
+def merge_fragments(base: str, fragments: list[str]) -> Optional[str]:
+    """
+    Merge fragments that each extend base with their own insertions into one module.
+
+    Insertions at the same place are kept in fragment order. Returns None if a fragment
+    changes or removes a (non-blank) line of base, since that can't be merged safely.
+    """
+    base_lines = [line.rstrip() for line in base.splitlines()]
+    inserts = defaultdict(list)
+
+    for fragment in fragments:
+        fragment_lines = [line.rstrip() for line in fragment.splitlines()]
+        matcher = difflib.SequenceMatcher(None, [l.strip() for l in base_lines], [l.strip() for l in fragment_lines], autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                continue
+            if tag != 'insert' and any(line.strip() for line in base_lines[i1:i2]):
+                return None
+            # Blank base lines that were dropped or replaced are kept; only new lines are added
+            inserts[i1].extend(fragment_lines[j1:j2])
+
+    merged = []
+    for i, line in enumerate(base_lines):
+        merged.extend(inserts.get(i, []))
+        merged.append(line)
+    merged.extend(inserts.get(len(base_lines), []))
+    return "\n".join(merged) + "\n"
+
+
+def _run_rtl_swarm(spec: str, tasks: list[str], work_dir: str, llm_config_path: str, code: str = "", interface: str = "") -> tuple[str, str]:
+    swarm = _build_rtl_swarm(spec, tasks, work_dir, llm_config_path, code=code, interface=interface)
+    chat_history = initiate_swarm_chat(**swarm)
+    record_chat(chat_history[0])
+    workflow_context = swarm["context_variables"]
     return workflow_context["code"], workflow_context["interface"]
+
+
+async def _a_run_rtl_swarm(spec: str, tasks: list[str], work_dir: str, llm_config_path: str, code: str = "", interface: str = "") -> tuple[str, str]:
+    swarm = _build_rtl_swarm(spec, tasks, work_dir, llm_config_path, is_async=True, code=code, interface=interface)
+    chat_history = await a_initiate_swarm_chat(**swarm)
+    record_chat(chat_history[0])
+    workflow_context = swarm["context_variables"]
+    return workflow_context["code"], workflow_context["interface"]
+
+
+def _merge_level(base: str, fragments: list[Optional[str]], work_dir: str) -> Optional[str]:
+    """Merge the fragments of a level and check that no signal gets two drivers and the merged module compiles"""
+    if any(not fragment for fragment in fragments):
+        return None
+    merged = merge_fragments(base, fragments)
+    if merged is None:
+        print("Fragments touch the same lines, generating the level serially...")
+        return None
+    # Signals the knowledge graph didn't know about may still be driven by two fragments
+    base_drivers = driven_signals(base)
+    seen = set()
+    for fragment in fragments:
+        drivers = driven_signals(fragment) - base_drivers
+        if drivers & seen:
+            print(f"Several fragments drive {', '.join(sorted(drivers & seen))}, generating the level serially...")
+            return None
+        seen |= drivers
+    compile_pass, log = VerilogToolKits(work_dir).verilog_syntax_check_tool(merged)
+    if not compile_pass:
+        print("Merged fragments don't compile, generating the level serially...")
+        return None
+    return merged
+
+
+@timed_stage('generate_rtl')
+def generate_rtl(spec: str, tasks: list[str], work_dir: str = "./work", llm_config_path: str = "LLM_CONFIG",
+                 graph: Optional[VerilogKnowledgeGraph] = None, max_workers: Optional[int] = None) -> tuple[str, str]:
+    """
+    Generate RTL code for the given specification and tasks.
+
+    With a knowledge graph, subtasks that touch disjoint signals are generated concurrently
+    (up to max_workers at a time) as fragments of the previous implementation and merged.
+    A level whose fragments can't be merged, drive the same signal or don't compile is
+    regenerated serially.
+    
+    Args:
+        spec: The specification for RTL generation
+        tasks: List of tasks to implement in RTL
+        llm_config_path: Path to the LLM configuration file
+        graph: Knowledge graph of the spec, enables parallel subtask generation
+        max_workers: Maximum number of subtasks generated at once (default: RTL_WORKERS or 1)
+    
+    Returns:
+        The generated RTL code as a string
+    """
+    max_workers = rtl_workers(max_workers)
+    if graph is None or len(tasks) < 3 or max_workers < 2:
+        return _run_rtl_swarm(spec, tasks, work_dir, llm_config_path)
+
+    code, interface = _run_rtl_swarm(spec, tasks[:1], work_dir, llm_config_path)
+    for level in schedule_subtasks(tasks, graph, interface):
+        level_tasks = [tasks[j] for j in level]
+        merged = None
+        if len(level) > 1 and code:
+            print(f"Generating subtasks {level} concurrently...")
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(level))) as pool:
+                # Each worker keeps the caller's context (event backend, metrics)
+                futures = [pool.submit(contextvars.copy_context().run, _run_rtl_swarm,
+                                       spec, [task], work_dir, llm_config_path, code, interface)
+                           for task in level_tasks]
+                fragments = [future.result()[0] for future in futures]
+            merged = _merge_level(code, fragments, work_dir)
+        if merged is None:
+            merged, interface = _run_rtl_swarm(spec, level_tasks, work_dir, llm_config_path, code, interface)
+        code = merged
+
+    return code, interface
+
+
+@timed_stage('generate_rtl')
+async def a_generate_rtl(spec: str, tasks: list[str], work_dir: str = "./work", llm_config_path: str = "LLM_CONFIG",
+                         graph: Optional[VerilogKnowledgeGraph] = None, max_workers: Optional[int] = None) -> tuple[str, str]:
+    """Async version of generate_rtl for the Chainlit app."""
+    max_workers = rtl_workers(max_workers)
+    if graph is None or len(tasks) < 3 or max_workers < 2:
+        return await _a_run_rtl_swarm(spec, tasks, work_dir, llm_config_path)
+
+    code, interface = await _a_run_rtl_swarm(spec, tasks[:1], work_dir, llm_config_path)
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def run_fragment(task):
+        async with semaphore:
+            fragment, _ = await _a_run_rtl_swarm(spec, [task], work_dir, llm_config_path, code, interface)
+            return fragment
+
+    for level in schedule_subtasks(tasks, graph, interface):
+        level_tasks = [tasks[j] for j in level]
+        merged = None
+        if len(level) > 1 and code:
+            print(f"Generating subtasks {level} concurrently...")
+            fragments = await asyncio.gather(*(run_fragment(task) for task in level_tasks))
+            merged = await asyncio.to_thread(_merge_level, code, fragments, work_dir)
+        if merged is None:
+            merged, interface = await _a_run_rtl_swarm(spec, level_tasks, work_dir, llm_config_path, code, interface)
+        code = merged
+
+    return code, interface
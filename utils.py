@@ -1,18 +1,21 @@
-import matplotlib
-matplotlib.use('agg')
+import asyncio
+import functools
 import json
-import subprocess
 import os
 import re
 import shutil
-from typing import Any, Dict, List, Tuple
-import networkx as nx
-import matplotlib.pyplot as plt
-from matplotlib.lines import Line2D
-from vcdvcd import VCDVCD, binary_string_to_hex, StreamParserCallbacks
-from autogen import ConversableAgent, UserProxyAgent, Agent
-from typing import Optional, Union
-import chainlit as cl
+import tempfile
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from vcdvcd import binary_string_to_hex, StreamParserCallbacks
+from sim_cache import SimCache
+from simulators import SimulatorBackend, LimitExceeded, DumpPolicy, get_simulator, disable_dumps, has_dumps, windowed_dumps, first_mismatch_time, fail_fast_stop_time
+from events import emit_event
+from run_store import get_run_store
+from metrics import timed_tool_run
+
+
 def equally_formatted(s:str)->str:
     s = " " + s + " "
     width = 80
@@ -21,150 +24,58 @@ def equally_formatted(s:str)->str:
 
 
 
-class ChainlitAssistantAgent(ConversableAgent):
-    """
-    Wrapper for AutoGens Assistant Agent
-    """
-    def send(
-        self,
-        message: Union[Dict, str],
-        recipient: Agent,
-        request_reply: Optional[bool] = None,
-        silent: Optional[bool] = False,
-    ) -> bool:
-        
-        content = message if isinstance(message,str) else message.get("content")
-
-        cl.run_sync(
-            cl.Message(
-                content=f'*Sending message from `{self.name}` to `{recipient.name}`:*\n\n{content}',
-                author=self.name,
-            ).send()
-        )
-
-        if isinstance(message,Dict) and message.get("tool_calls",""):
-            cl.run_sync(cl.Message(
-                            content=f"***** Suggested tool call: {message['tool_calls'][0]['function']['name']} *****",
-                            author=self.name,
-                        ).send()
-            ) 
-        super(ChainlitAssistantAgent, self).send(
-            message=message,
-            recipient=recipient,
-            request_reply=request_reply,
-            silent=silent,
-        )
-
-# async def ask_helper(func, **kwargs):
-#     res = await func(**kwargs).send()
-#     while not res:
-#         res = await func(**kwargs).send()
-#     return res
-
-class ChainlitUserProxyAgent(UserProxyAgent):
-    """
-    Wrapper for AutoGens Assistant Agent
-    """
-    # def get_human_input(self, prompt: str) -> str:
-    #     if prompt.startswith(
-    #         "Provide feedback to chat_manager. Press enter to skip and use auto-reply"
-    #     ):
-    #         res = cl.run_sync(
-    #             ask_helper(
-    #                 cl.AskActionMessage,
-    #                 content="Continue or provide feedback?",
-    #                 actions=[
-    #                     cl.Action( name="continue", value="continue", label="✅ Continue" ),
-    #                     cl.Action( name="feedback",value="feedback", label="💬 Provide feedback"),
-    #                     cl.Action( name="exit",value="exit", label="🔚 Exit Conversation" )
-    #                 ],
-    #             )
-    #         )
-    #         if res.get("value") == "continue":
-    #             return ""
-    #         if res.get("value") == "exit":
-    #             return "exit"
-
-    #     reply = cl.run_sync(ask_helper(cl.AskUserMessage, content=prompt, timeout=60))
-
-    #     return reply["output"].strip()
-    
-    def send(
-        self,
-        message: Union[Dict, str],
-        recipient: Agent,
-        request_reply: Optional[bool] = None,
-        silent: Optional[bool] = False,
-    ) -> bool:
-        
-        content = message if isinstance(message,str) else message.get("content")
-
-        cl.run_sync(
-            cl.Message(
-                content=f'*Sending message from `{self.name}` to `{recipient.name}`:*\n\n{content}',
-                author=self.name,
-            ).send()
-        )
-
-        if isinstance(message,Dict) and message.get("tool_calls",""):
-            cl.run_sync(cl.Message(
-                            content=f"***** Suggested tool call: {message['tool_calls'][0]['function']['name']} *****",
-                            author=self.name,
-                        ).send()
-            ) 
-        super(ChainlitUserProxyAgent, self).send(
-            message=message,
-            recipient=recipient,
-            request_reply=request_reply,
-            silent=silent,
-        )
-
+_checkpoint_dirs = set()
 
 
 def ensure_checkpoint_dir(spec_id=None):
     """Create checkpoints directory if it doesn't exist"""
-    base_dir = 'checkpoints'
-    if not os.path.exists(base_dir):
-        os.makedirs(base_dir)
-
-    if spec_id:
-        checkpoint_dir = os.path.join(base_dir, spec_id)
-        if not os.path.exists(checkpoint_dir):
-            os.makedirs(checkpoint_dir)
-        return checkpoint_dir
-
-    return base_dir
+    checkpoint_dir = os.path.join('checkpoints', spec_id) if spec_id else 'checkpoints'
+    if checkpoint_dir not in _checkpoint_dirs:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        _checkpoint_dirs.add(checkpoint_dir)
+    return checkpoint_dir
 
 
 def save_checkpoint(data, filename, spec_id=None):
-    """Save data to checkpoint file"""
-    checkpoint_dir = ensure_checkpoint_dir(spec_id)
-    filepath = os.path.join(checkpoint_dir, filename)
-
-    if filename.endswith('.json'):
-        with open(filepath, 'w') as f:
-            json.dump(data, f, indent=2)
-    else:
-        with open(filepath, 'w') as f:
-            f.write(data)
+    """Save data to checkpoint file (or to the run store if CHECKPOINT_STORE is set)"""
+    with timed_tool_run("checkpoint_write"):
+        store = get_run_store()
+        if store is not None:
+            store.put(spec_id, filename, data)
+            return f"{store.path}:{spec_id}/{filename}"
+
+        checkpoint_dir = ensure_checkpoint_dir(spec_id)
+        filepath = os.path.join(checkpoint_dir, filename)
+
+        if filename.endswith('.json'):
+            with open(filepath, 'w') as f:
+                json.dump(data, f, indent=2)
+        else:
+            with open(filepath, 'w') as f:
+                f.write(data)
 
-    return filepath
+        return filepath
 
 
 def load_checkpoint(filename, spec_id=None):
-    """Load data from checkpoint file"""
-    checkpoint_dir = ensure_checkpoint_dir(spec_id)
-    filepath = os.path.join(checkpoint_dir, filename)
+    """Load data from checkpoint file (or from the run store if CHECKPOINT_STORE is set)"""
+    with timed_tool_run("checkpoint_read"):
+        store = get_run_store()
+        if store is not None:
+            return store.get(spec_id, filename)
 
-    if not os.path.exists(filepath):
-        return None
+        checkpoint_dir = ensure_checkpoint_dir(spec_id)
+        filepath = os.path.join(checkpoint_dir, filename)
 
-    if filename.endswith('.json'):
-        with open(filepath, 'r') as f:
-            return json.load(f)
-    else:
-        with open(filepath, 'r') as f:
-            return f.read()
+        if not os.path.exists(filepath):
+            return None
+
+        if filename.endswith('.json'):
+            with open(filepath, 'r') as f:
+                return json.load(f)
+        else:
+            with open(filepath, 'r') as f:
+                return f.read()
 
 
 def extract_json_from_markdown(md_string):
@@ -183,6 +94,8 @@ class VerilogKnowledgeGraph:
 
     def __init__(self, json_data, json_connections):
         """Initialize the knowledge graph from JSON specification data."""
+        import networkx as nx
+
         self.data = json_data if isinstance(json_data, dict) else json.loads(json_data)
         self.connections = json_connections if isinstance(json_connections, dict) else json.loads(json_connections)
         self.G = nx.DiGraph()
@@ -192,30 +105,55 @@ class VerilogKnowledgeGraph:
         """Build the knowledge graph with nodes and relationships."""
         self._add_nodes()
         self._connect_nodes()
+        self.invalidate_index()
         return self.G
 
+    def invalidate_index(self):
+        """Drop the query index and memoized neighborhoods after G was changed"""
+        self._index_key = None
+
+    def add_node(self, name, type, description):
+        """Add (or update) an entity node"""
+        self.G.add_node(name, type=type, description=description)
+        self.invalidate_index()
+
+    def add_edge(self, source, target, relationship):
+        """Add (or update) a relationship between two nodes"""
+        self.G.add_edge(source, target, relationship=relationship)
+        self.invalidate_index()
+
+    def remove_node(self, name):
+        """Remove a node and its relationships"""
+        self.G.remove_node(name)
+        self.invalidate_index()
+
+    def remove_edge(self, source, target):
+        """Remove the relationship from source to target"""
+        self.G.remove_edge(source, target)
+        self.invalidate_index()
+
     def _add_nodes(self):
         """Add all entities as nodes to the graph."""
         for i in self.data.get("plans", []):
-            self.G.add_node(i.get("name"), type="plan", description=i.get("description"))
+            self.add_node(i.get("name"), "plan", i.get("description"))
         for i in self.data.get("signals", []) or []:
-            self.G.add_node(i.get("name"), type="signal", description=i.get("description"))
+            self.add_node(i.get("name"), "signal", i.get("description"))
         for i in self.data.get("fsm_states", []) or []:
-            self.G.add_node(i.get("name"), type="fsm_state", description=i.get("description"))
+            self.add_node(i.get("name"), "fsm_state", i.get("description"))
         for i in self.data.get("signal_examples", []) or []:
-            self.G.add_node(i.get("name"), type="example", description=i.get("description"))
+            self.add_node(i.get("name"), "example", i.get("description"))
 
     def _connect_nodes(self):
         """Connect nodes with appropriate relationships"""
         for i in self.connections['plans']:
             for j in (i['signals'] or []):
-                self.G.add_edge(i['name'], j, relationship="IMPLEMENTS")
+                self.add_edge(i['name'], j, "IMPLEMENTS")
 
         for i in self.connections['signals']:
             for j in (i['fsm_states'] or []):
-                self.G.add_edge(i['name'], j, relationship="STATETRANSITION")
+                self.add_edge(i['name'], j, "STATETRANSITION")
             for j in (i['examples'] or []):
-                self.G.add_edge(i['name'], j, relationship="EXAMPLES")
+                self.add_edge(i['name'], j, "EXAMPLES")
 
     @classmethod
     def load_from_json(cls, json_path):
@@ -231,83 +169,34 @@ class VerilogKnowledgeGraph:
         with open(json_path, 'r') as f:
             graph_data = json.load(f)
 
-        # Create an empty instance
+        return cls.from_dict(graph_data)
+
+    @classmethod
+    def from_dict(cls, graph_data):
+        """Restore a graph from the data returned by export_graph"""
+        # Create an empty instance, its empty DiGraph is populated below
         instance = cls({}, {})
 
-        # Create a new DiGraph and populate it
-        instance.G = nx.DiGraph()
         for node in graph_data['nodes']:
-            instance.G.add_node(node['id'], type=node['type'], description=node['description'])
+            instance.add_node(node['id'], node['type'], node['description'])
 
         for edge in graph_data['edges']:
-            instance.G.add_edge(edge['source'], edge['target'], relationship=edge['relationship'])
+            instance.add_edge(edge['source'], edge['target'], edge['relationship'])
 
         return instance
 
-    def visualize_graph(self, filename="verilog_knowledge_graph.png", figsize=(12, 10), ):
-        """Visualize the knowledge graph."""
-        plt.figure(figsize=figsize)
-
-        # Generate positions
-        pos = nx.spring_layout(self.G, seed=42)
-
-        # Color nodes by type
-        node_colors = []
-        for node in self.G.nodes():
-            node_type = self.G.nodes[node]["type"]
-            if node_type == "plan":
-                node_colors.append("lightblue")
-            elif node_type == "signal":
-                node_colors.append("lightgreen")
-            elif node_type == "fsm_state":
-                node_colors.append("lightcoral")
-            elif node_type == "example":
-                node_colors.append("gray")
-
-        # Draw nodes
-        nx.draw_networkx_nodes(self.G, pos, node_color=node_colors, node_size=800, alpha=0.8)
-
-        # Draw node labels
-        node_labels = {node: node for node in self.G.nodes()}
-        nx.draw_networkx_labels(self.G, pos, labels=node_labels, font_size=8)
-
-        # Draw edges with different colors based on relationship
-        edge_colors = {
-            "IMPLEMENTS": "green",
-            "STATETRANSITION": "red",
-            "EXAMPLES": "gray"
-        }
+    def visualize_graph(self, filename="verilog_knowledge_graph.png", figsize=(12, 10), layout="auto", dpi=300):
+        """
+        Visualize the knowledge graph (.svg filenames give vector output).
 
-        for rel_type, color in edge_colors.items():
-            rel_edges = [(u, v) for u, v, d in self.G.edges(data=True) if d.get("relationship") == rel_type]
-            if rel_edges:
-                nx.draw_networkx_edges(self.G, pos, edgelist=rel_edges, edge_color=color,
-                                      arrows=True, arrowsize=15, width=1.5, alpha=0.7)
-
-        # Add legend
-        node_legend_elements = [
-            Line2D([0], [0], marker='o', color='w', markerfacecolor='lightblue', markersize=10, label='Plan'),
-            Line2D([0], [0], marker='o', color='w', markerfacecolor='lightgreen', markersize=10, label='Signal'),
-            Line2D([0], [0], marker='o', color='w', markerfacecolor='lightcoral', markersize=10, label='FSM State'),
-            Line2D([0], [0], marker='o', color='w', markerfacecolor='gray', markersize=10, label='Example')
-        ]
-
-        edge_legend_elements = [
-            Line2D([0], [0], color='green', lw=2, label='IMPLEMENTS'),
-            Line2D([0], [0], color='red', lw=2, label='STATETRANSITION'),
-            Line2D([0], [0], color='gray', lw=2, label='EXAMPLES')
-        ]
-
-        plt.legend(handles=node_legend_elements + edge_legend_elements, loc='upper right')
-
-        plt.title("Verilog Specification Knowledge Graph")
-        plt.axis("off")
-        plt.tight_layout()
-        plt.savefig(filename, dpi=300, bbox_inches="tight")
-        # plt.show()
+        layout is 'spring', 'hierarchical' (plans -> signals -> states/examples) or 'auto', which
+        picks the hierarchical layout for large graphs. Layouts are cached by graph content.
+        """
+        from graph_render import render_graph
+        return render_graph(self.G, filename, figsize, layout, dpi)
 
     def export_graph(self, filename="verilog_knowledge_graph.json"):
-        """Export the graph to a JSON format."""
+        """Export the graph to a JSON format (only returned, not written, if filename is None)."""
         data = {
             "nodes": [],
             "edges": []
@@ -331,58 +220,114 @@ class VerilogKnowledgeGraph:
             }
             data["edges"].append(edge_data)
 
-        with open(filename, 'w') as f:
-            json.dump(data, f, indent=2)
+        if filename is not None:
+            with open(filename, 'w') as f:
+                json.dump(data, f, indent=2)
 
         return data
 
+    def _index(self):
+        """
+        Type index and adjacency lists of the graph, built on first use.
+
+        The add_/remove_ node and edge methods drop it, so every change made through them is
+        seen; code that edits G directly must call invalidate_index. Only a replaced G or a
+        changed node count is caught here, since counting edges is O(n) in networkx and would
+        cost more than most queries. Memoized neighborhoods are dropped with the index.
+        """
+        key = (id(self.G), len(self.G))
+        if getattr(self, '_index_key', None) != key:
+            by_type = defaultdict(list)
+            for node, attrs in self.G.nodes(data=True):
+                by_type[attrs.get("type")].append((node, attrs.get("description", "")))
+
+            out_edges, in_edges = {}, {}
+            adjacency = defaultdict(lambda: defaultdict(list))
+            for node, targets in self.G.succ.items():
+                out_edges[node] = [(target, attrs["relationship"]) for target, attrs in targets.items()]
+                for target, relationship in out_edges[node]:
+                    adjacency[relationship][node].append(target)
+            for node, sources in self.G.pred.items():
+                in_edges[node] = [(source, attrs["relationship"]) for source, attrs in sources.items()]
+
+            self._by_type = dict(by_type)
+            self._out_edges, self._in_edges = out_edges, in_edges
+            self._adjacency = {relationship: dict(nodes) for relationship, nodes in adjacency.items()}
+            self._neighborhoods = {}
+            self._index_key = key
+        return self
+
     def query_graph(self, query_type, entity_type=None, entity_name=None, relationship_type=None, direction=None):
         """Query the knowledge graph for specific information."""
+        self._index()
         results = []
 
         if query_type == "list_entities":
             # List all entities of a specific type
-            for node, attrs in self.G.nodes(data=True):
-                if attrs.get("type") == entity_type:
-                    results.append({
-                        "name": node,
-                        "description": attrs.get("description", "")
-                    })
+            for node, description in self._by_type.get(entity_type, []):
+                results.append({
+                    "name": node,
+                    "description": description
+                })
 
         elif query_type == "get_relationships":
             # Outgoing relationships
             if direction is None or direction == "out":
-                for _, target, attrs in self.G.out_edges(entity_name, data=True):
-                    if relationship_type is None or attrs["relationship"] == relationship_type:
-                        results.append({
-                            "source": entity_name,
-                            "target": target,
-                            "relationship": attrs["relationship"]
-                        })
+                if relationship_type is None:
+                    targets = self._out_edges.get(entity_name, [])
+                else:
+                    targets = [(t, relationship_type) for t in self._adjacency.get(relationship_type, {}).get(entity_name, [])]
+                for target, relationship in targets:
+                    results.append({
+                        "source": entity_name,
+                        "target": target,
+                        "relationship": relationship
+                    })
 
             # Incoming relationships
             if direction is None or direction == "in":
-                for source, _, attrs in self.G.in_edges(entity_name, data=True):
-                    if relationship_type is None or attrs["relationship"] == relationship_type:
+                for source, relationship in self._in_edges.get(entity_name, []):
+                    if relationship_type is None or relationship == relationship_type:
                         results.append({
                             "source": source,
                             "target": entity_name,
-                            "relationship": attrs["relationship"]
+                            "relationship": relationship
                         })
 
         return results
 
-    def bfs_relationship_recursive(self, q=[[{'source': 'root', 'target': '', 'relationship': ''}]], depth=1, level=0):
-        """Recursively perform breadth-first search on relationships"""
-        if level == depth:
-            return q
-        else:
-            q.append([rel for i in q[-1] for rel in self.query_graph("get_relationships", entity_name=i['target'], direction="out")])
-            return self.bfs_relationship_recursive(q, depth, level+1)
-
     def bfs_relationship(self, root='', depth=1):
-        """Start a BFS from a root node to explore relationships"""
-        return self.bfs_relationship_recursive(q=[[{'source': 'root', 'target': root, 'relationship': ''}]], depth=depth, level=0)
+        """
+        Breadth-first search of the outgoing relationships of root.
+
+        Returns a list of depth + 1 levels: the root entry, then the relationships leaving the
+        nodes first reached at the previous level. Each node is expanded once, so shared
+        signals and cycles don't repeat their subtrees.
+        """
+        self._index()
+        levels = [[{'source': 'root', 'target': root, 'relationship': ''}]]
+        visited = {root}
+        frontier = [root]
+        for _ in range(depth):
+            level, next_frontier = [], []
+            for node in frontier:
+                for target, relationship in self._out_edges.get(node, []):
+                    level.append({'source': node, 'target': target, 'relationship': relationship})
+                    if target not in visited:
+                        visited.add(target)
+                        next_frontier.append(target)
+            levels.append(level)
+            frontier = next_frontier
+        return levels
+
+    def neighborhood(self, root, depth=1) -> List[str]:
+        """Nodes within depth relationships of root (root first, BFS order), memoized until the graph changes"""
+        self._index()
+        key = (root, depth)
+        if key not in self._neighborhoods:
+            nodes = dict.fromkeys(rel['target'] for level in self.bfs_relationship(root, depth) for rel in level)
+            self._neighborhoods[key] = tuple(nodes)
+        return list(self._neighborhoods[key])
 
 
 class CustomCallback(StreamParserCallbacks):
@@ -434,66 +379,84 @@ class CustomCallback(StreamParserCallbacks):
 
     def format_transposed_output(self):
         """Format signal data in a tabular representation"""
-        output = []
-        for error in self.errors:
-            output.append(error)
-        output.append('')
+        from waveform import format_trace_table
+        return format_trace_table(self.signal_data, self.time_values, self.errors)
 
-        if not self.signal_data:
-            return "\n".join(output)
 
-        # Define column width for better alignment
-        first_col_width = max(len(key) for key in self.signal_data.keys()) # Width for the first column (signal names)
-        max_signal_width = max(len(item) for sublist in self.signal_data.values() for item in sublist)
-        max_time_width = max(len(str(time)) for time in self.time_values)
-        time_col_width = max(max_signal_width, max_time_width) + 2   # Width for each time value column
+def trace_table(vcd_path: str, signals: List[str], offset: int = 0, window: int = 100, clock: str = "") -> str:
+    """Get signal traces from a VCD file as a text table"""
+    with timed_tool_run("vcd_trace"):
+        return _trace_table(vcd_path, signals, offset, window, clock)
 
-        # Create header row with time values
-        header = f"{'time':<{first_col_width}}"
 
-        # Add time values with proper spacing
-        for time_val in self.time_values:
-            header += f"{time_val:>{time_col_width}}"
-        output.append(header)
+def _trace_table(vcd_path: str, signals: List[str], offset: int = 0, window: int = 100, clock: str = "") -> str:
+    from waveform import WaveformIndex, StreamWindowReader
 
-        # Create a row for each signal
-        for signal_name, values in self.signal_data.items():
-            row = f"{signal_name:<{first_col_width}}"
-
-            # Add each value with proper spacing
-            for value in values:
-                row += f"{value:>{time_col_width}}"
-            output.append(row)
-
-        return "\n".join(output)
+    index = WaveformIndex.peek(vcd_path)
+    if index is not None:
+        s = index.trace_table(signals, offset, window, clock)
+    else:
+        # Windows near the start of the dump are answered by reading only the prefix they need.
+        # Once a query has to read most of the file, index the dump so later queries are binary searches.
+        reader = StreamWindowReader(vcd_path)
+        s = reader.trace_table(signals, offset, window, clock)
+        if reader.bytes_read * 2 > reader.file_size:
+            WaveformIndex.load(vcd_path)
+    return s
 
 
 def get_traces(vcd_path: str, signals: List[str], offset: int = 0, window: int = 100, clock: str = "") -> str:
     """Get signal traces from a VCD file"""
-    callback = CustomCallback(signals=signals, offset=offset, window=window, clock=clock)
-    VCDVCD(vcd_path, callbacks=callback, store_tvs=False, only_sigs=False)
-
-    s = callback.format_transposed_output()
-    cl.run_sync(
-                cl.Message(
-                    content=f'***** Response from calling tool *****\n\n{s}',
-                    author="tool call",
-                ).send()
-            )
+    s = trace_table(vcd_path, signals, offset, window, clock)
+    tool_message(s)
     return s
 
 
+def tool_message(log: str) -> None:
+    """Show a tool response in the UI"""
+    emit_event("tool call", f'***** Response from calling tool *****\n\n{log}')
+
+
+def as_async_tool(func):
+    """
+    Async twin of a blocking tool function for the async stages.
+
+    The LLM sees the same name, description and signature, while the blocking body (compiles,
+    simulations, VCD parsing) runs in a worker thread so the event loop stays free.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await asyncio.to_thread(func, *args, **kwargs)
+    return wrapper
+
+
 class VerilogToolKits:
     """Tools for Verilog analysis, compilation, and simulation"""
 
-    def __init__(self, workdir: str = "./verilog_tool_tmp/"):
+    # File names used inside every per-call sandbox directory
+    VERILOG_FILE = "test.sv"
+    COMPLETED_VERILOG_FILE = "test.v"
+    WAVE_VCD_FILE = "wave.vcd"
+
+    def __init__(self, workdir: str = "./verilog_tool_tmp/", cache: Optional[SimCache] = None,
+                 simulator: Optional[SimulatorBackend] = None):
         # Directory structure
         self.workdir = workdir
-        self.verilog_file_path = os.path.join(self.workdir, "test.sv")
-        self.test_vpp_file_path = os.path.join(self.workdir, "test.vpp")
-        self.wave_vcd_file_path = os.path.join(self.workdir, "wave.vcd")
-        self.completed_verilog_file_path = os.path.join(self.workdir, "test.v")
-        self.interface_file_path = self.workdir + "/interface.sv"
+        self.interface_file_path = os.path.abspath(os.path.join(self.workdir, "interface.sv"))
+        # Every compile/sim runs in its own sandbox under workdir; the sandbox of the
+        # latest simulation is kept so its waveform can be traced.
+        self.sim_dir = None
+        self.wave_vcd_file_path = os.path.join(self.workdir, self.WAVE_VCD_FILE)
+        self._sandbox_lock = threading.Lock()
+        # Dump run (see _dump_window) still owed for a waveform a fail-fast stop left unflushed
+        self._pending_dump = None
+
+        # Results are reused across calls with identical sources and flags
+        self.cache = cache if cache is not None else SimCache.from_env()
+        # Compiler/simulator doing the work (SIMULATOR selects it, default iverilog)
+        self.simulator = simulator if simulator is not None else get_simulator()
+        # Whether simulations dump the whole run or only a window around the first failure
+        self.dump_policy = DumpPolicy.from_env()
 
         # Data state
         self.test_bench = ""
@@ -507,11 +470,80 @@ class VerilogToolKits:
         """Get paths used by this toolkit"""
         return {
             'workdir': self.workdir,
-            'verilog': self.completed_verilog_file_path,
-            'test_sv': self.verilog_file_path,
+            'sim_dir': self.sim_dir,
             'wave': self.wave_vcd_file_path
         }
 
+    def _make_sandbox(self, prefix: str) -> str:
+        """Create a private scratch directory for one compile/sim call"""
+        os.makedirs(self.workdir, exist_ok=True)
+        return os.path.abspath(tempfile.mkdtemp(prefix=prefix, dir=self.workdir))
+
+    def _keep_sim_sandbox(self, sandbox: str) -> None:
+        """Make sandbox the latest simulation directory and remove the previous one"""
+        with self._sandbox_lock:
+            previous, self.sim_dir = self.sim_dir, sandbox
+            self.wave_vcd_file_path = os.path.join(sandbox, self.WAVE_VCD_FILE)
+            self._pending_dump = None
+        if previous:
+            shutil.rmtree(previous, ignore_errors=True)
+
+    def _use_cached_wave(self, wave_path: str) -> None:
+        """
+        Make a sandbox holding a cached waveform the latest simulation directory. The wave is
+        hard-linked (or copied) in, so evicting the cache entry doesn't take it away.
+        """
+        sandbox = self._make_sandbox("hit_")
+        target = os.path.join(sandbox, self.WAVE_VCD_FILE)
+        try:
+            try:
+                os.link(wave_path, target)
+            except OSError:
+                shutil.copyfile(wave_path, target)
+        except OSError:
+            # The entry was evicted in the meantime, so there is no waveform to trace
+            pass
+        self._keep_sim_sandbox(sandbox)
+
+    @staticmethod
+    def _read_source(path: str) -> str:
+        if not path or not os.path.exists(path):
+            return ""
+        with open(path, 'r') as f:
+            return f.read()
+
+    def _cached_call(self, tool: str, run, completed_verilog: str, *key_parts: str) -> tuple:
+        """
+        Run a compile/sim tool through the result cache.
+
+        Args:
+            tool: Name of the tool, part of the cache key
+            run: Function doing the real work for completed_verilog
+            completed_verilog: The Verilog code submitted to the tool
+            key_parts: Other inputs the result depends on (testbench, reference RTL, interface)
+        """
+        if self.cache is None:
+            return run(completed_verilog)
+
+        key = SimCache.make_key(tool, self.simulator.version(), self.simulator.cache_tag(),
+                                completed_verilog.strip(), *key_parts)
+        hit = self.cache.get(key)
+        if hit is not None:
+            print(f"{tool}: reusing cached result {key[:12]}")
+            self.completed_verilog = completed_verilog.strip()
+            if hit["wave"]:
+                self._use_cached_wave(hit["wave"])
+            return tuple(hit["result"])
+
+        sim_dir = self.sim_dir
+        result = run(completed_verilog)
+        # Runs killed by a limit depend on the machine's load, so they are not cached
+        if not any(isinstance(r, str) and r.startswith(LimitExceeded.HEADER) for r in result):
+            # Only a simulation that ran in this call leaves a new sandbox behind
+            wave_path = self.wave_vcd_file_path if self.sim_dir != sim_dir else None
+            self.cache.put(key, list(result), wave_path)
+        return result
+
     def reset(self) -> None:
         """Reset the toolkit state"""
         self.test_bench = ""
@@ -533,7 +565,7 @@ class VerilogToolKits:
 
     def load_ref_rtl_path(self, ref_rtl_path: str) -> None:
         """Set the reference RTL path"""
-        self.ref_rtl_path = ref_rtl_path
+        self.ref_rtl_path = os.path.abspath(ref_rtl_path) if ref_rtl_path else ref_rtl_path
 
     def load_interface(self, interface : str) -> None:
         with open(self.interface_file_path, 'w') as f:
@@ -555,8 +587,29 @@ class VerilogToolKits:
 
         return generated_module, generated_test_file
 
+    def fork(self) -> "VerilogToolKits":
+        """Toolkit with the same workdir, testbench, reference and cache, for simulations run in parallel"""
+        other = VerilogToolKits(self.workdir, self.cache, self.simulator)
+        other.dump_policy = self.dump_policy
+        other.test_bench = self.test_bench
+        other.ref_rtl_path = self.ref_rtl_path
+        other.spec = self.spec
+        return other
+
+    def discard(self) -> None:
+        """Remove the sandbox of the latest simulation"""
+        with self._sandbox_lock:
+            previous, self.sim_dir = self.sim_dir, None
+        if previous:
+            shutil.rmtree(previous, ignore_errors=True)
+
     def check_functionality(self, vvp_output: str) -> bool:
         """Check if simulation results indicate correct functionality"""
+        return self.count_mismatches(vvp_output) == 0
+
+    @staticmethod
+    def count_mismatches(vvp_output: str) -> int:
+        """Number of mismatches reported by a simulation (1 for a plain failure message)"""
         mismatches = 0
 
         for line in vvp_output.splitlines():
@@ -578,10 +631,13 @@ class VerilogToolKits:
         print('mismatches =', mismatches)
         #assert mismatches is not None, "Could not find mismatch information in output"
 
-        return mismatches == 0
+        return mismatches
 
     def verilog_syntax_check_tool(self, completed_verilog: str) -> Tuple[bool, str]:
         """Check the syntax of Verilog code"""
+        return self._cached_call("syntax", self._verilog_syntax_check, completed_verilog)
+
+    def _verilog_syntax_check(self, completed_verilog: str) -> Tuple[bool, str]:
         if "endmodule" not in completed_verilog:
             example_verilog_code = f"{completed_verilog} endmodule"
             return False, (f"[Error] the module is not completed! You need to write the Verilog module code with "
@@ -591,18 +647,16 @@ class VerilogToolKits:
         completed_verilog = completed_verilog.strip()
         self.completed_verilog = completed_verilog  # record the latest verilog result
 
-        with open(self.completed_verilog_file_path, 'w') as f:
-            f.write(completed_verilog)
-
-        cmd = f"iverilog -Wall -Winfloop -Wno-timescale -g2012 -s TopModule -o {self.test_vpp_file_path} {self.completed_verilog_file_path}"
-        cmds = cmd.split()
-
-        print(" ".join(cmds))
+        sandbox = self._make_sandbox("syntax_")
         try:
-            outputs = subprocess.check_output(cmds, stderr=subprocess.STDOUT)
-            outputs = outputs.decode("utf-8").splitlines()
-        except subprocess.CalledProcessError as e:
-            outputs = e.output.decode("utf-8").splitlines()
+            with open(os.path.join(sandbox, self.COMPLETED_VERILOG_FILE), 'w') as f:
+                f.write(completed_verilog)
+
+            outputs = self.simulator.check([self.COMPLETED_VERILOG_FILE], "TopModule", cwd=sandbox)
+        except LimitExceeded as e:
+            return False, e.report()
+        finally:
+            shutil.rmtree(sandbox, ignore_errors=True)
 
         # Compile failed if there's any output
         if outputs:
@@ -612,6 +666,11 @@ class VerilogToolKits:
         return True, f"[Compiled Success Verilog Module]:\n```verilog\n{self.completed_verilog}\n```"
 
     def tb_syntax_check_tool(self, completed_verilog) -> tuple[bool, str]:
+        """Check the syntax of a Verilog testbench against the loaded interface"""
+        return self._cached_call("tb_syntax", self._tb_syntax_check, completed_verilog,
+                                 self._read_source(self.interface_file_path))
+
+    def _tb_syntax_check(self, completed_verilog) -> tuple[bool, str]:
         #print('running syntax check ', self.workdir)
 
         if "endmodule" not in completed_verilog:
@@ -621,23 +680,16 @@ class VerilogToolKits:
         completed_verilog = completed_verilog.strip()
         self.completed_verilog = completed_verilog  # record the latest verilog result
 
-
-        with open(self.completed_verilog_file_path, 'w') as f:
-            f.write(completed_verilog)
-        f.close()
-
-        cmds = (
-                    "iverilog -Wall -Winfloop -Wno-timescale -g2012 -s tb -o " + self.test_vpp_file_path + " " + self.completed_verilog_file_path + " " + self.interface_file_path).split(
-            ' ')
-
-        print(" ".join(cmds))
+        sandbox = self._make_sandbox("tb_syntax_")
         try:
-            outputs = subprocess.check_output(cmds, stderr=subprocess.STDOUT)
-        except subprocess.CalledProcessError as e:
-            # print('Exception return with error (code {}): {})'.format(e.returncode, e.output))
-            outputs = e.output
-
-        outputs = outputs.decode("utf-8").splitlines()
+            with open(os.path.join(sandbox, self.COMPLETED_VERILOG_FILE), 'w') as f:
+                f.write(completed_verilog)
+
+            outputs = self.simulator.check([self.COMPLETED_VERILOG_FILE, self.interface_file_path], "tb", cwd=sandbox)
+        except LimitExceeded as e:
+            return False, e.report()
+        finally:
+            shutil.rmtree(sandbox, ignore_errors=True)
         #print(outputs)
         # Compile failed
         if len(outputs) != 0:
@@ -685,6 +737,50 @@ class VerilogToolKits:
 
     def verilog_simulation_tool(self, completed_verilog: str) -> Tuple[bool, bool, str]:
         """Compile and simulate Verilog code"""
+        result = self._cached_call("sim", self._verilog_simulation, completed_verilog,
+                                   self.test_bench, self._read_source(self.ref_rtl_path),
+                                   *([self.dump_policy.tag()] if self.dump_policy.two_phase else []))
+        compile_pass, sim_pass, log = result
+        stop_time = fail_fast_stop_time(log) if compile_pass and not sim_pass else None
+        if stop_time is not None and not self.simulator.flushes_on_stop and has_dumps(self.test_bench) \
+                and not self.dump_policy.two_phase:
+            # The stopped run was killed with its waveform unflushed; dump it again only if it's traced
+            with self._sandbox_lock:
+                self._pending_dump = (completed_verilog.strip(), 0, stop_time)
+        return result
+
+    def waveform_path(self) -> str:
+        """Path of the latest simulation's waveform, dumped again first if a fail-fast stop left it unflushed"""
+        with self._sandbox_lock:
+            pending, self._pending_dump = self._pending_dump, None
+        if pending is not None:
+            sandbox = self._dump_window(*pending)
+            if sandbox:
+                self._keep_sim_sandbox(sandbox)
+        return self.wave_vcd_file_path
+
+    def _dump_window(self, completed_verilog: str, start: int, end: Optional[int], scope: Optional[str] = None) -> Optional[str]:
+        """
+        Simulate again, dumping only from start to end (the second phase of a two-phase
+        simulation, see DumpPolicy, or the rerun of a run a fail-fast stop killed unflushed). The
+        run always goes to its end, so the dump is flushed. Returns the sandbox holding the dump,
+        None if this run failed.
+        """
+        test_bench = windowed_dumps(self.test_bench, start, end, scope)
+        sandbox = self._make_sandbox("dump_")
+        with open(os.path.join(sandbox, self.VERILOG_FILE), 'w') as f:
+            f.write(f"{test_bench}\n\n\n{completed_verilog}")
+        try:
+            if not self.simulator.build([self.VERILOG_FILE, self.ref_rtl_path], "tb", cwd=sandbox):
+                self.simulator.run(sandbox, fail_fast=False)
+                return sandbox
+        except LimitExceeded as e:
+            print(f"Waveform dump run stopped: {e}")
+            return sandbox
+        shutil.rmtree(sandbox, ignore_errors=True)
+        return None
+
+    def _verilog_simulation(self, completed_verilog: str) -> Tuple[bool, bool, str]:
         print(f'running simulation tool in {self.workdir}')
 
         # Validate input and state
@@ -700,42 +796,41 @@ class VerilogToolKits:
         # Prepare files
         num_tb_lines = len(self.test_bench.splitlines())
         completed_verilog = completed_verilog.strip()
-        verilog_file = f"{self.test_bench}\n\n\n{completed_verilog}"
+        two_phase = self.dump_policy.two_phase and has_dumps(self.test_bench)
+        test_bench = disable_dumps(self.test_bench) if two_phase else self.test_bench
+        verilog_file = f"{test_bench}\n\n\n{completed_verilog}"
         self.completed_verilog = completed_verilog  # record the latest verilog result
 
-        with open(self.verilog_file_path, 'w') as f:
+        sandbox = self._make_sandbox("sim_")
+        with open(os.path.join(sandbox, self.VERILOG_FILE), 'w') as f:
             f.write(verilog_file)
 
-        with open(self.completed_verilog_file_path, 'w') as f:
+        with open(os.path.join(sandbox, self.COMPLETED_VERILOG_FILE), 'w') as f:
             f.write(completed_verilog)
 
         # Compile the Verilog file
-        cmd = f"iverilog -Wall -Winfloop -Wno-timescale -g2012 -s tb -o {self.test_vpp_file_path} {self.verilog_file_path} {self.ref_rtl_path}"
-        cmds = cmd.split()
-
-        print(" ".join(cmds))
         try:
-            outputs = subprocess.check_output(cmds, stderr=subprocess.STDOUT)
-        except subprocess.CalledProcessError as e:
-            outputs = e.output
-
-        outputs = outputs.decode("utf-8").splitlines()
+            outputs = self.simulator.build([self.VERILOG_FILE, self.ref_rtl_path], "tb", cwd=sandbox)
+        except LimitExceeded as e:
+            shutil.rmtree(sandbox, ignore_errors=True)
+            return False, False, e.report()
 
         # Handle compilation errors
         if outputs:
+            shutil.rmtree(sandbox, ignore_errors=True)
             error_line_window = 5
             compiled_error = {}
             error_msg = ""
 
             for content in outputs:
-                if not re.search(r'sv\:[\d+]', content):
+                located = self.simulator.error_line(content, self.VERILOG_FILE)
+                if located is None:
                     error_msg += f"{content}\n"
                     continue
 
-                tmp = content.split(':')
-                m_error_line = int(tmp[1])
+                m_error_line, error_text = located
                 if m_error_line > num_tb_lines:
-                    compiled_error[m_error_line] = " ".join(tmp[2:])
+                    compiled_error[m_error_line] = error_text
                 else:
                     error_msg += f"{content}\n"
 
@@ -760,25 +855,38 @@ class VerilogToolKits:
             else:
                 return False, False, f"[Compiled Failed Report]\n{error_msg}"
 
-        # Run simulation
-        if os.path.exists(self.wave_vcd_file_path):
-            os.remove(self.wave_vcd_file_path)
-
-        cmds = ["vvp", self.test_vpp_file_path]
-        print(" ".join(cmds))
-        outputs = subprocess.check_output(cmds, stderr=subprocess.DEVNULL).decode("utf-8")
-
-        # Handle wave file
-        if os.path.exists(os.getcwd() + "/wave.vcd"):
-            shutil.move(os.getcwd() + "/wave.vcd", self.wave_vcd_file_path)
+        # Run simulation; the testbench dumps wave.vcd into the sandbox, which is its cwd
+        try:
+            outputs = self.simulator.run(sandbox)
+        except LimitExceeded as e:
+            # Keep the partial waveform for tracing up to the point the run was killed
+            self._keep_sim_sandbox(sandbox)
+            return True, False, e.report()
+        passed = self.check_functionality(outputs)
+        dump_note = ""
+        # A fail-fast stop ends the waveform at the stop time
+        stop_time = fail_fast_stop_time(outputs) if has_dumps(self.test_bench) else None
+        if two_phase and not passed:
+            start, end = self.dump_policy.window(first_mismatch_time(outputs))
+            if stop_time is not None:
+                end = stop_time if end is None else min(end, stop_time)
+            dump_sandbox = self._dump_window(completed_verilog, start, end, self.dump_policy.scope)
+            if dump_sandbox:
+                shutil.rmtree(sandbox, ignore_errors=True)
+                sandbox = dump_sandbox
+                if end is not None:
+                    dump_note = f"The waveform is recorded from time {start} to {end} only. "
+        elif stop_time is not None:
+            dump_note = f"The waveform is recorded up to time {stop_time} only. "
+        self._keep_sim_sandbox(sandbox)
 
         # Check functional correctness
-        if self.check_functionality(outputs):
+        if passed:
             log = f"[Compiled Success]\n[Function Check Success]\n{outputs}"
             return True, True, log
         else:
             log = (f"[Compiled Success]\n[Function Check Failed]\n==Tool Output==\n{outputs}"
-                   f"==Tool Output End==\n\n**Only focus on first point of failure in time. "
+                   f"==Tool Output End==\n\n**Only focus on first point of failure in time. {dump_note}"
                    f"Please use the `waveform_trace_tool` around that time with window "
                    f"width of atleast 100 to check the waveform. Don't fix the code without "
                    f"running `waveform_trace_tool`.**")
@@ -1,12 +1,22 @@
 
 # IMPORTS
+import asyncio
+import contextvars
+import json
 import os
-from typing import Annotated, Any, List, LiteralString
-from utils import VerilogToolKits, get_traces, ChainlitAssistantAgent, ChainlitUserProxyAgent
+from concurrent.futures import ThreadPoolExecutor
+from typing import Annotated, Any, List, LiteralString, Optional
+from simulators import LimitExceeded
+from utils import VerilogToolKits, get_traces, tool_message, as_async_tool
+from agents import ChainlitAssistantAgent, ChainlitUserProxyAgent
 from prompts import RTL_DEBUGGER_SYSTEM_MESSAGE, RTL_DEBUGGER_PROMPT
 from prompts import TB_DESIGNER_SYSTEM_MESSAGE, TB_REVIEWER_SYSTEM_MESSAGE, TB_DESIGNER_EXAMPLES, TB_DESIGNER_PROMPT
-from generate_tb import generate_tb
-import chainlit as cl
+from generate_tb import generate_tb, a_generate_tb
+from async_swarm import a_initiate_swarm_chat
+from llm_cache import apply_llm_cache
+from memory import apply_memory_policy
+from metrics import timed_stage, record_chat
+from events import ask_user, a_ask_user
 
 # AG2 imports
 from autogen import (
@@ -24,18 +34,82 @@ from autogen import (
     Agent
 )
 
-def verify_rtl(spec, code, interface, ref_rtl_path, testbench_code, use_dataset_tb, work_dir="./work", llm_config_path="LLM_CONFIG"):
+def repair_candidates(num_candidates: Optional[int] = None) -> int:
+    """Number of fixes sampled per rtl_designer turn (REPAIR_CANDIDATES, default 1)"""
+    if num_candidates is None:
+        num_candidates = int(os.environ.get('REPAIR_CANDIDATES', '1'))
+    return max(1, num_candidates)
+
+
+def simulation_candidate(reply) -> Optional[str]:
+    """The Verilog code a designer reply submits to verilog_simulation_tool, None if it doesn't"""
+    if not isinstance(reply, dict):
+        return None
+    for tool_call in reply.get("tool_calls") or []:
+        if tool_call["function"]["name"] == "verilog_simulation_tool":
+            try:
+                return json.loads(tool_call["function"]["arguments"])["completed_verilog"]
+            except (json.JSONDecodeError, KeyError, TypeError):
+                return None
+    return None
+
+
+def simulation_score(compile_pass: bool, sim_pass: bool, sim_log: str) -> tuple:
+    """Sort key of a simulated candidate: compiling first, then fewest mismatches"""
+    if not compile_pass or LimitExceeded.HEADER in sim_log:
+        return (1, 0)
+    if sim_pass:
+        return (0, 0)
+    output = sim_log.split("==Tool Output==", 1)[-1].split("==Tool Output End==", 1)[0]
+    return (0, max(1, VerilogToolKits.count_mismatches(output)))
+
+
+def select_candidate(vtk: VerilogToolKits, tb: str, replies: list, max_workers: int = 4):
     """
-    Debug and fix RTL code using an AI agent workflow.
-    
-    Args:
-        testbench_code (str): Testbench code for the RTL design
-        ref_rtl_path (str): Path to the reference RTL implementation
-        llm_config_path (str): Path to the LLM configuration file
-        work_dir (str): Working directory for the verification tools
-        
-    Returns:
-        str: The corrected RTL code if simulation passes, None otherwise
+    Pick one of several sampled designer replies.
+
+    The replies that call verilog_simulation_tool are simulated in parallel, each in its own
+    sandbox. A candidate that passes is taken right away. Otherwise, if the first sample is a
+    fix, the fix with the fewest mismatches replaces it; if the first sample is another step
+    (e.g. tracing the waveform), it is kept so the debugging flow stays the same.
+    """
+    candidates = [(i, simulation_candidate(reply)) for i, reply in enumerate(replies)]
+    candidates = [(i, code) for i, code in candidates if code is not None]
+    if not tb.strip() or len(replies) < 2 or not candidates:
+        return replies[0]
+
+    def simulate(code):
+        fork = vtk.fork()
+        fork.load_test_bench(tb)
+        try:
+            return simulation_score(*fork.verilog_simulation_tool(completed_verilog=code))
+        finally:
+            fork.discard()
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(candidates)))) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, simulate, code) for _, code in candidates]
+        scores = [future.result() for future in futures]
+
+    best = min(range(len(candidates)), key=lambda k: scores[k])
+    if scores[best] != (0, 0) and candidates[0][0] != 0:
+        return replies[0]
+
+    summary = ", ".join(
+        f"#{i}: " + ("compile failed" if score[0] else f"{score[1]} mismatches")
+        for (i, _), score in zip(candidates, scores)
+    )
+    tool_message(f"Simulated {len(candidates)} of {len(replies)} candidate fixes ({summary}), keeping #{candidates[best][0]}")
+    return replies[candidates[best][0]]
+
+
+def _build_verify_swarm(spec, code, interface, ref_rtl_path, testbench_code, use_dataset_tb, work_dir, llm_config_path, is_async=False, num_candidates=1):
+    """
+    Create the agents and hand-offs of the RTL debugging swarm.
+
+    With is_async the tools run their blocking work in a worker thread and the user turn
+    (human feedback and testbench regeneration) is awaited, for use with `a_initiate_swarm_chat`.
+    With num_candidates > 1 every rtl_designer turn samples that many replies and keeps the
+    best simulated fix (see select_candidate).
     """
     # Load configuration and files
     llm_config = LLMConfig.from_json(path=llm_config_path)
@@ -60,12 +134,7 @@ def verify_rtl(spec, code, interface, ref_rtl_path, testbench_code, use_dataset_
         vtk.load_test_bench(context_variables["tb"])
         compile_pass, sim_pass, sim_log = vtk.verilog_simulation_tool(completed_verilog=completed_verilog)
 
-        cl.run_sync(
-                cl.Message(
-                    content=f'***** Response from calling tool *****\n\nComplile_pass: {compile_pass}\nSim_pass: {sim_pass}\nSim_log: {sim_log}',
-                    author="tool call",
-                ).send()
-            )
+        tool_message(f'Complile_pass: {compile_pass}\nSim_pass: {sim_pass}\nSim_log: {sim_log}')
 
         context_variables["code"] = completed_verilog if compile_pass else None
         context_variables["compile_pass"] = compile_pass
@@ -93,7 +162,7 @@ def verify_rtl(spec, code, interface, ref_rtl_path, testbench_code, use_dataset_
         """
         Trace the functionally incorrect signal waveforms.
         """
-        return get_traces(f"{work_dir}/wave.vcd", signals, start_time, (end_time-start_time), "tb.clk") + \
+        return get_traces(vtk.waveform_path(), signals, start_time, (end_time-start_time), "tb.clk") + \
                "\n\n**Please use the `waveform_trace_tool` again with some more signals/time if you are not 100 % sure about the bug. " + \
                "Don't fix the code if you don't have enough information from the waveform.**\n" 
 
@@ -121,9 +190,50 @@ def verify_rtl(spec, code, interface, ref_rtl_path, testbench_code, use_dataset_
         name="rtl_designer",
         description="Assistant who writes RTL code in verilog.",
         system_message=RTL_DEBUGGER_SYSTEM_MESSAGE,
-        functions=[verilog_simulation_tool, waveform_trace_tool],
+        functions=[as_async_tool(f) if is_async else f for f in (verilog_simulation_tool, waveform_trace_tool)],
         llm_config=llm_config,
     )
+    apply_llm_cache(rtl_designer)
+    apply_memory_policy(rtl_designer)
+
+    def candidate_reply(recipient, messages, sender, config):
+        replies = recipient.generate_oai_replies(messages, num_candidates)
+        if not replies:
+            return False, None
+        return True, select_candidate(vtk, recipient.get_context("tb") or "", replies, max_workers=num_candidates)
+
+    async def a_candidate_reply(recipient, messages, sender, config):
+        return await asyncio.to_thread(candidate_reply, recipient, messages, sender, config)
+
+    if num_candidates > 1:
+        # Takes the place of the LLM reply, so termination and max auto reply checks still come first
+        if is_async:
+            rtl_designer.replace_reply_func(ConversableAgent.a_generate_oai_reply, a_candidate_reply)
+        else:
+            rtl_designer.replace_reply_func(ConversableAgent.generate_oai_reply, candidate_reply)
+
+    feedback_question = "Check the waveform/tb for bugs and give suggestions to fix the tb (type `exit` if tb is correct):\n"
+
+    def tb_verified_reply(recipient, answer):
+        """Reply for a user answer that accepts the tb, None if the user asked for changes"""
+        if not answer or answer.strip().lower() == "exit":
+            recipient.set_context("tb_verified", True)
+            return "Testbench is correct. Please proceed to fix the bug in RTL."
+        return None
+
+    def tb_updated_reply(recipient, sender, tb, tb_gen_history):
+        """Reply that hands a regenerated tb to the rtl designer"""
+        recipient.set_context("nested_chat_history", tb_gen_history)
+
+        if sender.get_context("first_time"):
+            recipient.set_context("first_time", False)
+            prompt = RTL_DEBUGGER_PROMPT.format(spec=spec, code=sender.get_context("code"), tb_code=tb)
+        else:
+            prompt = "Sorry, there was an issue with the testbench. I have fixed the tb. Please use the 'verilog_simulation_tool' again.\n\n" + tb
+
+        recipient.set_context("tb", tb)
+
+        return prompt
 
     def user_custom_reply(recipient, messages, sender, config):
         messages = sender.get_context("nested_chat_history")
@@ -138,29 +248,39 @@ def verify_rtl(spec, code, interface, ref_rtl_path, testbench_code, use_dataset_
             message = TB_DESIGNER_PROMPT.format(spec=spec, interface=interface)
         else:
             # message = input("Check the waveform/tb for bugs and give suggestions to fix the tb (or press ENTER if tb is correct):\n")
-            message = cl.run_sync(cl.AskUserMessage(content="Check the waveform/tb for bugs and give suggestions to fix the tb (type `exit` if tb is correct):\n", timeout=100).send())
-            # print(message)
-            # if not message.strip():
-            if not message or message.get("output").strip().lower() == "exit":
-                recipient.set_context("tb_verified", True)
-                return True, "Testbench is correct. Please proceed to fix the bug in RTL."
+            message = ask_user(feedback_question, timeout=100)
+            reply = tb_verified_reply(recipient, message)
+            if reply is not None:
+                return True, reply
                 
         messages.append({"content": message, "name": "user", "role": "user"})
-        tb, tb_gen_history = generate_tb(spec, interface, messages, work_dir)
+        tb, tb_gen_history = generate_tb(spec, interface, messages, work_dir, vcd_path=vtk.waveform_path())
 
-        recipient.set_context("nested_chat_history", tb_gen_history)
+        return True, tb_updated_reply(recipient, sender, tb, tb_gen_history)
 
-        if sender.get_context("first_time"):
-            recipient.set_context("first_time", False)
-            prompt = RTL_DEBUGGER_PROMPT.format(spec=spec, code=code, tb_code=tb)
+    async def a_user_custom_reply(recipient, messages, sender, config):
+        messages = sender.get_context("nested_chat_history")
+        tb = sender.get_context("tb")
+        code = sender.get_context("code")
+        work_dir = sender.get_context("work_dir")
+
+        if sender.get_context("use_dataset_tb"):
+            return True, RTL_DEBUGGER_PROMPT.format(spec=spec, code=code, tb_code=tb)
+
+        if not tb.strip():
+            message = TB_DESIGNER_PROMPT.format(spec=spec, interface=interface)
         else:
-            prompt = "Sorry, there was an issue with the testbench. I have fixed the tb. Please use the 'verilog_simulation_tool' again.\n\n" + tb
+            message = await a_ask_user(feedback_question, timeout=100)
+            reply = tb_verified_reply(recipient, message)
+            if reply is not None:
+                return True, reply
 
-        recipient.set_context("tb", tb)
+        messages.append({"content": message, "name": "user", "role": "user"})
+        tb, tb_gen_history = await a_generate_tb(spec, interface, messages, work_dir, vcd_path=vtk.waveform_path())
 
-        return True, prompt
+        return True, tb_updated_reply(recipient, sender, tb, tb_gen_history)
 
-    user.register_reply(trigger=[Agent, None], reply_func=user_custom_reply)
+    user.register_reply(trigger=[Agent, None], reply_func=a_user_custom_reply if is_async else user_custom_reply)
 
     def user_after_work_func(last_speaker: ConversableAgent, messages: list[dict[str, Any]], groupchat: GroupChat):
         return rtl_designer
@@ -170,7 +290,7 @@ def verify_rtl(spec, code, interface, ref_rtl_path, testbench_code, use_dataset_
         hand_to=AfterWork(user_after_work_func)
     )
 
-    chat_history = initiate_swarm_chat(
+    return dict(
         initial_agent=user,
         agents=[user, rtl_designer],
         context_variables=workflow_context,
@@ -180,5 +300,39 @@ def verify_rtl(spec, code, interface, ref_rtl_path, testbench_code, use_dataset_
         after_work=AfterWorkOption.TERMINATE
     )
 
+
+@timed_stage('verify_rtl')
+def verify_rtl(spec, code, interface, ref_rtl_path, testbench_code, use_dataset_tb, work_dir="./work", llm_config_path="LLM_CONFIG", num_candidates=None):
+    """
+    Debug and fix RTL code using an AI agent workflow.
+    
+    Args:
+        testbench_code (str): Testbench code for the RTL design
+        ref_rtl_path (str): Path to the reference RTL implementation
+        llm_config_path (str): Path to the LLM configuration file
+        work_dir (str): Working directory for the verification tools
+        num_candidates (int): Fixes sampled and simulated per designer turn (default: REPAIR_CANDIDATES or 1)
+        
+    Returns:
+        str: The corrected RTL code if simulation passes, None otherwise
+    """
+    swarm = _build_verify_swarm(spec, code, interface, ref_rtl_path, testbench_code, use_dataset_tb, work_dir, llm_config_path,
+                                num_candidates=repair_candidates(num_candidates))
+    chat_history = initiate_swarm_chat(**swarm)
+    record_chat(chat_history[0])
+
     # Return the fixed code if available
+    workflow_context = swarm["context_variables"]
+    return workflow_context['sim_pass'], workflow_context["code"], workflow_context["tb"]
+
+
+@timed_stage('verify_rtl')
+async def a_verify_rtl(spec, code, interface, ref_rtl_path, testbench_code, use_dataset_tb, work_dir="./work", llm_config_path="LLM_CONFIG", num_candidates=None):
+    """Async version of verify_rtl for the Chainlit app."""
+    swarm = _build_verify_swarm(spec, code, interface, ref_rtl_path, testbench_code, use_dataset_tb, work_dir, llm_config_path,
+                                is_async=True, num_candidates=repair_candidates(num_candidates))
+    chat_history = await a_initiate_swarm_chat(**swarm)
+    record_chat(chat_history[0])
+
+    workflow_context = swarm["context_variables"]
     return workflow_context['sim_pass'], workflow_context["code"], workflow_context["tb"]
@@ -1,29 +1,42 @@
 #!/usr/bin/env python3
 
-import os
-import sys
-import matplotlib.pyplot as plt
-from utils import VerilogKnowledgeGraph, ensure_checkpoint_dir
+import argparse
+import time
+from graph_render import GRAPH_LAYOUTS
+from utils import VerilogKnowledgeGraph
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Render a knowledge graph exported by plan2graph')
+    parser.add_argument('graph_path', help='Path of the graph JSON (e.g. checkpoints/<id>/graph.json)')
+    parser.add_argument('--output', default='verilog_knowledge_graph.png',
+                        help='Image to write, .svg for vector output (default: verilog_knowledge_graph.png)')
+    parser.add_argument('--layout', choices=GRAPH_LAYOUTS, default='auto',
+                        help='Node layout, auto picks hierarchical for large graphs')
+    parser.add_argument('--dpi', type=int, default=300, help='Resolution of raster images')
+    return parser.parse_args()
 
 
 def main():
     """Main function to load and visualize the graph"""
-    
-    graph_path = sys.argv[1]
+    args = parse_arguments()
 
     # Load the graph from the JSON file
-    graph = VerilogKnowledgeGraph.load_from_json(graph_path)
-    
+    graph = VerilogKnowledgeGraph.load_from_json(args.graph_path)
+
     if not graph or not hasattr(graph, 'G') or graph.G.number_of_nodes() == 0:
-        print(f"Error: Failed to load a valid graph from {graph_path}")
+        print(f"Error: Failed to load a valid graph from {args.graph_path}")
         return 1
-    
+
     print(f"Graph loaded successfully. Contains {graph.G.number_of_nodes()} nodes and {graph.G.number_of_edges()} edges.")
-    
-    graph.visualize_graph()
-    
+
+    start = time.perf_counter()
+    graph.visualize_graph(args.output, layout=args.layout, dpi=args.dpi)
+    print(f"Graph written to {args.output} in {time.perf_counter() - start:.2f} s")
+
     return 0
 
 
 if __name__ == '__main__':
-    exit(main())
\ No newline at end of file
+    exit(main())
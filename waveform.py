@@ -0,0 +1,338 @@
+import json
+import mmap
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from vcdvcd import VCDVCD, binary_string_to_hex
+
+
+def format_trace_table(signal_data: Dict[str, List[str]], time_values: List[str], errors: List[str]) -> str:
+    """Format signal data in a tabular representation (one row per signal, one column per time)"""
+    output = []
+    for error in errors:
+        output.append(error)
+    output.append('')
+
+    if not signal_data:
+        return "\n".join(output)
+
+    # Define column width for better alignment
+    first_col_width = max(len(key) for key in signal_data.keys()) # Width for the first column (signal names)
+    max_signal_width = max((len(item) for sublist in signal_data.values() for item in sublist), default=0)
+    max_time_width = max((len(str(time)) for time in time_values), default=0)
+    time_col_width = max(max_signal_width, max_time_width) + 2   # Width for each time value column
+
+    # Create header row with time values
+    header = f"{'time':<{first_col_width}}"
+
+    # Add time values with proper spacing
+    for time_val in time_values:
+        header += f"{time_val:>{time_col_width}}"
+    output.append(header)
+
+    # Create a row for each signal
+    for signal_name, values in signal_data.items():
+        row = f"{signal_name:<{first_col_width}}"
+
+        # Add each value with proper spacing
+        for value in values:
+            row += f"{value:>{time_col_width}}"
+        output.append(row)
+
+    return "\n".join(output)
+
+
+class WaveformIndex:
+    """
+    Columnar index of a VCD dump for fast windowed trace queries.
+
+    Every signal is stored as a pair of NumPy arrays: the sorted times at which it changed and
+    its (hex formatted) value after each change. `change_times` holds every time at which any
+    signal changed. A window query is a couple of binary searches per signal instead of a
+    re-parse of the whole dump.
+    """
+
+    INDEX_SUFFIX = ".idx.npz"
+    _cache = OrderedDict()
+    _cache_size = 8
+    _cache_lock = threading.Lock()
+
+    def __init__(self, names: Dict[str, int], references: Dict[str, int], times: List[np.ndarray],
+                 values: List[np.ndarray], change_times: np.ndarray):
+        self.names = names                # signal name without bit range -> column
+        self.references = references      # full VCD reference (e.g. "tb.q[7:0]") -> column
+        self.times = times
+        self.values = values
+        self.change_times = change_times
+
+    @classmethod
+    def from_vcd(cls, vcd_path: str) -> "WaveformIndex":
+        """Parse a VCD file once and build the per-signal arrays"""
+        vcd = VCDVCD(vcd_path, store_tvs=True, only_sigs=False)
+
+        columns = {}
+        times, values = [], []
+        for identifier, signal in vcd.data.items():
+            columns[identifier] = len(times)
+            times.append(np.fromiter((t for t, _ in signal.tv), dtype=np.int64, count=len(signal.tv)))
+            values.append(np.array([binary_string_to_hex(v) for _, v in signal.tv], dtype=np.str_))
+
+        references = {ref: columns[identifier] for ref, identifier in strip_top_scope(vcd.references_to_ids).items()}
+        names = {ref.split('[')[0]: col for ref, col in references.items()}
+        change_times = np.unique(np.concatenate(times)) if times else np.zeros(0, dtype=np.int64)
+        return cls(names, references, times, values, change_times)
+
+    @classmethod
+    def peek(cls, vcd_path: str) -> Optional["WaveformIndex"]:
+        """Return an up-to-date index of the dump if one is already built, without parsing the VCD"""
+        path = os.path.abspath(vcd_path)
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with cls._cache_lock:
+            cached = cls._cache.get(path)
+            if cached is not None and cached[0] == stamp:
+                return cached[1]
+        index = cls._load_persisted(path, stamp)
+        if index is not None:
+            with cls._cache_lock:
+                cls._cache[path] = (stamp, index)
+        return index
+
+    @classmethod
+    def load(cls, vcd_path: str) -> "WaveformIndex":
+        """
+        Get the index of a VCD file, parsing it only if no up-to-date index exists.
+
+        Indexes are kept in a small in-process LRU and persisted next to the dump as
+        <vcd>.idx.npz, so every later query on the same simulation skips the VCD parse.
+        """
+        path = os.path.abspath(vcd_path)
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+
+        with cls._cache_lock:
+            cached = cls._cache.get(path)
+            if cached is not None and cached[0] == stamp:
+                cls._cache.move_to_end(path)
+                return cached[1]
+
+        index = cls._load_persisted(path, stamp)
+        if index is None:
+            index = cls.from_vcd(path)
+            index._persist(path, stamp)
+
+        with cls._cache_lock:
+            cls._cache[path] = (stamp, index)
+            cls._cache.move_to_end(path)
+            while len(cls._cache) > cls._cache_size:
+                cls._cache.popitem(last=False)
+        return index
+
+    def _persist(self, vcd_path: str, stamp: Tuple[int, int]) -> None:
+        meta = {"stamp": list(stamp), "columns": len(self.times), "names": self.names, "references": self.references}
+        arrays = {"meta": np.array(json.dumps(meta)), "change_times": self.change_times}
+        for col, (t, v) in enumerate(zip(self.times, self.values)):
+            arrays[f"t{col}"] = t
+            arrays[f"v{col}"] = v
+        tmp_path = f"{vcd_path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+        try:
+            np.savez(tmp_path, **arrays)
+            os.replace(tmp_path, vcd_path + self.INDEX_SUFFIX)
+        except OSError:
+            # Read-only or vanished sandbox: the in-memory index is still usable
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @classmethod
+    def _load_persisted(cls, vcd_path: str, stamp: Tuple[int, int]) -> Optional["WaveformIndex"]:
+        index_path = vcd_path + cls.INDEX_SUFFIX
+        if not os.path.exists(index_path):
+            return None
+        try:
+            with np.load(index_path, allow_pickle=False) as data:
+                meta = json.loads(str(data["meta"]))
+                if tuple(meta["stamp"]) != stamp:
+                    return None
+                times = [data[f"t{col}"] for col in range(meta["columns"])]
+                values = [data[f"v{col}"] for col in range(meta["columns"])]
+                change_times = data["change_times"]
+        except (OSError, ValueError, KeyError):
+            return None
+        return cls(meta["names"], meta["references"], times, values, change_times)
+
+    def values_at(self, column: int, times: np.ndarray) -> np.ndarray:
+        """Value of a signal at each of the given times ('x' before its first change)"""
+        pos = np.searchsorted(self.times[column], times, side="right") - 1
+        if len(self.values[column]) == 0:
+            return np.full(len(times), "x")
+        return np.where(pos >= 0, self.values[column][np.clip(pos, 0, None)], "x")
+
+    def window(self, signals: List[str], offset: int = 0, window: int = 100,
+               clock: Optional[str] = None) -> Tuple[List[str], Dict[str, List[str]], List[str]]:
+        """
+        Sample signals at every change time in [offset, offset + window].
+
+        When clock is given, only the change times at which the clock is low are kept.
+
+        Returns:
+            (time values, signal name -> values, error messages)
+        """
+        errors = []
+        columns = {}
+        for sig in signals:
+            if sig in self.names:
+                columns[sig] = self.names[sig]
+            else:
+                errors.append(f"Error: Signal '{sig}' not found in waveform.")
+
+        lo = np.searchsorted(self.change_times, offset, side="left")
+        hi = np.searchsorted(self.change_times, offset + window, side="right")
+        times = self.change_times[lo:hi]
+
+        if clock and clock in self.references:
+            times = times[self.values_at(self.references[clock], times) == "0"]
+
+        signal_data = {sig: self.values_at(col, times).tolist() for sig, col in columns.items()}
+        return [str(t) for t in times.tolist()], signal_data, errors
+
+    def trace_table(self, signals: List[str], offset: int = 0, window: int = 100, clock: Optional[str] = None) -> str:
+        """Window query formatted as the waveform_trace_tool table"""
+        time_values, signal_data, errors = self.window(signals, offset, window, clock)
+        return format_trace_table(signal_data, time_values, errors)
+
+
+_VAR_RE = re.compile(rb"\$var\s+\S+\s+\d+\s+(\S+)\s+(\S+)(?:\s+(\[[^\]]*\]))?\s+\$end")
+_SCOPE_RE = re.compile(rb"\$(scope)\s+\S+\s+(\S+)\s+\$end|\$(upscope)\s+\$end|" + _VAR_RE.pattern)
+
+
+def strip_top_scope(references: Dict[str, str]) -> Dict[str, str]:
+    """
+    Drop the TOP scope Verilator wraps around the design, so signals are named like in
+    Icarus dumps (tb.clk rather than TOP.tb.clk)
+    """
+    if references and all(ref.startswith("TOP.") for ref in references):
+        return {ref[len("TOP."):]: identifier for ref, identifier in references.items()}
+    return references
+
+
+def _parse_vcd_header(header: bytes) -> Dict[str, str]:
+    """Map full VCD references (scope.name[range]) to identifier codes"""
+    references = {}
+    scopes = []
+    for m in _SCOPE_RE.finditer(header):
+        if m.group(1):
+            scopes.append(m.group(2).decode())
+        elif m.group(3):
+            if scopes:
+                scopes.pop()
+        else:
+            identifier, name, bit_range = m.group(4).decode(), m.group(5).decode(), m.group(6)
+            reference = ".".join(scopes + [name]) + (bit_range.decode() if bit_range else "")
+            references[reference] = identifier
+    return strip_top_scope(references)
+
+
+class StreamWindowReader:
+    """
+    Streaming VCD reader that only reads as far as a query window needs.
+
+    The header is located with a single search for $enddefinitions and only the $var/$scope
+    declarations are parsed. Value changes are then read line by line, tracking just the
+    requested signals and the clock, and reading stops as soon as the time passes the end of
+    the window. The file is memory-mapped, so the untouched tail is never paged in.
+
+    `bytes_read` reports how far into the file the last query went.
+    """
+
+    def __init__(self, vcd_path: str, use_mmap: bool = True):
+        self.vcd_path = vcd_path
+        self.use_mmap = use_mmap
+        self.bytes_read = 0
+        self.file_size = os.path.getsize(vcd_path)
+
+    def window(self, signals: List[str], offset: int = 0, window: int = 100,
+               clock: Optional[str] = None) -> Tuple[List[str], Dict[str, List[str]], List[str]]:
+        """Same result as WaveformIndex.window, read directly from the dump"""
+        with open(self.vcd_path, "rb") as f:
+            if self.use_mmap and self.file_size > 0:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    return self._read(mm, signals, offset, window, clock)
+            return self._read(f, signals, offset, window, clock)
+
+    def _read(self, stream, signals, offset, window, clock):
+        # Header: everything up to the end of $enddefinitions ... $end
+        head = b""
+        while b"$enddefinitions" not in head:
+            chunk = stream.read(1 << 16)
+            if not chunk:
+                break
+            head += chunk
+        start = head.find(b"$enddefinitions")
+        body_start = head.find(b"$end", start + len(b"$enddefinitions")) + len(b"$end") if start >= 0 else len(head)
+        references = _parse_vcd_header(head[:body_start])
+        names = {ref.split('[')[0]: identifier for ref, identifier in references.items()}
+
+        errors = []
+        wanted = {}
+        for sig in signals:
+            if sig in names:
+                wanted[sig] = names[sig].encode()
+            else:
+                errors.append(f"Error: Signal '{sig}' not found in waveform.")
+        clock_id = references[clock].encode() if clock and clock in references else None
+
+        tracked = set(wanted.values())
+        if clock_id:
+            tracked.add(clock_id)
+        current = {identifier: "x" for identifier in tracked}
+
+        end = offset + window
+        time_values = []
+        signal_data = {sig: [] for sig in wanted}
+
+        def emit(t):
+            if offset <= t <= end and (not clock_id or current[clock_id] == "0"):
+                time_values.append(str(t))
+                for sig, identifier in wanted.items():
+                    signal_data[sig].append(binary_string_to_hex(current[identifier]))
+
+        stream.seek(body_start)
+        time = 0
+        changed = False
+        for line in iter(stream.readline, b""):
+            line = line.strip()
+            if not line:
+                continue
+            c = line[:1]
+            if c == b"#":
+                if changed:
+                    emit(time)
+                time = int(line[1:])
+                changed = False
+                if time > end:
+                    break
+            elif c in b"01xzXZ":
+                changed = True
+                identifier = line[1:]
+                if identifier in current:
+                    current[identifier] = c.decode()
+            elif c in b"bBrR":
+                changed = True
+                value, _, identifier = line[1:].partition(b" ")
+                identifier = identifier.strip()
+                if identifier in current:
+                    current[identifier] = value.decode()
+        else:
+            if changed:
+                emit(time)
+
+        self.bytes_read = stream.tell()
+        return time_values, signal_data, errors
+
+    def trace_table(self, signals: List[str], offset: int = 0, window: int = 100, clock: Optional[str] = None) -> str:
+        time_values, signal_data, errors = self.window(signals, offset, window, clock)
+        return format_trace_table(signal_data, time_values, errors)